@@ -1,7 +1,8 @@
 import argparse
 from pathlib import Path
-from somedaex.http import Server
-from somedaex.pipeline import Pipeline
+from somedaex.http import Front, Server
+from somedaex.pipeline import PipelineRegistry
+from somedaex.pipeline.task import table_cache
 from somedaex.task_types import task_types
 
 parser = argparse.ArgumentParser()
@@ -9,13 +10,75 @@ parser.add_argument("-p", "--port", help="Port number to listen on")
 parser.add_argument(
     "-d",
     "--workdir",
-    help="Path to the working directory for the pipeline",
+    help="Path to the working directory for the pipelines",
     type=Path,
     default=Path.cwd() / ".somedaex_workdir",
 )
+parser.add_argument(
+    "-w",
+    "--workers",
+    help="Number of worker processes to spread pipelines across (0 to serve "
+    "everything from this process)",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "--cache-mb",
+    help="Total size in megabytes of the result tables to keep open per process",
+    type=int,
+    default=table_cache.max_bytes // 1024 ** 2,
+)
+parser.add_argument(
+    "--cache-handles",
+    help="Number of result files to keep open per process",
+    type=int,
+    default=table_cache.max_handles,
+)
+parser.add_argument(
+    "--preview-rows",
+    help="Preview every task on a random sample of this many input rows before "
+    "its full run (0 to disable previews)",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "--compression",
+    help="Codec used to compress the result files of every task",
+    choices=("lz4", "zstd"),
+)
+parser.add_argument(
+    "--dictionary-encode",
+    help="Dictionary encode low-cardinality string columns in result files",
+    action="store_true",
+)
+parser.add_argument(
+    "--disk-quota-mb",
+    help="Total size in megabytes of the result files to keep per pipeline before "
+    "the least valuable results are evicted",
+    type=int,
+)
 args = parser.parse_args()
 
-pipeline = Pipeline(task_types, args.workdir)
+table_cache.configure(
+    max_bytes=args.cache_mb * 1024 ** 2,
+    max_handles=args.cache_handles,
+)
+
+pipeline_options = {
+    "preview_rows": args.preview_rows or None,
+    "output_options": {
+        "compression": args.compression,
+        "dictionary_encode": args.dictionary_encode,
+    },
+    "disk_quota_mb": args.disk_quota_mb,
+}
+
+if args.workers > 0:
+    front = Front(task_types, args.workdir, args.workers, pipeline_options)
+    front.listen(args.port)
+
+else:
+    pipelines = PipelineRegistry(task_types, args.workdir, **pipeline_options)
 
-server = Server(pipeline)
-server.listen(args.port)
+    server = Server(pipelines)
+    server.listen(args.port)
@@ -1,10 +1,13 @@
 """The arrow_util module provides convenience wrappers and utility functions
 for working with PyArrow tables."""
 
+from bisect import bisect_right
 from pathlib import Path
-from typing import Iterable, Iterator, List, Tuple, Union
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
+import numpy
 import pyarrow
+import pyarrow.compute
 
 
 # Type aliases
@@ -14,6 +17,95 @@ OptionalStrings = Union[Iterable[str], None]
 Column = Union[pyarrow.Array, pyarrow.ChunkedArray]
 
 
+COMPRESSION_CODECS = ("lz4", "zstd")
+
+ENCODING_KEY = b"somedaex.encoding"
+"""The key of the field metadata that marks a column as dictionary encoded on disk
+only, so that it is decoded when it is read."""
+
+MAX_DICTIONARY_VALUES = 1 << 16
+"""The maximum number of distinct values in a dictionary encoded column."""
+
+MAX_DICTIONARY_RATIO = 0.5
+"""The maximum ratio of distinct values to rows in a dictionary encoded column."""
+
+
+class OutputOptions(NamedTuple):
+    """OutputOptions control how result files are written.
+
+    The compression codec, if any, is applied to the buffers of every record
+    batch. Compressed files and dictionary encoded columns take less space on
+    disk, but must be decoded into memory instead of being memory-mapped.
+    """
+
+    compression: Optional[str] = None
+    dictionary_encode: bool = False
+
+    @property
+    def decoded(self) -> bool:
+        """Whether files written with the options are decoded into memory when
+        they are read, instead of being memory-mapped."""
+        return self.compression is not None or self.dictionary_encode
+
+    def is_valid(self) -> bool:
+        """Check whether the compression codec, if any, is a known one."""
+        return self.compression is None or self.compression in COMPRESSION_CODECS
+
+    def ipc_options(self) -> pyarrow.ipc.IpcWriteOptions:
+        """Get the options for PyArrow's IPC writers."""
+        if not self.is_valid():
+            raise ValueError(f"Unknown compression codec {self.compression!r}")
+        return pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+
+
+class BatchIndex:
+    """A BatchIndex maps row indices to the record batches that contain them, so
+    that any row can be found with a binary search instead of a walk across the
+    batches that precede it.
+
+    Indexes of batches that were written to an Arrow stream file can also record
+    the byte position of each batch in the file.
+    """
+
+    def __init__(self):
+        self._starts: List[int] = []
+        self._positions: List[Optional[int]] = []
+        self.num_rows = 0
+
+    def __len__(self):
+        return len(self._starts)
+
+    @classmethod
+    def from_batches(cls, batches: Iterable[pyarrow.RecordBatch]) -> "BatchIndex":
+        """Create an index of the given batches."""
+        index = cls()
+        for batch in batches:
+            index.append(batch.num_rows)
+        return index
+
+    def append(self, num_rows: int, position: Optional[int] = None):
+        """Add a batch with the given number of rows to the end of the index."""
+        self._starts.append(self.num_rows)
+        self._positions.append(position)
+        self.num_rows += num_rows
+
+    def locate(self, row: int) -> Tuple[int, int]:
+        """Find the number of the batch that contains a row and the index of that
+        batch's first row."""
+        if row < 0 or row >= self.num_rows:
+            raise IndexError(f"Row {row} is out of range")
+        number = bisect_right(self._starts, row) - 1
+        return number, self._starts[number]
+
+    def start(self, number: int) -> int:
+        """Get the index of the first row of a batch."""
+        return self._starts[number]
+
+    def position(self, number: int) -> Optional[int]:
+        """Get the byte position of a batch in its stream file, if known."""
+        return self._positions[number]
+
+
 class ArrowStreamReader:
     """An ArrowStreamReader enables simple iteration over the batches in an
     Arrow stream format file."""
@@ -31,11 +123,36 @@ class ArrowStreamReader:
     def __next__(self) -> pyarrow.RecordBatch:
         return self._reader.read_next_batch()
 
+    @property
+    def schema(self) -> pyarrow.Schema:
+        """The schema of the batches in the file."""
+        return self._reader.schema
+
     def reset(self):
         """Reset the reader to the beginning of the file."""
         self._file.seek(0)
         self._reader = pyarrow.ipc.open_stream(self._file)
 
+    def can_read_at(self) -> bool:
+        """Check whether batches can be read directly from a byte position, which
+        is not possible if they depend on dictionaries sent earlier in the stream."""
+        return not any(
+            pyarrow.types.is_dictionary(field.type) for field in self.schema
+        )
+
+    def read_batch_at(self, position: int) -> pyarrow.RecordBatch:
+        """Read the first record batch that starts at or after the given byte
+        position, as returned by ArrowStreamWriter.write().
+
+        Sequential reading must be restarted with reset() after calling this
+        method.
+        """
+        self._file.seek(position)
+        while True:
+            message = pyarrow.ipc.read_message(self._file)
+            if message.type == "record batch":
+                return pyarrow.ipc.read_record_batch(message, self.schema)
+
     def close(self):
         """Close the underlying file handle."""
         self._file.close()
@@ -44,29 +161,45 @@ class ArrowStreamReader:
 class ArrowStreamWriter:
     """An ArrowStreamWriter writes data to a file in the Arrow stream format."""
 
-    def __init__(self, path: Pathlike, schema: pyarrow.Schema):
+    def __init__(
+        self,
+        path: Pathlike,
+        schema: pyarrow.Schema,
+        options: pyarrow.ipc.IpcWriteOptions = None,
+    ):
         self._stream = pyarrow.output_stream(str(path))
-        self._writer = pyarrow.ipc.new_stream(self._stream, schema)
+        self._writer = pyarrow.ipc.new_stream(self._stream, schema, options=options)
+        self._closed = False
 
     def __del__(self):
         self.close()
 
-    def write(self, table_or_batch: TableOrBatch):
-        """Write a PyArrow table or record batch to the file."""
+    def write(self, table_or_batch: TableOrBatch) -> int:
+        """Write a PyArrow table or record batch to the file, returning the byte
+        position at which the written data begins."""
+        position = self._stream.tell()
         self._writer.write(table_or_batch)
+        return position
 
     def close(self):
         """Finish writing the file and close the underlying file handle."""
-        self._writer.close()
-        self._stream.close()
+        if not self._closed:
+            self._closed = True
+            self._writer.close()
+            self._stream.close()
 
 
 class ArrowFileWriter:
     """An ArrowFileWriter writes data to a file in the Arrow IPC format."""
 
-    def __init__(self, path: Pathlike, schema: pyarrow.Schema):
+    def __init__(
+        self,
+        path: Pathlike,
+        schema: pyarrow.Schema,
+        options: pyarrow.ipc.IpcWriteOptions = None,
+    ):
         self._file = pyarrow.output_stream(str(path))
-        self._writer = pyarrow.ipc.new_file(self._file, schema)
+        self._writer = pyarrow.ipc.new_file(self._file, schema, options=options)
 
     def __del__(self):
         self._file.close()
@@ -81,16 +214,127 @@ class ArrowFileWriter:
         self._file.close()
 
     @classmethod
-    def write_table(cls, table: pyarrow.Table, path: Pathlike):
-        """Write a PyArrow table to a file at the given path."""
-        writer = cls(path, table.schema)
-        for batch in table.to_batches():
-            writer.write(batch)
+    def write_table(
+        cls, table: pyarrow.Table, path: Pathlike, options: OutputOptions = None
+    ) -> List[str]:
+        """Write a PyArrow table to a file at the given path. Returns the names of
+        the columns that were dictionary encoded."""
+        options = options or OutputOptions()
+        batches = table.to_batches()
+        encoder = DictionaryEncoder.scan(table.schema, batches, options)
+
+        writer = cls(path, encoder.schema, options.ipc_options())
+        for batch in batches:
+            writer.write(encoder.encode(batch))
         writer.close()
+        return encoder.encoded_columns
+
+
+class DictionaryEncoder:
+    """A DictionaryEncoder encodes the low-cardinality string columns of a file's
+    record batches with dictionaries that are shared by every batch, as the
+    Arrow IPC file format can only hold one dictionary per column.
+
+    The encoded columns are marked in the file's schema, and are decoded again
+    by MemoryMappedTableReader.
+    """
+
+    def __init__(self, schema: pyarrow.Schema, dictionaries: Dict[str, pyarrow.Array]):
+        self._dictionaries = dictionaries
+        self.schema = pyarrow.schema(
+            [
+                field.with_type(pyarrow.dictionary(pyarrow.int32(), field.type))
+                .with_metadata({ENCODING_KEY: b"dictionary"})
+                if field.name in dictionaries
+                else field
+                for field in schema
+            ],
+            metadata=schema.metadata,
+        )
+
+    @property
+    def encoded_columns(self) -> List[str]:
+        """The names of the columns that are dictionary encoded."""
+        return list(self._dictionaries)
+
+    @classmethod
+    def scan(
+        cls,
+        schema: pyarrow.Schema,
+        batches: Iterable[pyarrow.RecordBatch],
+        options: OutputOptions,
+    ) -> "DictionaryEncoder":
+        """Find the distinct values of each string column in a sequence of record
+        batches, and create an encoder for the columns that have few enough of
+        them. No columns are encoded unless the options call for it."""
+        if not options.dictionary_encode:
+            return cls(schema, {})
+
+        values = {
+            field.name: None
+            for field in schema
+            if pyarrow.types.is_string(field.type)
+            or pyarrow.types.is_large_string(field.type)
+        }
+        num_rows = 0
+        for batch in batches:
+            num_rows += batch.num_rows
+            for name in list(values):
+                column = pyarrow.compute.unique(batch.column(name))
+                if values[name] is not None:
+                    column = pyarrow.compute.unique(
+                        pyarrow.concat_arrays([values[name], column])
+                    )
+                if len(column) > MAX_DICTIONARY_VALUES:
+                    del values[name]
+                else:
+                    values[name] = column
+
+        dictionaries = {
+            name: unique.filter(unique.is_valid())
+            for name, unique in values.items()
+            if unique is not None and len(unique) <= num_rows * MAX_DICTIONARY_RATIO
+        }
+        return cls(schema, dictionaries)
+
+    def encode(self, batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+        """Encode the columns of a record batch."""
+        if not self._dictionaries:
+            return batch
+
+        columns = []
+        for name, column in zip(batch.schema.names, batch.columns):
+            dictionary = self._dictionaries.get(name)
+            if dictionary is not None:
+                indices = pyarrow.compute.index_in(column, value_set=dictionary)
+                column = pyarrow.DictionaryArray.from_arrays(
+                    pyarrow.compute.cast(indices, pyarrow.int32()), dictionary
+                )
+            columns.append(column)
+        return pyarrow.RecordBatch.from_arrays(columns, schema=self.schema)
+
+
+def decode_dictionaries(table: pyarrow.Table) -> pyarrow.Table:
+    """Decode the columns of a table that were dictionary encoded on disk by a
+    DictionaryEncoder."""
+    for i, field in enumerate(table.schema):
+        if field.metadata and field.metadata.get(ENCODING_KEY) == b"dictionary":
+            value_type = field.type.value_type
+            table = table.set_column(
+                i,
+                field.with_type(value_type).remove_metadata(),
+                pyarrow.compute.cast(table.column(i), value_type),
+            )
+    return table
 
 
 class MemoryMappedTableReader:
-    """An MemoryMappedTableReader ."""
+    """A MemoryMappedTableReader reads a table from a memory-mapped Arrow IPC file.
+
+    The table's buffers are read from the file without copying, unless they are
+    compressed or dictionary encoded, in which case they are decoded into
+    memory.
+    """
 
     def __init__(self, path: Pathlike):
         self._file = pyarrow.memory_map(str(path))
@@ -101,22 +345,35 @@ class MemoryMappedTableReader:
     def read_table(self) -> pyarrow.Table:
         """Read the file"""
         reader = pyarrow.ipc.open_file(self._file)
-        return reader.read_all()
+        return decode_dictionaries(reader.read_all())
 
     def close(self):
         """Close the underlying file handle."""
         self._file.close()
 
 
-def copy_stream_to_file(stream_path: Path, file_path: Path, delete_original=False):
-    """Copy the contents of an Arrow stream format file to an IPC format file."""
+def copy_stream_to_file(
+    stream_path: Path,
+    file_path: Path,
+    delete_original=False,
+    options: OutputOptions = None,
+) -> List[str]:
+    """Copy the contents of an Arrow stream format file to an IPC format file.
+
+    If the options call for dictionary encoding, the stream is read twice: once
+    to find the distinct values of its string columns, and once to copy it.
+    Returns the names of the columns that were dictionary encoded.
+    """
+    options = options or OutputOptions()
     stream_reader = ArrowStreamReader(stream_path)
-    batch = next(stream_reader)
-    file_writer = ArrowFileWriter(file_path, batch.schema)
+    encoder = DictionaryEncoder.scan(stream_reader.schema, stream_reader, options)
+    if options.dictionary_encode:
+        stream_reader.reset()
 
-    while batch:
-        file_writer.write(batch)
-        batch = next(stream_reader, None)
+    file_writer = ArrowFileWriter(file_path, encoder.schema, options.ipc_options())
+
+    for batch in stream_reader:
+        file_writer.write(encoder.encode(batch))
 
     file_writer.close()
     stream_reader.close()
@@ -124,6 +381,8 @@ def copy_stream_to_file(stream_path: Path, file_path: Path, delete_original=Fals
     if delete_original:
         stream_path.unlink()
 
+    return encoder.encoded_columns
+
 
 def get_columns(
     table_or_batch: TableOrBatch,
@@ -148,17 +407,155 @@ def iter_rows(
     If a list of column names is provided, only values from those columns will
     be included in the output.
     """
-    return zip(get_columns(table_or_batch, column_names))
+    return zip(*get_columns(table_or_batch, column_names))
 
 
-def get_row(
-    table_or_batch: TableOrBatch,
-    index: int,
+def select_columns(
+    batch: pyarrow.RecordBatch,
     column_names: OptionalStrings = None,
-) -> Tuple:
-    """Retrieve a single row from a PyArrow table or record batch.
+) -> pyarrow.RecordBatch:
+    """Create a record batch that contains only the named columns, in the order
+    they are named. If no column names are provided, the batch is returned as is."""
+    if column_names is None:
+        return batch
+    column_names = list(column_names)
+    return pyarrow.RecordBatch.from_arrays(
+        get_columns(batch, column_names), names=column_names
+    )
 
-    If a list of column names is provided, only values from those columns will
-    be included in the output.
+
+def merge_batches(
+    left: pyarrow.RecordBatch,
+    right: pyarrow.RecordBatch,
+    column_names: OptionalStrings = None,
+) -> pyarrow.RecordBatch:
+    """Combine the columns of two record batches with the same number of rows.
+
+    If a list of column names is provided, the output contains only those
+    columns, in that order. Otherwise it contains every column of the left batch
+    followed by every column of the right batch.
+    """
+    names = left.schema.names + right.schema.names
+    columns = left.columns + right.columns
+    if column_names is not None:
+        by_name = dict(zip(names, columns))
+        names = list(column_names)
+        columns = [by_name[name] for name in names]
+    return pyarrow.RecordBatch.from_arrays(columns, names=names)
+
+
+def concat_batches(
+    batches: List[pyarrow.RecordBatch], schema: pyarrow.Schema = None
+) -> pyarrow.RecordBatch:
+    """Combine record batches with the same schema into a single batch. A single
+    batch is returned without copying. If a schema is provided, an empty list of
+    batches produces an empty batch with that schema."""
+    batches = [batch for batch in batches if batch.num_rows > 0] or batches[:1]
+    if len(batches) == 1:
+        return batches[0]
+    if not batches and schema is not None:
+        return pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array([], type=field.type) for field in schema], schema=schema
+        )
+    table = pyarrow.Table.from_batches(batches).combine_chunks()
+    return table.to_batches()[0]
+
+
+MARKERS = [chr(code) for code in range(1, 9)]
+"""Control characters that can be placed around regular expression matches to
+split them apart from the surrounding text."""
+
+
+def split_matches(
+    array: pyarrow.Array, pattern: str
+) -> Tuple[pyarrow.ListArray, numpy.ndarray]:
+    """Split each string of an array into the matches of a regular expression and
+    the text around them.
+
+    The pattern must contain two groups: the text that precedes a match, which
+    may be empty, and the match itself. Matches must not be empty. A string with
+    n matches is split into 2n + 1 pieces, of which the odd-numbered pieces are
+    the matches. Returns the lists of pieces, and whether each piece of the
+    flattened lists is a match.
+
+    Raises:
+        ValueError: If every marker that could be placed around the matches
+            already occurs in the text.
+    """
+    marker = next(
+        (
+            m
+            for m in MARKERS
+            if not pyarrow.compute.any(
+                pyarrow.compute.match_substring(array, m)
+            ).as_py()
+        ),
+        None,
+    )
+    if marker is None:
+        raise ValueError("Unable to find a marker that does not occur in the text")
+
+    # Surround each match with markers and split on them
+    marked = pyarrow.compute.replace_substring_regex(
+        array, pattern=pattern, replacement=f"\\1{marker}\\2{marker}"
+    )
+    pieces = pyarrow.compute.split_pattern(marked, pattern=marker)
+    offsets = pieces.offsets.to_numpy()
+    parents = pyarrow.compute.list_parent_indices(pieces).to_numpy()
+    positions = numpy.arange(len(parents)) + offsets[0] - offsets[parents]
+    return pieces, positions % 2 == 1
+
+
+def extract_all(array: pyarrow.Array, pattern: str) -> pyarrow.ListArray:
+    """Find every match of a regular expression in each string of an array,
+    producing a list of the matches for each string.
+
+    The pattern must contain two groups: the text that precedes a match, which
+    may be empty, and the match itself. Matches must not be empty.
+    """
+    pieces, is_match = split_matches(array, pattern)
+    matches = pyarrow.compute.list_flatten(pieces).filter(pyarrow.array(is_match))
+
+    # A string with n matches is split into 2n + 1 pieces
+    offsets = pieces.offsets.to_numpy()
+    counts = (offsets[1:] - offsets[:-1]) // 2
+    match_offsets = numpy.concatenate([[0], numpy.cumsum(counts)])
+    is_null = numpy.append(array.is_null().to_numpy(zero_copy_only=False), False)
+    return pyarrow.ListArray.from_arrays(
+        pyarrow.array(match_offsets, type=pyarrow.int32(), mask=is_null), matches
+    )
+
+
+def replace_list_values(lists: pyarrow.ListArray, values: pyarrow.Array):
+    """Create a list array with the same lengths and nulls as another, but with
+    different values. There must be one value for each value of the original
+    lists, as returned by their flatten() method."""
+    offsets = lists.offsets.to_numpy()
+    is_null = numpy.append(lists.is_null().to_numpy(zero_copy_only=False), False)
+    offsets = pyarrow.array(
+        offsets - offsets[0], type=lists.offsets.type, mask=is_null
+    )
+    return type(lists).from_arrays(offsets, values)
+
+
+def group_rows(
+    columns: List[pyarrow.Array], num_rows: int
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Assign each row to a group by the values in the given columns, treating
+    nulls as equal to each other.
+
+    Returns the index of the first row of each group, and the number of the group
+    that each row belongs to. Rows with no columns all belong to one group.
     """
-    return tuple(column[index] for column in get_columns(table_or_batch, column_names))
+    # Dictionary-encode each column and combine the per-column codes into a
+    # single code per row, reserving code 0 in each column for nulls. The row
+    # codes are renumbered after each column so that they can't overflow.
+    codes = numpy.zeros(num_rows, dtype=numpy.int64)
+    for column in columns:
+        encoded = pyarrow.compute.dictionary_encode(column)
+        column_codes = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+        codes = codes * (len(encoded.dictionary) + 1) + column_codes + 1
+        _, codes = numpy.unique(codes, return_inverse=True)
+
+    _, first_rows, groups = numpy.unique(codes, return_index=True, return_inverse=True)
+    return first_rows, groups
@@ -1,3 +1,4 @@
 """The http package provides an HTTP interface for working with pipelines."""
 
+from .front import Front
 from .server import Server
@@ -0,0 +1,156 @@
+"""The caching module lets the server answer repeated requests for the state of
+a pipeline's tasks without encoding the tasks again, or at all."""
+
+from collections import OrderedDict
+import gzip
+import hashlib
+import os
+from typing import Callable, Iterable, Optional, Tuple
+
+from aiohttp import web
+import pyarrow
+
+from ..pipeline.task import Task
+from .encoder import to_json
+
+
+MIN_COMPRESSED_BYTES = 1024
+"""The size below which response bodies are not worth compressing."""
+
+MAX_CACHED_TASKS = 4096
+"""The maximum number of encoded tasks kept by a ResponseCache."""
+
+MAX_CACHED_BODIES = 64
+"""The maximum number of response bodies kept by a ResponseCache."""
+
+
+def _accepted_encodings(request: web.Request) -> set:
+    encodings = set()
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = item.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def choose_encoding(request: web.Request) -> Optional[str]:
+    """Choose the best compression for a response that the client accepts."""
+    accepted = _accepted_encodings(request)
+    if "zstd" in accepted and pyarrow.Codec.is_available("zstd"):
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a response body with gzip or Zstandard."""
+    if encoding == "zstd":
+        return pyarrow.Codec("zstd").compress(data, asbytes=True)
+    return gzip.compress(data, compresslevel=6)
+
+
+class ResponseCache:
+    """A ResponseCache builds JSON responses describing tasks, with entity tags
+    derived from the tasks' versions.
+
+    Each compressed variant of a response has a tag of its own, suffixed with
+    its encoding. A request whose If-None-Match header lists the current tag of
+    the variant it would get has an empty "304 Not Modified" response.
+    Otherwise the body is assembled from the JSON encoding of each task, which
+    is kept until the task's version changes, and is compressed if the client
+    accepts it. The most recently sent bodies are
+    kept too, so a body requested by several clients is only compressed once.
+    """
+
+    def __init__(self):
+        # Tags include a token for the process, as versions start over in a new
+        # process
+        self._token = os.urandom(4).hex()
+        self._tasks: "OrderedDict[int, str]" = OrderedDict()
+        self._bodies: "OrderedDict[Tuple[str, str], Tuple[bytes, str]]" = (
+            OrderedDict()
+        )
+
+    def encode_task(self, task: Task) -> str:
+        """Get the JSON encoding of a task's args()."""
+        version = task.version
+        encoded = self._tasks.get(version)
+        if encoded is None:
+            encoded = to_json(task.args())
+            self._tasks[version] = encoded
+            while len(self._tasks) > MAX_CACHED_TASKS:
+                self._tasks.popitem(last=False)
+        else:
+            self._tasks.move_to_end(version)
+        return encoded
+
+    def task_etag(self, task: Task) -> str:
+        """Get the entity tag of a task's current state."""
+        return f"{self._token}-{task.version}"
+
+    def tasks_etag(self, tasks: Iterable[Task]) -> str:
+        """Get the entity tag of the state of a list of tasks, from a digest of
+        their versions."""
+        versions = ",".join(str(task.version) for task in tasks)
+        digest = hashlib.sha256(versions.encode("ascii")).hexdigest()
+        return f"{self._token}-{digest}"
+
+    def task_response(self, request: web.Request, task: Task) -> web.Response:
+        """Respond to a request for the state of a task."""
+        return self.respond(
+            request, self.task_etag(task), lambda: self.encode_task(task)
+        )
+
+    def tasks_response(self, request: web.Request, tasks: Iterable[Task]):
+        """Respond to a request for the state of every task in a list."""
+        tasks = list(tasks)
+        return self.respond(
+            request,
+            self.tasks_etag(tasks),
+            lambda: '{"tasks": [' + ", ".join(map(self.encode_task, tasks)) + "]}",
+        )
+
+    def respond(
+        self, request: web.Request, etag: str, encode: Callable[[], str]
+    ) -> web.Response:
+        """Build a JSON response whose entity tag is the given one, suffixed with
+        the encoding the client accepts, encoding its body only if it isn't
+        cached and the client doesn't have it already."""
+        encoding = choose_encoding(request)
+        if encoding is not None:
+            etag = f"{etag}-{encoding}"
+        etag = f'"{etag}"'
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if _matches(request.headers.get("If-None-Match"), etag):
+            return web.Response(status=304, headers=headers)
+
+        key = (etag, encoding)
+        cached = self._bodies.get(key)
+        if cached is None:
+            body = encode().encode("utf-8")
+            used = encoding if len(body) >= MIN_COMPRESSED_BYTES else None
+            cached = (compress(body, used) if used else body, used)
+            self._bodies[key] = cached
+            while len(self._bodies) > MAX_CACHED_BODIES:
+                self._bodies.popitem(last=False)
+        else:
+            self._bodies.move_to_end(key)
+
+        body, used = cached
+        if used is not None:
+            headers["Content-Encoding"] = used
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
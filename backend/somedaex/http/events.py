@@ -1,21 +1,22 @@
 import asyncio
+from collections import deque
+import itertools
+import os
+from typing import Deque, NamedTuple, Optional
 
 from aiohttp.web import Request
 from aiohttp_sse import sse_response
-from somedaex.pipeline.pipeline import Pipeline
 
 from ..pipeline import Pipeline
 from ..pipeline.events import Event
 from .encoder import to_json
 
 
-def async_on_next(coro):
-    """Wrap an async function so that it can be used to subscribe to an observable."""
+REPLAY_BUFFER_EVENTS = 1000
+"""The maximum number of recent events kept for clients that reconnect."""
 
-    def on_next(*args, **kwargs):
-        asyncio.create_task(coro(*args, **kwargs))
-
-    return on_next
+REPLAY_BUFFER_BYTES = 16 * 1024 ** 2
+"""The maximum total size of the recent events kept for clients that reconnect."""
 
 
 def _event_json(event: Event):
@@ -28,29 +29,106 @@ def _event_json(event: Event):
     )
 
 
+class Message(NamedTuple):
+    """A Message is an event that has been numbered and encoded for sending."""
+
+    id: str
+    number: int
+    payload: str
+
+
 class EventStream:
     """An EventStream listens for events from a pipeline and broadcasts them
-    as server-sent events."""
+    as server-sent events.
+
+    Every event is numbered, and the most recent events are kept in a replay
+    buffer. A client that reconnects with a Last-Event-ID header receives the
+    events it missed, in order, before any new ones. If the events it missed
+    are no longer in the buffer, or were numbered by an earlier server process,
+    it receives a "snapshot" event with the state of every task instead, which
+    replaces whatever state it had.
+    """
 
     def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
         self.subscribers = set()
-        pipeline.events.subscribe(async_on_next(self.broadcast))
+        self._subscription = pipeline.events.subscribe(self.broadcast)
+
+        # Event IDs are prefixed with a token for the stream, so that IDs from an
+        # earlier process are never mistaken for recent ones
+        self._stream_id = os.urandom(4).hex()
+        self._numbers = itertools.count(1)
+        self._last_number = 0
+        self._buffer: Deque[Message] = deque()
+        self._buffer_bytes = 0
+
+    def close(self):
+        """Stop listening for events from the pipeline."""
+        self._subscription.dispose()
 
     async def subscribe(self, request: Request):
         """Register an SSE request."""
         async with sse_response(request) as response:
             queue = asyncio.Queue()
+            # A browser sends the header when it reconnects by itself, and a client
+            # that opens a new connection can pass the ID in the query string
+            last_event_id = request.headers.get(
+                "Last-Event-ID", request.query.get("lastEventId")
+            )
+            for message in self.missed(last_event_id):
+                queue.put_nowait(message)
             self.subscribers.add(queue)
             try:
                 while not response.task.done():
-                    event = await queue.get()
-                    payload = _event_json(event)
-                    await response.send(payload)
+                    message = await queue.get()
+                    await response.send(message.payload, id=message.id)
                     queue.task_done()
             finally:
                 self.subscribers.remove(queue)
 
-    async def broadcast(self, event: Event):
-        """Enqueue a message for broadcast."""
+    def missed(self, last_event_id: Optional[str]):
+        """Get the messages that a client missed after the event with the given
+        ID, or a snapshot of the pipeline if they are no longer available."""
+        if last_event_id is None:
+            return []
+
+        stream_id, _, number = last_event_id.partition("-")
+        if stream_id == self._stream_id and number.isdigit():
+            number = int(number)
+            oldest = self._buffer[0].number if self._buffer else self._last_number + 1
+            if oldest - 1 <= number <= self._last_number:
+                return [message for message in self._buffer if message.number > number]
+
+        return [self.snapshot()]
+
+    def snapshot(self) -> Message:
+        """Create a message with the state of every task in the pipeline, which
+        brings a client up to date as of the latest event."""
+        payload = to_json(
+            {
+                "event": "snapshot",
+                "task": None,
+                "value": {"tasks": [task.args() for task in self.pipeline]},
+            }
+        )
+        return Message(self._message_id(self._last_number), self._last_number, payload)
+
+    def broadcast(self, event: Event):
+        """Number and encode an event, and enqueue it for broadcast."""
+        number = next(self._numbers)
+        message = Message(self._message_id(number), number, _event_json(event))
+        self._last_number = number
+
+        self._buffer.append(message)
+        self._buffer_bytes += len(message.payload)
+        while (
+            len(self._buffer) > REPLAY_BUFFER_EVENTS
+            or self._buffer_bytes > REPLAY_BUFFER_BYTES
+        ):
+            self._buffer_bytes -= len(self._buffer.popleft().payload)
+
         for queue in self.subscribers:
-            await queue.put(event)
+            queue.put_nowait(message)
+
+    def _message_id(self, number: int) -> str:
+        return f"{self._stream_id}-{number}"
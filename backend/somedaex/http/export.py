@@ -0,0 +1,107 @@
+"""The export module provides encoders that convert a task's results to common
+file formats a chunk at a time, so that they can be streamed to a client."""
+
+import io
+from typing import List, NamedTuple
+
+import pyarrow
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet
+
+
+PARQUET_ROW_GROUP_ROWS = 100_000
+"""The number of rows buffered for each row group of an exported Parquet file."""
+
+
+class ExportFormat(NamedTuple):
+    """An ExportFormat describes a file format that results can be exported to."""
+
+    content_type: str
+    extension: str
+
+
+EXPORT_FORMATS = {
+    "arrow": ExportFormat("application/vnd.apache.arrow.stream", "arrows"),
+    "csv": ExportFormat("text/csv", "csv"),
+    "parquet": ExportFormat("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """A _ChunkSink collects the bytes written to it until they are taken, so that
+    a writer can produce a file a chunk at a time without holding all of it."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        """Remove and return the bytes written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class BatchExporter:
+    """A BatchExporter encodes record batches in one of the export formats.
+
+    Each call to write() returns the bytes of the file that are ready to be sent,
+    and close() returns the rest. Only one batch, or one Parquet row group, is
+    held in memory at a time.
+    """
+
+    def __init__(self, export_format: str, schema: pyarrow.Schema):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {export_format!r}")
+
+        self.format = export_format
+        self.schema = schema
+        self._sink = _ChunkSink()
+        self._pending: List[pyarrow.RecordBatch] = []
+        self._num_pending_rows = 0
+
+        if export_format == "arrow":
+            self._writer = pyarrow.ipc.new_stream(self._sink, schema)
+        elif export_format == "csv":
+            self._writer = pyarrow.csv.CSVWriter(self._sink, schema)
+        else:
+            self._writer = pyarrow.parquet.ParquetWriter(self._sink, schema)
+
+    def write(self, batch: pyarrow.RecordBatch) -> bytes:
+        """Encode a record batch."""
+        if self.format != "parquet":
+            self._writer.write(batch)
+            return self._sink.take()
+
+        self._pending.append(batch)
+        self._num_pending_rows += batch.num_rows
+        if self._num_pending_rows >= PARQUET_ROW_GROUP_ROWS:
+            self._write_row_group()
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        """Finish encoding, returning the end of the file."""
+        if self._pending:
+            self._write_row_group()
+        self._writer.close()
+        return self._sink.take()
+
+    def _write_row_group(self):
+        table = pyarrow.Table.from_batches(self._pending, schema=self.schema)
+        self._writer.write_table(table, row_group_size=table.num_rows)
+        self._pending = []
+        self._num_pending_rows = 0
@@ -0,0 +1,240 @@
+"""The front module provides a thin HTTP front end that spreads pipelines across
+several worker processes."""
+
+import asyncio
+import multiprocessing
+import os
+from pathlib import Path
+import tempfile
+import zlib
+
+import aiohttp
+from aiohttp import WSMsgType, web
+
+from ..pipeline import PipelineRegistry, TypeIndex
+from ..pipeline.task import table_cache
+from .server import DEFAULT_PIPELINE, Server
+
+
+WORKER_STARTUP_TIMEOUT = 30
+
+# Headers that describe a single connection rather than the message being
+# forwarded, so they must not be copied from one hop to the next.
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "content-length",
+    "host",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+def _run_worker(
+    index: TypeIndex, workdir: Path, socket_path: Path, cache_limits, pipeline_options
+):
+    table_cache.configure(**cache_limits)
+    server = Server(PipelineRegistry(index, workdir, **pipeline_options))
+    server.listen(path=str(socket_path))
+
+
+def _forwarded_headers(headers) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+class Worker:
+    """A Worker manages a single backend process that serves pipelines over a
+    Unix domain socket."""
+
+    def __init__(
+        self,
+        number: int,
+        index: TypeIndex,
+        workdir: Path,
+        cache_limits,
+        pipeline_options: dict = None,
+    ):
+        self.number = number
+        self.workdir = workdir
+        self.socket_path = (
+            Path(tempfile.gettempdir()) / f"somedaex-{os.getpid()}-{number}.sock"
+        )
+        self._process = multiprocessing.Process(
+            target=_run_worker,
+            args=(
+                index,
+                self.workdir,
+                self.socket_path,
+                cache_limits,
+                pipeline_options or {},
+            ),
+            daemon=True,
+        )
+        self.session: aiohttp.ClientSession = None
+
+    async def start(self):
+        """Start the worker process and wait until it accepts connections."""
+        self.socket_path.unlink(missing_ok=True)
+        self._process.start()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WORKER_STARTUP_TIMEOUT
+        while not self.socket_path.exists():
+            if not self._process.is_alive():
+                raise Exception(f"Worker {self.number} exited during startup")
+            if loop.time() > deadline:
+                raise Exception(f"Worker {self.number} did not start in time")
+            await asyncio.sleep(0.05)
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.UnixConnector(path=str(self.socket_path)),
+            timeout=aiohttp.ClientTimeout(total=None),
+            auto_decompress=False,
+        )
+
+    async def stop(self):
+        """Close the connection to the worker and terminate its process."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+        if self._process.is_alive():
+            self._process.terminate()
+            await asyncio.get_running_loop().run_in_executor(None, self._process.join)
+
+        self.socket_path.unlink(missing_ok=True)
+
+    def url(self, path: str, query_string: str = "") -> str:
+        """Build the URL of a resource on the worker."""
+        url = f"http://worker-{self.number}{path}"
+        if query_string:
+            url += "?" + query_string
+        return url
+
+
+class Front:
+    """A front accepts HTTP requests on behalf of a set of worker processes and
+    forwards each request, including server-sent event streams, to the worker
+    that owns the requested pipeline.
+
+    Pipelines are assigned to workers by hashing their names, so every request
+    for a given pipeline is always served by the same process. All workers share
+    the front's working directory, so the memory-mapped Arrow files that hold a
+    pipeline's results can be read by any process.
+    """
+
+    def __init__(
+        self,
+        index: TypeIndex,
+        workdir: Path,
+        num_workers: int,
+        pipeline_options: dict = None,
+    ):
+        if num_workers < 1:
+            raise ValueError("A front requires at least one worker")
+
+        # Workers may be spawned rather than forked, so they can't rely on
+        # inheriting the front's cache configuration.
+        cache_limits = {
+            "max_bytes": table_cache.max_bytes,
+            "max_handles": table_cache.max_handles,
+        }
+        self.workers = [
+            Worker(n, index, workdir, cache_limits, pipeline_options)
+            for n in range(num_workers)
+        ]
+
+        self.app = web.Application()
+        self.app.router.add_route("GET", "/pipelines", self.list_pipelines)
+        self.app.router.add_route("*", "/pipelines/{name}/{tail:.*}", self.forward)
+        self.app.router.add_route("*", "/{tail:.*}", self.forward)
+        self.app.on_startup.append(self._start_workers)
+        self.app.on_cleanup.append(self._stop_workers)
+
+    def listen(self, port=None, path=None):
+        """Run the front and its workers."""
+        web.run_app(self.app, port=port, path=path)
+
+    def worker_for(self, name: str) -> Worker:
+        """Get the worker that owns the pipeline with the given name."""
+        return self.workers[zlib.crc32(name.encode("utf-8")) % len(self.workers)]
+
+    async def _start_workers(self, _):
+        await asyncio.gather(*(worker.start() for worker in self.workers))
+
+    async def _stop_workers(self, _):
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+    async def list_pipelines(self, _):
+        """Handle GET requests for the list of pipelines by combining the lists
+        reported by every worker."""
+
+        async def names(worker: Worker):
+            async with worker.session.get(worker.url("/pipelines")) as response:
+                return (await response.json())["pipelines"]
+
+        lists = await asyncio.gather(*(names(worker) for worker in self.workers))
+        return web.json_response(
+            {"pipelines": sorted({name for names in lists for name in names})}
+        )
+
+    async def forward(self, request: web.Request):
+        """Relay a request to the worker that owns its pipeline and stream the
+        worker's response back to the client as it arrives."""
+        name = request.match_info.get("name", DEFAULT_PIPELINE)
+        worker = self.worker_for(name)
+
+        if request.headers.get("upgrade", "").lower() == "websocket":
+            return await self._relay_socket(request, worker)
+
+        async with worker.session.request(
+            request.method,
+            worker.url(request.path, request.query_string),
+            headers=_forwarded_headers(request.headers),
+            data=await request.read(),
+            allow_redirects=False,
+        ) as upstream:
+            response = web.StreamResponse(
+                status=upstream.status,
+                reason=upstream.reason,
+                headers=_forwarded_headers(upstream.headers),
+            )
+            await response.prepare(request)
+
+            async for chunk in upstream.content.iter_any():
+                await response.write(chunk)
+
+            await response.write_eof()
+            return response
+
+    async def _relay_socket(self, request: web.Request, worker: Worker):
+        """Relay a WebSocket connection to a worker, passing messages in both
+        directions until either side closes the connection."""
+        client = web.WebSocketResponse()
+        await client.prepare(request)
+
+        async def pump(source, sink):
+            async for message in source:
+                if message.type == WSMsgType.TEXT:
+                    await sink.send_str(message.data)
+                elif message.type == WSMsgType.BINARY:
+                    await sink.send_bytes(message.data)
+                else:
+                    break
+
+        url = worker.url(request.path, request.query_string)
+        async with worker.session.ws_connect(url) as upstream:
+            pumps = [
+                asyncio.create_task(pump(client, upstream)),
+                asyncio.create_task(pump(upstream, client)),
+            ]
+            _, pending = await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+            for job in pending:
+                job.cancel()
+
+        await client.close()
+        return client
@@ -1,24 +1,46 @@
+import asyncio
+import contextlib
 import inspect
 
 from aiohttp import web
 import aiohttp_cors
+import pyarrow
 import wrapt
 
-from somedaex.pipeline import Pipeline
+from somedaex.pipeline import InvalidPipelineName, Pipeline, PipelineRegistry
 from somedaex.pipeline.index import NoSuchType
-from somedaex.pipeline.task import Task
+from somedaex.pipeline.pipeline import BatchError
+from somedaex.observableproxy import unwrap
+from somedaex.pipeline.task import Task, table_cache
+from .caching import ResponseCache
 from .encoder import to_json
 from .events import EventStream
+from .export import EXPORT_FORMATS, BatchExporter
+from .websocket import PipelineSocket
 
 
 ROUTE_PARAMS_ATTR = "_route_params"
 
+DEFAULT_PIPELINE = "default"
+PIPELINE_PREFIX = "/pipelines/{name}"
 
-def route_params(http_method: str, path: str):
-    """Add routing information to a method."""
+IDLE_TIMEOUT = 15 * 60
+"""The number of seconds after which a pipeline that has not been accessed and
+has no event subscribers is released from memory."""
+
+IDLE_CHECK_INTERVAL = 60
+
+
+def route_params(http_method: str, path: str, scoped: bool = True):
+    """Add routing information to a method.
+
+    Routes are scoped to a pipeline by default, which means that they are
+    available both under the prefix of a named pipeline and, for the default
+    pipeline, without any prefix at all.
+    """
 
     def decorator(class_method):
-        setattr(class_method, ROUTE_PARAMS_ATTR, (http_method, path))
+        setattr(class_method, ROUTE_PARAMS_ATTR, (http_method, path, scoped))
         return class_method
 
     return decorator
@@ -31,7 +53,7 @@ async def task_handler(wrapped, instance, args, kwargs):
     request = args[0]
     task_id = int(request.match_info["id"])
     try:
-        kwargs["task"] = instance.pipeline[task_id]
+        kwargs["task"] = instance.get_pipeline(request)[task_id]
     except KeyError:
         return web.Response(status=404)
 
@@ -39,11 +61,13 @@ async def task_handler(wrapped, instance, args, kwargs):
 
 
 class Server:
-    """A server provides an HTTP interface to a pipeline."""
+    """A server provides an HTTP interface to a registry of named pipelines."""
 
-    def __init__(self, pipeline: Pipeline):
-        self.pipeline = pipeline
-        self.events = EventStream(pipeline)
+    def __init__(self, pipelines: PipelineRegistry, idle_timeout=IDLE_TIMEOUT):
+        self.pipelines = pipelines
+        self.idle_timeout = idle_timeout
+        self.events = {}
+        self.responses = ResponseCache()
         # self.provocateur = Provocateur(self.events, 5)
 
         self.app = web.Application()
@@ -63,24 +87,107 @@ class Server:
         for name in dir(self):
             attr = getattr(self, name)
             if inspect.ismethod(attr) and hasattr(attr, ROUTE_PARAMS_ATTR):
-                method, path = getattr(attr, ROUTE_PARAMS_ATTR)
-                if path not in http_resources:
-                    http_resources[path] = self.app.router.add_resource(path)
-                self.cors.add(http_resources[path].add_route(method, attr))
+                method, path, scoped = getattr(attr, ROUTE_PARAMS_ATTR)
+                paths = [path, PIPELINE_PREFIX + path] if scoped else [path]
+                for full_path in paths:
+                    if full_path not in http_resources:
+                        resource = self.app.router.add_resource(full_path)
+                        http_resources[full_path] = resource
+                    self.cors.add(http_resources[full_path].add_route(method, attr))
+
+        self.app.middlewares.append(self._pipeline_errors)
+        self.app.cleanup_ctx.append(self._release_idle_pipelines)
+
+    def listen(self, port=None, path=None):
+        """Run the server on the given TCP port or, if a path is given, on a Unix
+        domain socket at that path."""
+        web.run_app(self.app, port=port, path=path)
+
+    def get_pipeline(self, request: web.Request) -> Pipeline:
+        """Get the pipeline that a request refers to."""
+        name = request.match_info.get("name", DEFAULT_PIPELINE)
+        pipeline = self.pipelines[name]
+        if name not in self.events:
+            self.events[name] = EventStream(pipeline)
+        return pipeline
+
+    def pipeline_prefix(self, request: web.Request) -> str:
+        """Get the path prefix of the pipeline that a request refers to, which
+        is empty for a request made to the default pipeline without one."""
+        if "name" not in request.match_info:
+            return ""
+        return PIPELINE_PREFIX.format(name=request.match_info["name"])
+
+    def get_events(self, request: web.Request) -> EventStream:
+        """Get the event stream of the pipeline that a request refers to."""
+        self.get_pipeline(request)
+        return self.events[request.match_info.get("name", DEFAULT_PIPELINE)]
+
+    @web.middleware
+    async def _pipeline_errors(self, request, handler):
+        try:
+            return await handler(request)
+        except InvalidPipelineName as err:
+            return web.Response(status=404, text=str(err))
 
-    def listen(self, port):
-        """Run the server."""
-        web.run_app(self.app, port=port)
+    async def _release_idle_pipelines(self, _):
+        async def release_periodically():
+            while True:
+                await asyncio.sleep(IDLE_CHECK_INTERVAL)
+                self.release_idle_pipelines()
+
+        sweeper = asyncio.create_task(release_periodically())
+        yield
+        sweeper.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await sweeper
+
+    def release_idle_pipelines(self):
+        """Release pipelines that have been idle for longer than the server's idle
+        timeout and that have no event subscribers."""
+        for name in self.pipelines.idle(self.idle_timeout):
+            events = self.events.get(name)
+            if events is not None and events.subscribers:
+                self.pipelines.touch(name)
+                continue
+
+            if events is not None:
+                events.close()
+                del self.events[name]
+            self.pipelines.release(name)
+
+    @route_params("GET", "/cache", scoped=False)
+    async def get_cache_stats(self, _):
+        """Handle GET requests for the statistics of the process's table cache."""
+        return web.json_response(table_cache.stats())
+
+    @route_params("GET", "/disk")
+    async def get_disk_usage(self, request):
+        """Handle GET requests for the disk space used by the pipeline's tasks."""
+        return web.json_response(self.get_pipeline(request).disk_usage())
+
+    @route_params("GET", "/pipelines", scoped=False)
+    async def list_pipelines(self, _):
+        """Handle GET requests for the list of pipelines."""
+        return web.json_response({"pipelines": self.pipelines.names()})
 
     @route_params("GET", "/")
-    async def get_pipeline(self, request):
+    async def get_pipeline_route(self, request):
         """Handle GET requests for the pipeline."""
+        pipeline = self.get_pipeline(request)
+
         if request.headers.get("accept") == "text/event-stream":
-            await self.events.subscribe(request)
+            await self.get_events(request).subscribe(request)
 
         else:
-            tasks = [t.args() for t in self.pipeline]
-            return web.json_response({"tasks": tasks}, dumps=to_json)
+            return self.responses.tasks_response(request, pipeline)
+
+    @route_params("GET", "/ws")
+    async def open_socket(self, request):
+        """Handle WebSocket connections, which carry commands, events and task
+        results for the pipeline over a single connection."""
+        socket = PipelineSocket(self.get_pipeline(request), self.get_events(request))
+        return await socket.serve(request)
 
     @route_params("POST", "/")
     async def add_task(self, request):
@@ -91,8 +198,8 @@ class Server:
         print(f"Creating {task_type} task with {body}")
 
         try:
-            task = self.pipeline.create_task(task_type, **body)
-            headers = {"Location": f"/{task.id}"}
+            task = self.get_pipeline(request).create_task(task_type, **body)
+            headers = {"Location": f"{self.pipeline_prefix(request)}/{task.id}"}
             return web.json_response(
                 task.args(), status=201, headers=headers, dumps=to_json
             )
@@ -100,13 +207,36 @@ class Server:
         except NoSuchType as err:
             return web.Response(status=400, text=str(err))
 
+    @route_params("POST", "/batch")
+    async def apply_batch(self, request):
+        """Handle POST requests for a batch of operations by applying all of them
+        to the pipeline at once.
+
+        The request body is an object with an "operations" list, as described by
+        Pipeline.apply_batch(). The response lists the state of each task an
+        operation was applied to, in the same order as the operations.
+        """
+        body = await request.json()
+        pipeline = self.get_pipeline(request)
+
+        try:
+            tasks = pipeline.apply_batch(body["operations"])
+        except (BatchError, KeyError, TypeError) as err:
+            return web.Response(status=400, text=str(err))
+
+        results = [
+            task.args() if task.id in pipeline else {"id": task.id, "deleted": True}
+            for task in tasks
+        ]
+        return web.json_response({"tasks": results}, dumps=to_json)
+
     @task_handler
     @route_params("GET", r"/{id:\d+}")
-    async def get_task(self, _, task):
+    async def get_task(self, request, task):
         """Handle GET requests for a specific task by returning a JSON representation
         of that task.
         """
-        return web.json_response(task.args(), dumps=to_json)
+        return self.responses.task_response(request, task)
 
     @task_handler
     @route_params("POST", r"/{id:\d+}")
@@ -118,25 +248,91 @@ class Server:
         body = await request.json()
         print(f"Updating task {task.id} with {body}")
 
-        if "source" in body and body["source"] is not None:
-            try:
-                body["source"] = self.pipeline[body["source"]]
-            except KeyError:
-                msg = f"Task {body['source']} is not defined"
-                return web.json_response(status=400, text=msg)
+        try:
+            self.get_pipeline(request).update_task(task.id, body)
+        except KeyError as err:
+            msg = f"Task {err.args[0]} is not defined"
+            return web.json_response(status=400, text=msg)
 
-        # try:
-        # task.config.update(lambda config: config | body)
-        task.update(body)
         return web.json_response(task.args(), dumps=to_json)
 
         # except Exception as err:
         #     print(err)
         #     return web.Response(status=400, text=str(err))
 
+    @task_handler
+    @route_params("GET", r"/{id:\d+}/export")
+    async def export_task(self, request: web.Request, task: Task):
+        """Handle GET requests for a task's results as a file download.
+
+        The "format" query parameter is "csv" (the default), "parquet" or "arrow",
+        and the optional "columns" parameter is a comma-separated list of the
+        columns to include. The file is encoded and sent a batch at a time as the
+        results are read, so the download can begin before a running task is
+        complete. A client cancels the download by closing the connection. An
+        unknown column, or a task that has no schema yet, is a 400 error.
+        """
+        export_format = request.query.get("format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            return web.Response(
+                status=400, text=f"Unknown export format {export_format!r}"
+            )
+
+        schema = unwrap(task.schema)
+        if schema is None:
+            return web.Response(status=400, text=f"Task {task.id} has no results")
+
+        columns = request.query.get("columns")
+        column_names = columns.split(",") if columns else None
+        if column_names is not None:
+            unknown = [name for name in column_names if name not in schema.names]
+            if unknown:
+                return web.Response(
+                    status=400, text=f"Unknown columns: {', '.join(unknown)}"
+                )
+            schema = pyarrow.schema([schema.field(name) for name in column_names])
+
+        # Read the first batch before responding, so that an error can still be
+        # reported with a status code
+        generation = task.generation
+        batches = task.batches(column_names)
+        try:
+            first = await batches.__anext__()
+            schema = first.schema
+        except StopAsyncIteration:
+            first = None
+        except KeyError as err:
+            return web.Response(status=400, text=str(err))
+
+        info = EXPORT_FORMATS[export_format]
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": info.content_type,
+                "Content-Disposition": (
+                    f'attachment; filename="{task.id}.{info.extension}"'
+                ),
+            }
+        )
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+
+        exporter = BatchExporter(export_format, schema)
+        if first is not None:
+            await response.write(exporter.write(first))
+            async for batch in batches:
+                if task.generation != generation:
+                    # The results were reset, so the file can't be completed. An
+                    # error after the response has begun aborts the connection.
+                    raise web.HTTPConflict(text=f"Task {task.id} was reset")
+                await response.write(exporter.write(batch))
+        await response.write(exporter.close())
+
+        await response.write_eof()
+        return response
+
     @task_handler
     @route_params("DELETE", r"/{id:\d+}")
-    async def delete_task(self, _, task):
+    async def delete_task(self, request, task):
         """Handle DELETE requests for a specific task by deleting the task."""
-        self.pipeline.remove_task(task.id)
+        self.get_pipeline(request).remove_task(task.id)
         return web.Response(status=204)
@@ -0,0 +1,250 @@
+"""The websocket module provides a WebSocket interface to a pipeline, which
+carries commands, events and task results over a single connection."""
+
+import asyncio
+import contextlib
+import json
+import struct
+from typing import Dict
+
+from aiohttp import WSMsgType, web
+import pyarrow
+
+from ..observableproxy import unwrap
+from ..pipeline import Pipeline
+from .encoder import to_json
+from .events import EventStream
+from .export import BatchExporter
+
+
+DEFAULT_WINDOW = 4
+"""The number of binary frames a subscription may send before the client grants
+it more credit."""
+
+MAX_WINDOW = 64
+
+FRAME_HEADER = struct.Struct(">I")
+"""The header of a binary frame, which holds the number of its subscription."""
+
+
+class Subscription:
+    """A Subscription streams the results of a task to a client as binary
+    frames, each starting with the subscription's number followed by part of
+    an Arrow IPC stream.
+
+    A subscription may only send as many frames as the client has granted it
+    credit for, so a slow client never has more than a window of frames
+    buffered on its behalf.
+    """
+
+    def __init__(self, number: int, task, columns, window: int):
+        self.number = number
+        self.task = task
+        self.columns = columns
+        self._credit = window
+        self._has_credit = asyncio.Event()
+        self._has_credit.set()
+        self.job: asyncio.Task = None
+
+    def grant(self, frames: int):
+        """Allow the subscription to send more frames."""
+        self._credit += frames
+        if self._credit > 0:
+            self._has_credit.set()
+
+    async def spend(self):
+        """Wait until the subscription has credit, then use it to send a frame."""
+        await self._has_credit.wait()
+        self._credit -= 1
+        if self._credit <= 0:
+            self._has_credit.clear()
+
+
+class PipelineSocket:
+    """A PipelineSocket serves one WebSocket connection to a pipeline.
+
+    Text frames hold JSON. The client sends commands, each an object with an
+    "op" key and an optional "id" that is repeated in the reply:
+
+    - "create": creates a task, with the "type" and options of POST /.
+    - "update": applies the "updates" object to a "task".
+    - "delete": deletes a "task".
+    - "batch": applies a list of "operations", as POST /batch does.
+    - "subscribe": streams the results of a "task", optionally limited to some
+      "columns", with a "window" of frames that may be sent before more credit
+      is granted. The reply holds the subscription's number.
+    - "credit": grants a "subscription" more "frames".
+    - "unsubscribe": stops a "subscription".
+
+    The server sends the pipeline's events as they happen, each with an
+    "eventId" that can be passed as the "lastEventId" query parameter of
+    a new connection to resume where an earlier one left off. A subscription
+    ends with an "end" message, with a "reset" message if the task was reset
+    before all of its results were sent, or with an "error" message. A
+    subscription to a task without results still sends their schema.
+    """
+
+    def __init__(self, pipeline: Pipeline, events: EventStream):
+        self.pipeline = pipeline
+        self.events = events
+        self._socket: web.WebSocketResponse = None
+        self._send_lock = asyncio.Lock()
+        self._subscriptions: Dict[int, Subscription] = {}
+        self._next_subscription = 1
+
+    async def serve(self, request: web.Request) -> web.WebSocketResponse:
+        """Handle the connection until either side closes it."""
+        self._socket = web.WebSocketResponse()
+        await self._socket.prepare(request)
+
+        queue = asyncio.Queue()
+        for message in self.events.missed(request.query.get("lastEventId")):
+            queue.put_nowait(message)
+        self.events.subscribers.add(queue)
+        relay = asyncio.create_task(self._relay_events(queue))
+
+        try:
+            async for message in self._socket:
+                if message.type == WSMsgType.TEXT:
+                    await self._handle(message.data)
+                elif message.type == WSMsgType.ERROR:
+                    break
+        finally:
+            self.events.subscribers.discard(queue)
+            jobs = [relay] + [s.job for s in self._subscriptions.values()]
+            for job in jobs:
+                job.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await asyncio.gather(*jobs, return_exceptions=True)
+
+        return self._socket
+
+    async def _relay_events(self, queue: asyncio.Queue):
+        while True:
+            message = await queue.get()
+            # The payload is an encoded object, so the ID is spliced into it
+            await self._send_text(f'{{"eventId": "{message.id}", {message.payload[1:]}')
+
+    async def _handle(self, data: str):
+        command = {}
+        try:
+            command = json.loads(data)
+            reply = self._dispatch(command)
+        except Exception as err:  # pylint: disable=broad-except
+            # Any problem with a command is answered rather than ending the
+            # connection
+            reply = {"error": str(err)}
+
+        if isinstance(command, dict) and "id" in command:
+            reply = {"id": command["id"], **reply}
+        await self._send_text(to_json(reply))
+
+    def _dispatch(self, command: dict) -> dict:
+        if not isinstance(command, dict):
+            raise ValueError("A command must be an object")
+
+        op = command.get("op")
+        if op == "create":
+            options = {k: v for k, v in command.items() if k not in ("op", "id")}
+            task = self.pipeline.create_task(options.pop("type"), **options)
+            return {"task": task.args()}
+        if op == "update":
+            updates = command["updates"]
+            if not isinstance(updates, dict):
+                raise ValueError("The updates to a task must be an object")
+            task = self.pipeline.update_task(int(command["task"]), updates)
+            return {"task": task.args()}
+        if op == "delete":
+            self.pipeline.remove_task(int(command["task"]))
+            return {"deleted": int(command["task"])}
+        if op == "batch":
+            operations = command["operations"]
+            if not isinstance(operations, list):
+                raise ValueError("The operations of a batch must be a list")
+            tasks = self.pipeline.apply_batch(operations)
+            return {
+                "tasks": [
+                    t.args() if t.id in self.pipeline else {"id": t.id, "deleted": True}
+                    for t in tasks
+                ]
+            }
+        if op == "subscribe":
+            return {"subscription": self._subscribe(command)}
+        if op == "credit":
+            self._subscription(command).grant(int(command["frames"]))
+            return {}
+        if op == "unsubscribe":
+            subscription = self._subscription(command)
+            del self._subscriptions[subscription.number]
+            subscription.job.cancel()
+            return {}
+        raise ValueError(f"Unknown operation {op!r}")
+
+    def _subscription(self, command: dict) -> Subscription:
+        """Get the active subscription that a command refers to. A subscription
+        is no longer active once its last message has been sent."""
+        number = command["subscription"]
+        if number not in self._subscriptions:
+            raise ValueError(f"Subscription {number} is not active")
+        return self._subscriptions[number]
+
+    def _subscribe(self, command: dict) -> int:
+        task = self.pipeline[int(command["task"])]
+        window = min(int(command.get("window", DEFAULT_WINDOW)), MAX_WINDOW)
+        if window < 1:
+            raise ValueError("A subscription's window must be at least 1")
+
+        number = self._next_subscription
+        self._next_subscription += 1
+        subscription = Subscription(number, task, command.get("columns"), window)
+        subscription.job = asyncio.create_task(self._stream(subscription))
+        self._subscriptions[number] = subscription
+        return number
+
+    async def _stream(self, subscription: Subscription):
+        task = subscription.task
+        generation = task.generation
+        exporter = None
+        num_rows = 0
+        try:
+            async for batch in task.batches(subscription.columns):
+                if task.generation != generation:
+                    await self._end(subscription, "reset", num_rows)
+                    return
+                if exporter is None:
+                    exporter = BatchExporter("arrow", batch.schema)
+                await subscription.spend()
+                await self._send_frame(subscription, exporter.write(batch))
+                num_rows += batch.num_rows
+
+            if exporter is None:
+                # There were no results, but the client still gets their schema
+                exporter = BatchExporter("arrow", self._schema(subscription))
+            await self._send_frame(subscription, exporter.close())
+            await self._end(subscription, "end", num_rows)
+        except Exception as err:  # pylint: disable=broad-except
+            # Any problem ends the subscription rather than the connection
+            await self._end(subscription, "error", num_rows, str(err))
+        finally:
+            self._subscriptions.pop(subscription.number, None)
+
+    @staticmethod
+    def _schema(subscription: Subscription) -> pyarrow.Schema:
+        schema = unwrap(subscription.task.schema)
+        if subscription.columns is not None:
+            schema = pyarrow.schema([schema.field(n) for n in subscription.columns])
+        return schema
+
+    async def _end(self, subscription: Subscription, event: str, rows: int, error=None):
+        message = {"subscription": subscription.number, "event": event, "rows": rows}
+        if error is not None:
+            message["error"] = error
+        await self._send_text(to_json(message))
+
+    async def _send_frame(self, subscription: Subscription, data: bytes):
+        async with self._send_lock:
+            await self._socket.send_bytes(FRAME_HEADER.pack(subscription.number) + data)
+
+    async def _send_text(self, data: str):
+        async with self._send_lock:
+            await self._socket.send_str(data)
@@ -0,0 +1,397 @@
+"""The minhash module provides vectorized hashing of Arrow arrays, MinHash
+signatures for text, and an index of locality-sensitive hashing (LSH) buckets
+that can grow beyond memory."""
+
+from pathlib import Path
+import shutil
+from typing import List, Optional, Tuple
+
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.types
+
+
+SHINGLE_SIZE = 5
+NUM_BANDS = 20
+ROWS_PER_BAND = 5
+SEED = 0x5EED
+
+MAX_SHINGLES = 1 << 15
+"""The maximum number of shingles hashed at once, which bounds the size of the
+intermediate matrix of shingle hashes."""
+
+MERGE_CHUNK = 1 << 16
+"""The number of keys read from each level at a time when levels that have been
+written to disk are merged."""
+
+_BASE = numpy.uint64(0x100000001B3)
+_EMPTY = numpy.iinfo(numpy.uint64).max
+
+
+def _mix(values: numpy.ndarray) -> numpy.ndarray:
+    """Scramble the bits of 64-bit integers (the splitmix64 finalizer)."""
+    values = values ^ (values >> numpy.uint64(30))
+    values = values * numpy.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> numpy.uint64(27))
+    values = values * numpy.uint64(0x94D049BB133111EB)
+    return values ^ (values >> numpy.uint64(31))
+
+
+def _string_hashes(strings: pyarrow.Array) -> numpy.ndarray:
+    """Hash each string or binary value from the array's buffers, taking the
+    position of every byte into account."""
+    if pyarrow.types.is_large_string(strings.type) or pyarrow.types.is_large_binary(
+        strings.type
+    ):
+        offset_type = numpy.int64
+    else:
+        offset_type = numpy.int32
+    _, offset_buffer, data_buffer = strings.buffers()
+    offsets = numpy.frombuffer(offset_buffer, dtype=offset_type)
+    offsets = offsets[strings.offset : strings.offset + len(strings) + 1]
+    offsets = offsets.astype(numpy.int64)
+    lengths = numpy.diff(offsets)
+    sums = numpy.zeros(len(strings), dtype=numpy.uint64)
+
+    if data_buffer is not None and offsets[-1] > offsets[0]:
+        data = numpy.frombuffer(data_buffer, dtype=numpy.uint8)
+        data = data[offsets[0] : offsets[-1]].astype(numpy.uint64)
+        starts = offsets[:-1] - offsets[0]
+        positions = numpy.arange(len(data)) - numpy.repeat(starts, lengths)
+        with numpy.errstate(over="ignore"):
+            terms = _mix((positions.astype(numpy.uint64) << numpy.uint64(8)) | data)
+            nonempty = lengths > 0
+            sums[nonempty] = numpy.add.reduceat(terms, starts[nonempty])
+
+    with numpy.errstate(over="ignore"):
+        return _mix(sums + lengths.astype(numpy.uint64) * _BASE)
+
+
+def hash_array(array: pyarrow.Array) -> numpy.ndarray:
+    """Hash each value of an array to a 64-bit integer. Equal values of the same
+    type always have the same hash, in whichever array they occur, and nulls
+    have a hash of their own."""
+    if isinstance(array, pyarrow.DictionaryArray):
+        hashes = hash_array(array.dictionary)
+        indices = array.indices.fill_null(0).to_numpy(zero_copy_only=False)
+        hashes = hashes[indices.astype(numpy.int64)]
+    elif pyarrow.types.is_string(array.type) or pyarrow.types.is_binary(array.type):
+        hashes = _string_hashes(array)
+    elif pyarrow.types.is_large_string(array.type) or pyarrow.types.is_large_binary(
+        array.type
+    ):
+        hashes = _string_hashes(array)
+    elif pyarrow.types.is_floating(array.type):
+        values = pyarrow.compute.cast(array, pyarrow.float64()).fill_null(0)
+        values = values.to_numpy(zero_copy_only=False)
+        # Treat 0.0 and -0.0 as the same value
+        hashes = _mix((values + 0.0).view(numpy.uint64))
+    elif pyarrow.types.is_integer(array.type) or pyarrow.types.is_boolean(
+        array.type
+    ):
+        values = pyarrow.compute.cast(array, pyarrow.int64(), safe=False)
+        values = values.fill_null(0)
+        hashes = _mix(values.to_numpy(zero_copy_only=False).view(numpy.uint64))
+    elif pyarrow.types.is_temporal(array.type):
+        width = pyarrow.int64() if array.type.bit_width == 64 else pyarrow.int32()
+        return hash_array(array.view(width))
+    else:
+        values = array.to_pylist()
+        hashes = numpy.fromiter((hash(value) for value in values), numpy.int64)
+        hashes = _mix(hashes.view(numpy.uint64))
+
+    if array.null_count > 0:
+        nulls = array.is_null().to_numpy(zero_copy_only=False)
+        hashes = numpy.where(nulls, _EMPTY, hashes)
+    return hashes
+
+
+def hash_rows(columns: List[pyarrow.Array]) -> numpy.ndarray:
+    """Hash the combination of values in each row of a set of columns."""
+    hashes = numpy.zeros(len(columns[0]) if columns else 0, dtype=numpy.uint64)
+    with numpy.errstate(over="ignore"):
+        for column in columns:
+            hashes = _mix(hashes * _BASE + hash_array(column))
+    return hashes
+
+
+def shingle_hashes(
+    strings: pyarrow.Array, size: int = SHINGLE_SIZE
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Hash every run of `size` bytes in each string, reading the strings
+    directly from the array's buffers.
+
+    Strings shorter than the shingle size have a single shingle made up of the
+    whole string, and empty strings have none. Returns the hashes, ordered by
+    string, and the index of each string's first hash, with one extra entry for
+    the end of the last string.
+    """
+    strings = pyarrow.compute.cast(strings, pyarrow.string())
+    _, offset_buffer, data_buffer = strings.buffers()
+    offsets = numpy.frombuffer(offset_buffer, dtype=numpy.int32)
+    offsets = offsets[strings.offset : strings.offset + len(strings) + 1]
+    offsets = offsets.astype(numpy.int64)
+    if data_buffer is None or offsets[-1] == offsets[0]:
+        bounds = numpy.zeros(len(strings) + 1, dtype=numpy.int64)
+        return numpy.zeros(0, dtype=numpy.uint64), bounds
+
+    data = numpy.frombuffer(data_buffer, dtype=numpy.uint8)[offsets[0] : offsets[-1]]
+    offsets = offsets - offsets[0]
+    lengths = numpy.diff(offsets)
+    ends = numpy.repeat(offsets[1:], lengths)
+    positions = numpy.arange(len(data))
+
+    # Hash the bytes from each position up to the shingle size or the end of its
+    # string, whichever comes first
+    padded = numpy.concatenate([data, numpy.zeros(size, numpy.uint8)])
+    hashes = numpy.zeros(len(data), dtype=numpy.uint64)
+    with numpy.errstate(over="ignore"):
+        for t in range(size):
+            byte = padded[t : t + len(data)].astype(numpy.uint64)
+            byte[positions + t >= ends] = 0
+            hashes = hashes * _BASE + byte + numpy.uint64(1)
+        hashes = _mix(hashes)
+
+    starts = numpy.repeat(offsets[:-1], lengths)
+    keep = (positions + size <= ends) | ((positions == starts) & (ends - starts < size))
+    counts = numpy.zeros(len(strings), dtype=numpy.int64)
+    counts[lengths > 0] = numpy.add.reduceat(
+        keep.astype(numpy.int64), offsets[:-1][lengths > 0]
+    )
+    bounds = numpy.concatenate([[0], numpy.cumsum(counts)])
+    return hashes[keep], bounds
+
+
+class MinHasher:
+    """A MinHasher computes MinHash signatures of strings and divides them into
+    bands for locality-sensitive hashing.
+
+    Two strings whose sets of shingles have a Jaccard similarity of s share at
+    least one band with probability 1 - (1 - s^r)^b, for b bands of r rows each.
+    """
+
+    def __init__(
+        self,
+        num_bands: int = NUM_BANDS,
+        rows_per_band: int = ROWS_PER_BAND,
+        shingle_size: int = SHINGLE_SIZE,
+        seed: int = SEED,
+    ):
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.shingle_size = shingle_size
+
+        random = numpy.random.RandomState(seed)
+        num_hashes = num_bands * rows_per_band
+        self._a = random.randint(0, 2 ** 63, num_hashes, dtype=numpy.uint64)
+        self._a = self._a * numpy.uint64(2) + numpy.uint64(1)
+        self._b = random.randint(0, 2 ** 63, num_hashes, dtype=numpy.uint64)
+        self._band_seeds = _mix(numpy.arange(1, num_bands + 1, dtype=numpy.uint64))
+
+    def signatures(self, strings: pyarrow.Array) -> numpy.ndarray:
+        """Compute the MinHash signature of each string, as a matrix with a row
+        for each string."""
+        hashes, bounds = shingle_hashes(strings, self.shingle_size)
+        signatures = numpy.full((len(strings), len(self._a)), _EMPTY, numpy.uint64)
+
+        # Work through the shingles in chunks of a bounded size. A long string's
+        # shingles may span several chunks, so each chunk's minimums are folded
+        # into the signatures computed so far.
+        nonempty = numpy.flatnonzero(bounds[1:] > bounds[:-1])
+        for start in range(0, len(hashes), MAX_SHINGLES):
+            end = min(start + MAX_SHINGLES, len(hashes))
+            first = int(numpy.searchsorted(bounds[nonempty + 1], start, "right"))
+            last = int(numpy.searchsorted(bounds[nonempty], end, "left"))
+            rows = nonempty[first:last]
+
+            with numpy.errstate(over="ignore"):
+                permuted = hashes[start:end, None] * self._a[None, :] + self._b[None, :]
+            minimums = numpy.minimum.reduceat(
+                permuted, numpy.maximum(bounds[rows], start) - start, axis=0
+            )
+            signatures[rows] = numpy.minimum(signatures[rows], minimums)
+
+        return signatures
+
+    def band_keys(self, signatures: numpy.ndarray) -> numpy.ndarray:
+        """Hash each band of each signature to a single key, as a matrix with a
+        row for each signature and a column for each band. Keys from different
+        bands never collide by construction of the band seeds."""
+        bands = signatures.reshape(len(signatures), self.num_bands, self.rows_per_band)
+        keys = numpy.broadcast_to(self._band_seeds, bands.shape[:2]).copy()
+        with numpy.errstate(over="ignore"):
+            for row in range(self.rows_per_band):
+                keys = _mix(keys * _BASE + bands[:, :, row])
+        return keys
+
+
+class _Level:
+    def __init__(
+        self, keys: numpy.ndarray, values: numpy.ndarray, path: Optional[Path] = None
+    ):
+        self.keys = keys
+        self.values = values
+        self.path = path
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.path is not None else self.keys.nbytes + self.values.nbytes
+
+
+class LshIndex:
+    """An LshIndex maps band keys to the cluster that first claimed them.
+
+    Keys are kept in sorted levels, like a log-structured merge tree, so that a
+    whole batch of keys can be looked up with binary searches and added with a
+    merge. When the levels held in memory exceed the memory budget, the largest
+    are written to the index directory and memory-mapped instead. A level
+    merged with one on disk is written straight to a new file, a chunk of keys
+    at a time, so the levels on disk are never read into memory as a whole.
+    """
+
+    def __init__(self, directory: Path, memory_budget: int):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self._levels: List[_Level] = []
+        self._num_files = 0
+
+    def __len__(self):
+        return sum(len(level.keys) for level in self._levels)
+
+    def lookup(self, keys: numpy.ndarray) -> numpy.ndarray:
+        """Find the cluster that claimed each key, or -1 if none has."""
+        values = numpy.full(len(keys), -1, dtype=numpy.int64)
+        for level in self._levels:
+            if len(level.keys) == 0:
+                continue
+            positions = numpy.searchsorted(level.keys, keys)
+            positions = numpy.minimum(positions, len(level.keys) - 1)
+            found = level.keys[positions] == keys
+            values[found] = level.values[positions[found]]
+        return values
+
+    def add(self, keys: numpy.ndarray, values: numpy.ndarray):
+        """Add keys that are not yet in the index, each with its cluster."""
+        if len(keys) == 0:
+            return
+
+        keys, first = numpy.unique(keys, return_index=True)
+        self._levels.append(_Level(keys, values[first]))
+
+        # Merge levels whenever a level is no larger than the one after it, so
+        # that there are only logarithmically many levels
+        while (
+            len(self._levels) > 1
+            and len(self._levels[-2].keys) <= 2 * len(self._levels[-1].keys)
+        ):
+            newer = self._levels.pop()
+            older = self._levels.pop()
+            self._levels.append(self._merge(older, newer))
+
+        self._enforce_budget()
+
+    def stats(self) -> dict:
+        """Summarize the size of the index."""
+        return {
+            "keys": len(self),
+            "levels": len(self._levels),
+            "memory_bytes": sum(level.nbytes for level in self._levels),
+            "disk_levels": sum(level.path is not None for level in self._levels),
+        }
+
+    def close(self):
+        """Delete the index's files."""
+        self._levels = []
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _merge(self, older: _Level, newer: _Level) -> _Level:
+        if older.path is None and newer.path is None:
+            keys = numpy.concatenate([older.keys, newer.keys])
+            values = numpy.concatenate([older.values, newer.values])
+            order = numpy.argsort(keys, kind="stable")
+            return _Level(keys[order], values[order])
+
+        merged = self._merge_to_file(older, newer)
+        for level in (older, newer):
+            if level.path is not None:
+                level.path.unlink(missing_ok=True)
+                level.path.with_suffix(".values.npy").unlink(missing_ok=True)
+        return merged
+
+    def _merge_to_file(self, older: _Level, newer: _Level) -> _Level:
+        """Merge two sorted levels into a new file, a chunk at a time. Keys that
+        are in both levels keep the older level's entry first."""
+        path = self._next_path()
+        size = len(older.keys) + len(newer.keys)
+        keys = numpy.lib.format.open_memmap(
+            path, mode="w+", dtype=older.keys.dtype, shape=(size,)
+        )
+        values = numpy.lib.format.open_memmap(
+            path.with_suffix(".values.npy"),
+            mode="w+",
+            dtype=older.values.dtype,
+            shape=(size,),
+        )
+
+        i = j = written = 0
+        while written < size:
+            older_keys = older.keys[i : i + MERGE_CHUNK]
+            newer_keys = newer.keys[j : j + MERGE_CHUNK]
+            # The chunk that ends with the smaller key is taken whole, along with
+            # the keys of the other chunk that sort before its last key. Any of
+            # the older level's keys that equal a key of the newer level are
+            # taken in the same or an earlier step, so they stay first.
+            if len(newer_keys) == 0:
+                num_older, num_newer = len(older_keys), 0
+            elif len(older_keys) == 0:
+                num_older, num_newer = 0, len(newer_keys)
+            elif older_keys[-1] <= newer_keys[-1]:
+                num_older = len(older_keys)
+                num_newer = numpy.searchsorted(newer_keys, older_keys[-1], "left")
+            else:
+                num_older = numpy.searchsorted(older_keys, newer_keys[-1], "right")
+                num_newer = len(newer_keys)
+
+            chunk_keys = numpy.concatenate(
+                [older_keys[:num_older], newer_keys[:num_newer]]
+            )
+            chunk_values = numpy.concatenate(
+                [older.values[i : i + num_older], newer.values[j : j + num_newer]]
+            )
+            order = numpy.argsort(chunk_keys, kind="stable")
+            end = written + len(order)
+            keys[written:end] = chunk_keys[order]
+            values[written:end] = chunk_values[order]
+            i += num_older
+            j += num_newer
+            written = end
+
+        keys.flush()
+        values.flush()
+        return _Level(*_load(path), path=path)
+
+    def _enforce_budget(self):
+        while sum(level.nbytes for level in self._levels) > self.memory_budget:
+            level = max(self._levels, key=lambda level: level.nbytes)
+            self._write(level)
+
+    def _write(self, level: _Level):
+        path = self._next_path()
+        numpy.save(path, level.keys)
+        numpy.save(path.with_suffix(".values.npy"), level.values)
+        level.keys, level.values = _load(path)
+        level.path = path
+
+    def _next_path(self) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"level-{self._num_files}.npy"
+        self._num_files += 1
+        return path
+
+
+def _load(path: Path) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Memory-map the keys and values of a level that was written to disk."""
+    keys = numpy.load(path, mmap_mode="r")
+    values = numpy.load(path.with_suffix(".values.npy"), mmap_mode="r")
+    return keys, values
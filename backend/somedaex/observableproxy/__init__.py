@@ -1,5 +1,5 @@
 """The observableproxy package provides a way to monitor changes to the value of
 an otherwise ordinary-looking variable."""
 
-from .proxy import observe, ObservableProxy
+from .proxy import observe, unwrap, ObservableProxy
 from .property import ObservableProperty
@@ -127,6 +127,15 @@ class ObservableProxy(wrapt.ObjectProxy):
 
 T = TypeVar("T")
 
+
+def unwrap(value):
+    """Return the value wrapped by an ObservableProxy, or the given value itself
+    if it is not a proxy."""
+    if isinstance(value, wrapt.ObjectProxy):
+        return value.__wrapped__
+    return value
+
+
 # pylint: disable=invalid-name
 class observe(Observable[T]):
     """Expose an observable that broadcasts changes to the underlying value of
@@ -4,3 +4,4 @@ data processing pipeline.
 
 from .pipeline import Pipeline
 from .index import TypeIndex
+from .registry import InvalidPipelineName, PipelineRegistry
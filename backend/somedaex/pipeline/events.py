@@ -1,11 +1,12 @@
 """The events module defines the classes for observing the state of a pipeline."""
 
+from contextlib import contextmanager
 from typing import Any, NamedTuple
 import rx
 import rx.operators
 from rx.subject import Subject
 from ..observableproxy import observe
-from ..pipeline.task import Task, MonadicTask
+from ..pipeline.task import DatasetTask, MonadicTask, PolyadicTask, Task
 
 
 class Event(NamedTuple):
@@ -22,12 +23,54 @@ class EventStream(Subject):
     def __init__(self):
         super().__init__()
         self.tasks = {}
+        self._holds = 0
+        self._held_events = []
 
     def broadcast(self, event_name: str, task: Task, value: Any = None):
         """Broadcast an event."""
         event = Event(event_name, task, value)
         self.on_next(event)
 
+    def on_next(self, value: Event):
+        if self._holds > 0:
+            self._held_events.append(value)
+        else:
+            super().on_next(value)
+
+    @contextmanager
+    def hold(self):
+        """Collect events until the end of the context, then broadcast a single
+        "summary" event for each task that changed.
+
+        The value of a summary event maps the name of each event that occurred
+        to the last value it carried. Tasks that were deleted get a "deleted"
+        event instead of a summary.
+        """
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+            if self._holds == 0:
+                self._broadcast_summaries()
+
+    def _broadcast_summaries(self):
+        events, self._held_events = self._held_events, []
+        summaries = {}
+        for event in events:
+            summary = summaries.setdefault(event.task, {})
+            if event.event in ("created", "deleted"):
+                # Only the last of these counts, as a deleted task may be put back
+                summary.pop("created", None)
+                summary.pop("deleted", None)
+            summary[event.event] = event.value
+
+        for task, summary in summaries.items():
+            if "deleted" in summary:
+                self.broadcast("deleted", task)
+            else:
+                self.broadcast("summary", task, summary)
+
     def watch(self, task: Task):
         """Watch for changes to the state of a task."""
         streams = [
@@ -46,8 +89,27 @@ class EventStream(Subject):
                 rx.operators.distinct_until_changed(),
                 rx.operators.map(lambda value: Event("schema", task, value)),
             ),
+            observe(task.stats).pipe(
+                rx.operators.distinct_until_changed(),
+                rx.operators.map(lambda value: Event("stats", task, value)),
+            ),
         ]
 
+        if isinstance(task, DatasetTask):
+            streams.append(
+                observe(task.partial).pipe(
+                    rx.operators.map(lambda value: Event("partial", task, value)),
+                ),
+            )
+
+        if isinstance(task, PolyadicTask):
+            streams.append(
+                observe(task.inputs).pipe(
+                    rx.operators.map(lambda _: task.input_tasks()),
+                    rx.operators.map(lambda value: Event("inputs", task, value)),
+                ),
+            )
+
         if isinstance(task, MonadicTask):
             streams.append(
                 observe(task.column).pipe(
@@ -42,7 +42,7 @@ class TypeIndex(Mapping[str, Type[Task]]):
         try:
             return self._index[name.lower()]
         except KeyError as err:
-            raise NoSuchType(type, self) from err
+            raise NoSuchType(name, self) from err
 
     def add(self, task_class: Type[Task]):
         """Add a task type to the index."""
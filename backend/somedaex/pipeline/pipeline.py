@@ -2,36 +2,279 @@
 
 # Standard library imports
 import asyncio
+from contextlib import contextmanager
+import json
 from pathlib import Path
-from typing import Mapping
+import time
+from typing import Any, Callable, Iterable, List, Mapping, NamedTuple, Optional
 
+import pyarrow
 import rx.operators
 
 # Local imports
+from ..arrow_util import iter_rows
+from ..observableproxy import unwrap
 from .events import EventStream
 from .index import TypeIndex
-from .task import Task, Status
+from .resets import ResetScheduler
+from .task import Task, Status, sample_table
+from .workdir import WorkdirManager
+
+
+MANIFEST_NAME = "pipeline.json"
+
+# Events that change the definition of a pipeline and so require its manifest to
+# be rewritten.
+DEFINITION_EVENTS = (
+    "created",
+    "deleted",
+    "config",
+    "column",
+    "inputs",
+    "reset",
+    "summary",
+)
+
+BATCH_OPERATIONS = ("create", "update", "delete")
+
+LINK_KEYS = ("source", "inputs")
+"""The arguments of a task that refer to the tasks it reads from."""
+
+PREVIEW_EVENT_ROWS = 100
+"""The maximum number of rows of a preview that are included in its event."""
+
+
+class BatchError(ValueError):
+    """A BatchError is raised when an operation in a batch cannot be applied. When
+    this happens, none of the operations in the batch are applied."""
+
+    def __init__(self, position: int, message: str):
+        super().__init__(f"Operation {position}: {message}")
+        self.position = position
+
+
+def _is_ready_event(event) -> bool:
+    if event.event == "status":
+        return event.value == Status.READY
+    if event.event == "summary":
+        return event.value.get("status") == Status.READY
+    return False
+
+
+def _has_event(event, name: str) -> bool:
+    """Check whether an event, or any of the events in a summary, has a name."""
+    if event.event == "summary":
+        return name in event.value
+    return event.event == name
+
+
+def _event_value(event, name: str):
+    return event.value[name] if event.event == "summary" else event.value
+
+
+def _unwrap(value):
+    """Allow observable proxies to be serialized as the values they wrap."""
+    if hasattr(value, "__wrapped__"):
+        return value.__wrapped__
+    raise TypeError(f"Object of type {type(value)} is not JSON serializable")
+
+
+def _definition(task: Task) -> Mapping[str, Any]:
+    """Describe a task in terms of the arguments needed to recreate it."""
+    args = {key: unwrap(value) for key, value in task.args().items()}
+    del args["status"]
+    if isinstance(args.get("source"), Task):
+        args["source"] = args["source"].id
+    if args.get("inputs") is not None:
+        args["inputs"] = [
+            source.id if isinstance(source, Task) else source
+            for source in args["inputs"]
+        ]
+    return args
+
+
+def _references(definition: Mapping[str, Any]) -> List[Any]:
+    """Get the IDs of the tasks that a task definition reads from."""
+    references = list(definition.get("inputs") or [])
+    if definition.get("source") is not None:
+        references.append(definition["source"])
+    return references
+
+
+def _reads_from(links: Mapping[Any, Mapping[str, Any]], task_id, source_id) -> bool:
+    """Check whether a task reads from another, directly or through other tasks,
+    given the tasks that each task reads from directly."""
+    pending = _references(links.get(task_id) or {})
+    seen = set()
+    while pending:
+        reference = pending.pop()
+        if reference == source_id:
+            return True
+        if reference not in seen:
+            seen.add(reference)
+            pending.extend(_references(links.get(reference) or {}))
+    return False
+
+
+def _restorer(task: Task) -> Callable[[], None]:
+    """Create a function that undoes any later update to a task."""
+    config = dict(unwrap(task.config))
+    links = {
+        name: unwrap(getattr(task, name))
+        for name in ("source", "column", "inputs")
+        if hasattr(task, name)
+    }
+
+    def restore():
+        task.config = config
+        for name, value in links.items():
+            if unwrap(getattr(task, name)) != value:
+                setattr(task, name, value)
+
+    return restore
+
+
+class Preview(NamedTuple):
+    """A Preview holds a task's results for a sample of the pipeline's input."""
+
+    batch: pyarrow.RecordBatch
+    fraction: float
+    """The fraction of the input rows that the sample contains."""
+    seconds: float
+    """The time it took to compute the task's results for the sample. For a task
+    that could only be sampled once it had run, this is the share of its run
+    time that the sample accounts for."""
 
 
 class Pipeline(Mapping):
-    """A pipeline is a directed acyclic graph of tasks."""
+    """A pipeline is a directed acyclic graph of tasks.
+
+    The definition of every task in the pipeline is saved in a manifest in the
+    pipeline's working directory, so a pipeline that has been closed can later be
+    restored from disk.
+
+    In preview mode, every task that becomes ready is first previewed on a
+    random sample of the pipeline's input rows, which gives a quick impression
+    of its results while the full run continues in the background.
+
+    The output options are defaults for the "compression" and "dictionary_encode"
+    options of every task in the pipeline.
+
+    The files that tasks write to the working directory are deleted when they
+    become stale or their task is removed. If a disk quota is given, the results
+    of the least valuable tasks are evicted whenever the quota is exceeded.
+    """
 
-    def __init__(self, index: TypeIndex, workdir: Path):
+    def __init__(
+        self,
+        index: TypeIndex,
+        workdir: Path,
+        preview_rows: int = None,
+        output_options: Mapping[str, Any] = None,
+        disk_quota_mb: int = None,
+    ):
         self._tasks = {}
         self._types = index
         self._counter = 0
         self._workdir = workdir
         self._workdir.mkdir(parents=True, exist_ok=True)
+        self._restoring = False
+        self._resets = ResetScheduler(self._tasks.values)
 
         self.events = EventStream()
         self._min_sample_rows = 5
 
-        self.events.pipe(
-            rx.operators.filter(
-                lambda e: e.event == "status" and e.value == Status.READY
-            ),
-            rx.operators.map(lambda e: e.task),
-        ).subscribe(self._on_task_ready)
+        self.preview_rows = preview_rows
+        """The number of input rows that tasks are previewed on, or None if
+        tasks are not previewed."""
+        self._previews = {}
+        self.output_options = dict(output_options or {})
+
+        self.files = WorkdirManager(
+            workdir, None if disk_quota_mb is None else disk_quota_mb * 1024 ** 2
+        )
+        self._evicting = set()
+
+        self._subscriptions = [
+            self.events.pipe(
+                rx.operators.filter(_is_ready_event),
+                rx.operators.map(lambda e: e.task),
+            ).subscribe(self._on_task_ready),
+            self.events.pipe(
+                rx.operators.filter(lambda e: e.event in DEFINITION_EVENTS),
+            ).subscribe(lambda _: self.save()),
+            self.events.pipe(
+                rx.operators.filter(lambda e: _has_event(e, "reset")),
+                rx.operators.map(lambda e: e.task),
+            ).subscribe(self.files.discard_stale),
+            self.events.pipe(
+                rx.operators.filter(lambda e: _has_event(e, "status")),
+            ).subscribe(self._on_task_status),
+        ]
+
+    @property
+    def manifest_path(self) -> Path:
+        """Get the path to the file that stores the pipeline's definition."""
+        return self._workdir / MANIFEST_NAME
+
+    def save(self):
+        """Write the definition of every task in the pipeline to the manifest."""
+        if self._restoring:
+            return
+
+        definitions = [_definition(task) for task in self]
+        with open(self.manifest_path, "w", encoding="utf-8") as manifest:
+            json.dump({"tasks": definitions}, manifest, default=_unwrap)
+
+    def restore(self):
+        """Recreate the tasks defined in the pipeline's manifest, if there is one."""
+        if not self.manifest_path.is_file():
+            return
+
+        with open(self.manifest_path, "r", encoding="utf-8") as manifest:
+            pending = json.load(manifest)["tasks"]
+
+        self._restoring = True
+        try:
+            with self._resets.hold():
+                # Sources have to exist before the tasks that read from them
+                while pending:
+                    ready = [
+                        d
+                        for d in pending
+                        if all(ref in self._tasks for ref in _references(d))
+                    ]
+                    if not ready:
+                        raise Exception("Pipeline manifest contains a cycle")
+                    for definition in ready:
+                        pending.remove(definition)
+                        self.create_task(**definition)
+
+                for task in self:
+                    task.request_reset("Restored")
+        finally:
+            self._restoring = False
+
+        self.files.collect_garbage(self)
+
+    def close(self):
+        """Stop watching the pipeline's tasks and release the resources they hold.
+
+        The pipeline cannot be used once it has been closed, but it can be
+        recreated from its manifest by a new Pipeline instance.
+        """
+        for subscription in self._subscriptions:
+            subscription.dispose()
+        self._subscriptions = []
+        self._resets.close()
+
+        for task in list(self):
+            self.events.unwatch(task)
+            task.close()
+
+        self._tasks.clear()
+        self._previews = {}
+        self.events.dispose()
 
     def _get_id(self):
         next_id = self._counter
@@ -50,10 +293,10 @@ class Pipeline(Mapping):
         elif id >= self._counter:
             self._counter = id + 1
 
-        if "source" in kwargs and kwargs["source"] is not None:
-            kwargs["source"] = self.get_task(kwargs["source"])
-
+        self._resolve_references(kwargs)
         task = cls(id=id, workdir=self._workdir, **kwargs)
+        task.scheduler = self._resets
+        task.output_defaults = self.output_options
         self._tasks[id] = task
 
         self.events.broadcast("created", task)
@@ -65,16 +308,162 @@ class Pipeline(Mapping):
         """Retrieve a task in the pipeline."""
         return self._tasks[task_id]
 
+    def update_task(self, task_id: int, updates: dict) -> Task:
+        """Apply changes to the configuration of a task in the pipeline."""
+        task = self.get_task(task_id)
+
+        self._resolve_references(updates)
+        task.update(updates)
+        return task
+
+    def _resolve_references(self, args: dict):
+        """Replace the IDs of the tasks that a task reads from with the tasks."""
+        if args.get("source") is not None:
+            args["source"] = self.get_task(args["source"])
+        if args.get("inputs") is not None:
+            args["inputs"] = [self.get_task(task_id) for task_id in args["inputs"]]
+
     def remove_task(self, task_id: int) -> Task:
         """Remove a task from the pipeline."""
+        task = self._detach_task(task_id)
+        self._dispose_task(task)
+        return task
+
+    def _detach_task(self, task_id: int) -> Task:
+        """Take a task out of the pipeline without releasing its resources, so
+        that it can still be put back."""
         task = self._tasks.pop(task_id)
-        # disconnect task from sources
 
+        self._resets.cancel(task)
+        self._previews.pop(task_id, None)
         self.events.unwatch(task)
         self.events.broadcast("deleted", task)
-
         return task
 
+    def _reattach_task(self, task: Task):
+        """Put back a task that was taken out of the pipeline."""
+        self._tasks[task.id] = task
+        self.events.broadcast("created", task)
+        self.events.watch(task)
+
+    def _dispose_task(self, task: Task):
+        task.close()
+        self.files.discard(task)
+
+    @contextmanager
+    def batch(self):
+        """Group a series of changes to the pipeline.
+
+        Tasks affected by the changes are reset only once, after all of the
+        changes have been made, and observers receive a single summary event per
+        task instead of an event for every intermediate state.
+        """
+        with self.events.hold(), self._resets.hold():
+            yield self
+
+    def apply_batch(self, operations: Iterable[Mapping[str, Any]]) -> List[Task]:
+        """Create, update and delete tasks as a single batch.
+
+        Each operation is a mapping whose "op" key is "create", "update" or
+        "delete". The remaining keys of a "create" operation are the arguments for
+        create_task(), those of an "update" operation are the ID of the task and
+        the changes to apply to it, and a "delete" operation only needs an ID.
+        Tasks created earlier in a batch can be referenced by later operations if
+        their ID is given explicitly.
+
+        Every operation is checked before any of them are applied, and a
+        BatchError is raised if one refers to a task that is not defined at that
+        point or would make a task read from itself. If an operation fails while
+        it is being applied, the operations before it are undone before the
+        error is raised again. Either way, the pipeline is left unchanged.
+        Returns the task that each operation was applied to.
+        """
+        operations = [dict(operation) for operation in operations]
+        self._check_batch(operations)
+
+        tasks = []
+        undo: List[Callable[[], Any]] = []
+        removed = []
+        counter = self._counter
+        with self.batch():
+            try:
+                for operation in operations:
+                    kind = operation.pop("op")
+                    if kind == "create":
+                        task = self.create_task(**operation)
+                        undo.append(lambda task=task: self._discard_created(task))
+                    elif kind == "update":
+                        task = self.get_task(operation.pop("id"))
+                        undo.append(_restorer(task))
+                        self.update_task(task.id, operation)
+                    else:
+                        task = self._detach_task(operation["id"])
+                        removed.append(task)
+                        undo.append(lambda task=task: self._reattach_task(task))
+                    tasks.append(task)
+            except Exception:
+                for action in reversed(undo):
+                    action()
+                self._counter = counter
+                raise
+
+        # Deleted tasks keep their resources until the batch can no longer be
+        # undone
+        for task in removed:
+            self._dispose_task(task)
+        return tasks
+
+    def _discard_created(self, task: Task):
+        self._detach_task(task.id)
+        self._dispose_task(task)
+
+    def _check_batch(self, operations: List[dict]):
+        # The tasks that each task reads from, as the batch would leave them
+        links = {}
+        for task in self:
+            definition = _definition(task)
+            links[task.id] = {key: definition.get(key) for key in LINK_KEYS}
+        counter = self._counter
+
+        for position, operation in enumerate(operations):
+            kind = operation.get("op")
+            task_id = operation.get("id")
+
+            if kind not in BATCH_OPERATIONS:
+                raise BatchError(position, f"Unknown operation {kind!r}")
+
+            if kind == "create":
+                if "type" not in operation:
+                    raise BatchError(position, "No task type given")
+                try:
+                    self._types[operation["type"]]
+                except LookupError as err:
+                    raise BatchError(position, str(err)) from err
+                if task_id is None:
+                    task_id = counter
+                elif task_id in links:
+                    raise BatchError(position, f"Task {task_id} is already defined")
+
+            elif task_id not in links:
+                raise BatchError(position, f"Task {task_id} is not defined")
+
+            # A task being created isn't defined yet, so it can't read from itself
+            for source in _references(operation):
+                if source not in links:
+                    raise BatchError(position, f"Task {source} is not defined")
+
+            if kind == "create":
+                counter = max(counter, task_id + 1)
+                links[task_id] = {key: operation.get(key) for key in LINK_KEYS}
+            elif kind == "update":
+                links[task_id].update(
+                    {key: operation[key] for key in LINK_KEYS if key in operation}
+                )
+                if _reads_from(links, task_id, task_id):
+                    raise BatchError(position, f"Task {task_id} would read from itself")
+            else:
+                del links[task_id]
+
     def __getitem__(self, task_id: int) -> Task:
         return self.get_task(task_id)
 
@@ -87,9 +476,124 @@ class Pipeline(Mapping):
     def __len__(self):
         return len(self._tasks)
 
+    def disk_usage(self) -> dict:
+        """Summarize the disk space used by the files of the pipeline's tasks."""
+        return self.files.stats(self)
+
+    def _on_task_status(self, event):
+        task, status = event.task, _event_value(event, "status")
+        self.files.on_status(task, status)
+        if status != Status.COMPLETE or task.id not in self._tasks:
+            return
+
+        task.update_stats(disk_bytes=self.files.usage(task))
+        self.files.enforce_quota(list(self), self._evict, keep=task)
+
+    def _evict(self, task: Task):
+        """Discard a task's results to free disk space, without resetting the
+        tasks that read from it. The task runs again the next time its results
+        are requested."""
+        self._evicting.add(task.id)
+        try:
+            task.on_reset("Evicted")
+        finally:
+            self._evicting.discard(task.id)
+        self.events.broadcast("evicted", task)
+
     def _on_task_ready(self, task: Task):
+        if task.id in self._evicting:
+            return
+        if self.preview_rows:
+            asyncio.create_task(self._publish_preview(task))
         asyncio.create_task(self._get_sample_rows(task))
 
+    async def preview(self, task: Task) -> Optional[Preview]:
+        """Compute a task's results for a sample of the pipeline's input rows.
+
+        Tasks that read no other task's data are sampled directly if they can
+        be, and otherwise once their results are complete. Every other task is
+        previewed on the previews of its sources.
+        Previews are computed once per task generation. Returns None if the task
+        can't be previewed.
+        """
+        generation, future = self._previews.get(task.id, (None, None))
+        if future is None or generation != task.generation:
+            generation = task.generation
+            future = asyncio.ensure_future(self._compute_preview(task))
+            self._previews[task.id] = (generation, future)
+        return await asyncio.shield(future)
+
+    async def _compute_preview(self, task: Task) -> Optional[Preview]:
+        generation = task.generation
+        sources = task.sources()
+
+        if not sources:
+            return await self._sample(task)
+
+        inputs = [await self.preview(source) for source in sources]
+        if any(preview is None for preview in inputs):
+            return None
+        if generation != task.generation or unwrap(task.schema) is None:
+            return None
+
+        start = time.perf_counter()
+        batch = task.preview([preview.batch for preview in inputs])
+        seconds = time.perf_counter() - start
+        if batch is None:
+            return None
+        fraction = min(preview.fraction for preview in inputs)
+        return Preview(batch, fraction, seconds)
+
+    async def _sample(self, task: Task) -> Preview:
+        """Preview a task that reads no other task's data with a sample of its
+        results, read directly if the task supports it."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        sampled = await loop.run_in_executor(None, task.sample, self.preview_rows)
+        if sampled is not None:
+            batch, fraction = sampled
+            return Preview(batch, fraction, time.perf_counter() - start)
+
+        # Wait for the task's results, running it if nothing else is
+        try:
+            await task.batches([]).__anext__()
+        except StopAsyncIteration:
+            pass
+        table = await task.get_table()
+        batch = sample_table(table, self.preview_rows)
+        fraction = batch.num_rows / table.num_rows if table.num_rows else 1.0
+        seconds = self.files.run_seconds.get(task.id, 0.0) * fraction
+        return Preview(batch, fraction, seconds)
+
+    async def _publish_preview(self, task: Task):
+        generation = task.generation
+        try:
+            preview = await self.preview(task)
+        except Exception as err:  # pylint: disable=broad-except
+            # A preview that fails does not stop the full run
+            self.events.broadcast("preview", task, {"error": str(err)})
+            return
+
+        if preview is None or generation != task.generation:
+            return
+
+        batch = preview.batch
+        names = batch.schema.names
+        rows = iter_rows(batch.slice(0, PREVIEW_EVENT_ROWS))
+        self.events.broadcast(
+            "preview",
+            task,
+            {
+                "rows": [dict(zip(names, row)) for row in rows],
+                "num_rows": batch.num_rows,
+                "fraction": preview.fraction,
+                "seconds": preview.seconds,
+                "estimated_seconds": (
+                    preview.seconds / preview.fraction if preview.fraction else None
+                ),
+            },
+        )
+
     async def _get_sample_rows(self, task: Task):
         count = 0
         async for row in task.rows():
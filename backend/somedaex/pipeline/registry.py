@@ -0,0 +1,113 @@
+"""The registry module defines the PipelineRegistry class and associated
+exceptions."""
+
+from collections.abc import Mapping
+from pathlib import Path
+import re
+import time
+from typing import Iterator, List
+
+from .index import TypeIndex
+from .pipeline import MANIFEST_NAME, Pipeline
+
+
+VALID_NAME = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+
+class InvalidPipelineName(ValueError):
+    """An InvalidPipelineName error is raised when a pipeline name cannot be used
+    as the name of a directory inside the registry's working directory."""
+
+    def __init__(self, name):
+        super().__init__(f"'{name}' is not a valid pipeline name")
+        self.name = name
+
+
+class PipelineRegistry(Mapping[str, Pipeline]):
+    """A PipelineRegistry manages a collection of named pipelines, each of which
+    has its own subdirectory of the registry's working directory.
+
+    Pipelines are loaded from disk the first time they are accessed, and pipelines
+    that have not been accessed for a while can be released to free the memory
+    maps and subscriptions they hold. A released pipeline is transparently
+    restored from its manifest the next time it is accessed.
+
+    Any other arguments, such as the number of preview rows, are passed to
+    every pipeline the registry creates.
+    """
+
+    def __init__(self, index: TypeIndex, workdir: Path, **pipeline_options):
+        self._types = index
+        self._workdir = workdir
+        self._pipeline_options = pipeline_options
+        self._workdir.mkdir(parents=True, exist_ok=True)
+        self._loaded = {}
+        self._last_access = {}
+
+    def __len__(self):
+        return len(self.names())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names())
+
+    def __getitem__(self, name: str) -> Pipeline:
+        return self.get_pipeline(name)
+
+    def __contains__(self, name) -> bool:
+        try:
+            path = self._path(name)
+        except InvalidPipelineName:
+            return False
+        return name in self._loaded or (path / MANIFEST_NAME).is_file()
+
+    def _path(self, name: str) -> Path:
+        if not isinstance(name, str) or not VALID_NAME.fullmatch(name):
+            raise InvalidPipelineName(name)
+        return self._workdir / name
+
+    def names(self) -> List[str]:
+        """List the names of every pipeline in the registry, including those that
+        are not currently loaded."""
+        on_disk = {
+            entry.name
+            for entry in self._workdir.iterdir()
+            if (entry / MANIFEST_NAME).is_file()
+        }
+        return sorted(on_disk | set(self._loaded))
+
+    def get_pipeline(self, name: str) -> Pipeline:
+        """Retrieve the pipeline with the given name, loading it from disk or
+        creating it if necessary."""
+        path = self._path(name)
+        self._last_access[name] = time.monotonic()
+
+        if name not in self._loaded:
+            pipeline = Pipeline(self._types, path, **self._pipeline_options)
+            pipeline.restore()
+            self._loaded[name] = pipeline
+
+        return self._loaded[name]
+
+    def is_loaded(self, name: str) -> bool:
+        """Check whether the named pipeline is currently held in memory."""
+        return name in self._loaded
+
+    def touch(self, name: str):
+        """Record that the named pipeline is still in use."""
+        if name in self._loaded:
+            self._last_access[name] = time.monotonic()
+
+    def release(self, name: str):
+        """Close the named pipeline and drop it from memory. Its definition stays
+        on disk, so it will be restored the next time it is accessed."""
+        pipeline = self._loaded.pop(name, None)
+        self._last_access.pop(name, None)
+        if pipeline is not None:
+            pipeline.save()
+            pipeline.close()
+
+    def idle(self, timeout: float) -> List[str]:
+        """List the names of loaded pipelines that have not been accessed within
+        the given number of seconds."""
+        cutoff = time.monotonic() - timeout
+        return [name for name in self._loaded if self._last_access[name] < cutoff]
@@ -0,0 +1,172 @@
+"""The resets module defines ResetScheduler, which decides when the tasks in a
+pipeline are reset in response to changes in their configuration or inputs."""
+
+import asyncio
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Set
+
+from .task import Task
+
+
+RESET_DELAY = 0.25
+"""The number of seconds to wait for further reset requests before resetting the
+tasks that have been requested so far."""
+
+MAX_RESET_DELAY = 1.0
+"""The maximum number of seconds that a reset request can be deferred while
+further requests keep arriving."""
+
+
+def topological_order(tasks: Iterable[Task]) -> List[Task]:
+    """Sort tasks so that every task comes after the tasks it reads from. Sources
+    that are not among the given tasks are ignored."""
+    remaining = list(tasks)
+    members = set(remaining)
+    ordered = []
+    placed = set()
+
+    while remaining:
+        ready = [
+            task
+            for task in remaining
+            if all(s in placed or s not in members for s in task.sources())
+        ]
+        if not ready:
+            raise Exception("The task graph contains a cycle")
+        for task in ready:
+            remaining.remove(task)
+            placed.add(task)
+            ordered.append(task)
+
+    return ordered
+
+
+class ResetScheduler:
+    """A ResetScheduler receives requests to reset tasks and decides when to carry
+    them out.
+
+    Requests are debounced: the scheduler waits briefly for further requests
+    before acting on them, so a burst of edits results in a single round of
+    resets. A round resets every requested task and everything downstream of it
+    exactly once, upstream tasks first. While the scheduler is held, requests are
+    collected without starting the timer, and the round happens as soon as the
+    last hold is released.
+    """
+
+    def __init__(
+        self,
+        tasks: Callable[[], Iterable[Task]],
+        delay=RESET_DELAY,
+        max_delay=MAX_RESET_DELAY,
+    ):
+        self._tasks = tasks
+        self.delay = delay
+        self.max_delay = max_delay
+        self._holds = 0
+        self._pending = {}
+        self._flushing = set()
+        self._timer: asyncio.TimerHandle = None
+        self._first_request_time = None
+
+    @property
+    def held(self) -> bool:
+        """Whether reset requests are currently being deferred."""
+        return self._holds > 0
+
+    def request(self, task: Task, reason):
+        """Ask for a task to be reset."""
+        if task in self._flushing:
+            # The task will be reset later in the current round, once its sources
+            # have been reset.
+            return
+
+        self._pending.setdefault(task, reason)
+        if not self.held:
+            self._schedule()
+
+    def request_readers(self, task: Task, reason):
+        """Ask for the tasks that read from a task to be reset, but not the task
+        itself."""
+        for reader in self._tasks():
+            if task in reader.sources():
+                self.request(reader, reason)
+
+    def cancel(self, task: Task):
+        """Forget any pending reset request for a task, such as when the task is
+        removed from its pipeline."""
+        self._pending.pop(task, None)
+
+    def close(self):
+        """Discard all pending requests."""
+        self._cancel_timer()
+        self._pending = {}
+
+    @contextmanager
+    def hold(self):
+        """Defer reset requests until the end of the context."""
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+            if not self.held:
+                self.flush()
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Without an event loop there is nothing to wait on
+            self.flush()
+            return
+
+        now = loop.time()
+        first_request_time = self._first_request_time
+        if first_request_time is None:
+            first_request_time = now
+        deadline = min(now + self.delay, first_request_time + self.max_delay)
+
+        self._cancel_timer()
+        self._first_request_time = first_request_time
+        self._timer = loop.call_at(deadline, self.flush)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._first_request_time = None
+
+    def downstream(self, tasks: Iterable[Task]) -> Set[Task]:
+        """Find the given tasks and every task that directly or indirectly reads
+        from one of them."""
+        affected = set(tasks)
+        graph = list(self._tasks())
+
+        changed = True
+        while changed:
+            changed = False
+            for task in graph:
+                if task in affected:
+                    continue
+                if any(source in affected for source in task.sources()):
+                    affected.add(task)
+                    changed = True
+
+        return affected
+
+    def flush(self):
+        """Carry out every pending reset request."""
+        self._cancel_timer()
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        affected = self.downstream(pending)
+        self._flushing = set(affected)
+        try:
+            for task in topological_order(affected):
+                self._flushing.discard(task)
+                reason = pending.get(task, "Source changed")
+                task.reset.on_next(reason)
+        finally:
+            self._flushing = set()
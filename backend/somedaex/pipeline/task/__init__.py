@@ -1,7 +1,16 @@
 """The task package provides base classes for defining tasks."""
 
+from .aggregate import Aggregation, HashAggregator
+from .cache import table_cache, TableCache
+from .dataset import DatasetTask
+from .hashjoin import HashJoin
+from .memo import Memo
 from .monadic import MonadicTask
 from .niladic import NiladicTask
-from .rowwise import OneToOneRowwiseTask, RowwiseTask
+from .polyadic import PolyadicTask
+from .producer import Producer
+from .rowwise import OneToManyRowwiseTask, OneToOneRowwiseTask, RowwiseTask
+from .sample import Bernoulli, Reservoir, sample_table
+from .sort import ExternalSort, TopK
 from .status import Status
-from .task import Task
+from .task import BatchIterator, RowIterator, Task
@@ -0,0 +1,445 @@
+"""The aggregate module defines HashAggregator, which summarizes groups of rows
+without having to hold every row in memory at once."""
+
+from pathlib import Path
+import shutil
+from typing import Iterator, List, NamedTuple, Optional
+
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.types
+
+from ...arrow_util import (
+    ArrowStreamReader,
+    ArrowStreamWriter,
+    concat_batches,
+    group_rows,
+)
+from ...minhash import hash_rows
+
+
+AGGREGATE_FUNCTIONS = ("count", "sum", "mean", "min", "max", "distinct")
+NUMERIC_FUNCTIONS = ("sum", "mean", "min", "max")
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 ** 2
+"""The number of bytes of partial aggregates a HashAggregator holds in memory
+before it starts spilling partitions to disk."""
+
+NUM_PARTITIONS = 16
+COMBINE_THRESHOLD = 8
+"""The number of partial aggregates that a partition buffers before combining
+them into one."""
+
+_REDUCERS = {
+    "n": numpy.add,
+    "sum": numpy.add,
+    "min": numpy.minimum,
+    "max": numpy.maximum,
+}
+
+
+class Aggregation(NamedTuple):
+    """An Aggregation summarizes one column of each group, or counts the rows in
+    each group if it has no column."""
+
+    function: str
+    column: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        """The name of the column that holds the aggregation's results."""
+        if self.column is None:
+            return self.function
+        return f"{self.column}_{self.function}"
+
+
+def is_numeric(data_type: pyarrow.DataType) -> bool:
+    """Check whether a column of the given type can be summed and averaged."""
+    return (
+        pyarrow.types.is_integer(data_type)
+        or pyarrow.types.is_floating(data_type)
+        or pyarrow.types.is_boolean(data_type)
+    )
+
+
+def _state_type(data_type: pyarrow.DataType) -> pyarrow.DataType:
+    if pyarrow.types.is_floating(data_type):
+        return pyarrow.float64()
+    return pyarrow.int64()
+
+
+def output_schema(
+    schema: pyarrow.Schema, keys: List[str], aggregations: List[Aggregation]
+) -> pyarrow.Schema:
+    """Get the schema of the results of aggregating data with the given schema."""
+    fields = [schema.field(key) for key in keys]
+    for aggregation in aggregations:
+        if aggregation.function in ("count", "distinct"):
+            data_type = pyarrow.int64()
+        elif aggregation.function == "mean":
+            data_type = pyarrow.float64()
+        elif aggregation.function == "sum":
+            data_type = _state_type(schema.field(aggregation.column).type)
+        else:
+            data_type = schema.field(aggregation.column).type
+        fields.append(pyarrow.field(aggregation.name, data_type))
+    return pyarrow.schema(fields)
+
+
+def _empty_batch(schema: pyarrow.Schema) -> pyarrow.RecordBatch:
+    return pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array([], type=field.type) for field in schema], schema=schema
+    )
+
+
+class _Stream(NamedTuple):
+    """A stream of partial aggregates that share a schema. The first num_keys
+    columns identify a group, and each of the remaining columns is combined with
+    the reducer for its kind of state."""
+
+    schema: pyarrow.Schema
+    num_keys: int
+    kinds: List[str]
+
+
+class _Partition:
+    def __init__(self, number: int, num_streams: int):
+        self.number = number
+        self.buffers: List[List[pyarrow.RecordBatch]] = [
+            [] for _ in range(num_streams)
+        ]
+        self.spills: List[Optional[ArrowStreamWriter]] = [None] * num_streams
+        self.spill_paths: List[Optional[Path]] = [None] * num_streams
+        self.num_bytes = 0
+
+
+class HashAggregator:
+    """A HashAggregator groups rows by the values of key columns and summarizes
+    the other columns of each group.
+
+    Each batch of rows is reduced to partial aggregates, one row per group, which
+    are divided among partitions by the hash of their keys. When a partition has
+    buffered several partial aggregates, they are combined into one. When the
+    partial aggregates held in memory exceed the memory budget, the largest
+    partitions are spilled to files in the spill directory. The results are
+    produced one partition at a time, so only one partition needs to fit in
+    memory at the end.
+
+    Distinct counts keep one row per distinct key and value, in a separate stream
+    of partial aggregates that is partitioned the same way.
+    """
+
+    def __init__(
+        self,
+        schema: pyarrow.Schema,
+        keys: List[str],
+        aggregations: List[Aggregation],
+        spill_dir: Path,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        num_partitions: int = NUM_PARTITIONS,
+    ):
+        self.keys = list(keys)
+        self.aggregations = list(aggregations)
+        self.schema = output_schema(schema, keys, aggregations)
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.num_partitions = num_partitions if keys else 1
+
+        key_fields = [schema.field(key) for key in keys]
+        fields = key_fields + [pyarrow.field("rows", pyarrow.int64())]
+        kinds = ["n"]
+        self._distinct: List[Aggregation] = []
+        for aggregation in self.aggregations:
+            if aggregation.function == "distinct":
+                self._distinct.append(aggregation)
+                continue
+            if aggregation.column is None:
+                continue
+
+            kinds.append("n")
+            fields.append(pyarrow.field(f"{len(fields)}", pyarrow.int64()))
+            if aggregation.function in NUMERIC_FUNCTIONS:
+                kind = "sum" if aggregation.function == "mean" else aggregation.function
+                data_type = _state_type(schema.field(aggregation.column).type)
+                kinds.append(kind)
+                fields.append(pyarrow.field(f"{len(fields)}", data_type))
+
+        self._streams = [_Stream(pyarrow.schema(fields), len(keys), kinds)]
+        for aggregation in self._distinct:
+            distinct_fields = key_fields + [schema.field(aggregation.column)]
+            self._streams.append(
+                _Stream(pyarrow.schema(distinct_fields), len(keys) + 1, [])
+            )
+
+        self._partitions = [
+            _Partition(number, len(self._streams))
+            for number in range(self.num_partitions)
+        ]
+        self.num_bytes = 0
+        self.num_spills = 0
+        self.spilled_bytes = 0
+
+    def add(self, batch: pyarrow.RecordBatch):
+        """Aggregate a batch of rows."""
+        if batch.num_rows == 0:
+            return
+
+        for number, stream in enumerate(self._streams):
+            states = self._combine(self._initial_states(batch, number), stream)
+            partitions = self._partition_numbers(states)
+            for partition in self._partitions:
+                if self.num_partitions == 1:
+                    part = states
+                else:
+                    part = states.filter(pyarrow.array(partitions == partition.number))
+                if part.num_rows > 0:
+                    self._buffer(partition, number, part)
+
+        if self.num_bytes > self.memory_budget:
+            self._reduce_memory()
+
+    def preview(self, max_rows: int) -> pyarrow.RecordBatch:
+        """Get up to the given number of rows of approximate results, computed
+        from the partial aggregates that are held in memory. Groups that have
+        been spilled to disk may be missing or incomplete."""
+        batches = []
+        num_rows = 0
+        for partition in self._partitions:
+            if num_rows >= max_rows:
+                break
+            self._compact(partition)
+            states = [
+                self._concat(buffers, stream)
+                for buffers, stream in zip(partition.buffers, self._streams)
+            ]
+            batch = self._finalize(*states)
+            batches.append(batch.slice(0, max_rows - num_rows))
+            num_rows += batches[-1].num_rows
+
+        return self._concat(batches)
+
+    def results(self) -> Iterator[pyarrow.RecordBatch]:
+        """Produce the final aggregates, one partition at a time."""
+        for partition in self._partitions:
+            states = []
+            for number, stream in enumerate(self._streams):
+                batches = self._read_spill(partition, number)
+                batches.extend(partition.buffers[number])
+                partition.buffers[number] = []
+                states.append(self._combine(self._concat(batches, stream), stream))
+
+            self.num_bytes -= partition.num_bytes
+            partition.num_bytes = 0
+            batch = self._finalize(*states)
+            if batch.num_rows > 0:
+                yield batch
+
+    def stats(self) -> dict:
+        """Summarize the aggregator's use of memory and disk."""
+        return {
+            "memory_bytes": self.num_bytes,
+            "spills": self.num_spills,
+            "spilled_bytes": self.spilled_bytes,
+        }
+
+    def close(self):
+        """Delete any partitions that were spilled to disk."""
+        for partition in self._partitions:
+            for writer in partition.spills:
+                if writer is not None:
+                    writer.close()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _initial_states(self, batch: pyarrow.RecordBatch, stream_number: int):
+        """Convert rows into partial aggregates of one row each."""
+        keys = [batch.column(key) for key in self.keys]
+
+        if stream_number > 0:
+            aggregation = self._distinct[stream_number - 1]
+            columns = keys + [batch.column(aggregation.column)]
+            return pyarrow.RecordBatch.from_arrays(
+                columns, schema=self._streams[stream_number].schema
+            )
+
+        columns = keys + [pyarrow.array(numpy.ones(batch.num_rows, numpy.int64))]
+        for aggregation in self.aggregations:
+            if aggregation.function == "distinct" or aggregation.column is None:
+                continue
+
+            column = batch.column(aggregation.column)
+            columns.append(pyarrow.compute.cast(column.is_valid(), pyarrow.int64()))
+            if aggregation.function in NUMERIC_FUNCTIONS:
+                data_type = _state_type(column.type)
+                values = pyarrow.compute.cast(column, data_type)
+                columns.append(
+                    values.fill_null(_fill_value(aggregation.function, data_type))
+                )
+
+        return pyarrow.RecordBatch.from_arrays(
+            columns, schema=self._streams[0].schema
+        )
+
+    @staticmethod
+    def _combine(batch: pyarrow.RecordBatch, stream: _Stream):
+        """Combine the partial aggregates that belong to the same group."""
+        if batch.num_rows == 0:
+            return batch
+
+        keys = batch.columns[: stream.num_keys]
+        first_rows, groups = group_rows(keys, batch.num_rows)
+        if len(first_rows) == batch.num_rows:
+            return batch
+
+        # Sort the rows by group so that each group's states can be reduced at once
+        order = numpy.argsort(groups, kind="stable")
+        starts = numpy.flatnonzero(numpy.diff(groups[order], prepend=-1))
+
+        first_rows = pyarrow.array(first_rows)
+        columns = [key.take(first_rows) for key in keys]
+        for column, kind in zip(batch.columns[stream.num_keys :], stream.kinds):
+            values = column.to_numpy(zero_copy_only=False)[order]
+            columns.append(pyarrow.array(_REDUCERS[kind].reduceat(values, starts)))
+
+        return pyarrow.RecordBatch.from_arrays(columns, schema=stream.schema)
+
+    def _partition_numbers(self, states: pyarrow.RecordBatch) -> numpy.ndarray:
+        if self.num_partitions == 1:
+            return numpy.zeros(states.num_rows, dtype=numpy.int64)
+
+        hashes = hash_rows(states.columns[: len(self.keys)])
+        return (hashes % numpy.uint64(self.num_partitions)).astype(numpy.int64)
+
+    def _buffer(self, partition: _Partition, number: int, states):
+        partition.buffers[number].append(states)
+        partition.num_bytes += states.nbytes
+        self.num_bytes += states.nbytes
+
+        if len(partition.buffers[number]) >= COMBINE_THRESHOLD:
+            self._compact(partition)
+
+    def _compact(self, partition: _Partition):
+        """Combine the partial aggregates buffered by a partition."""
+        num_bytes = 0
+        for number, stream in enumerate(self._streams):
+            buffers = partition.buffers[number]
+            if len(buffers) > 1:
+                buffers = [self._combine(self._concat(buffers, stream), stream)]
+                partition.buffers[number] = buffers
+            num_bytes += sum(states.nbytes for states in buffers)
+
+        self.num_bytes += num_bytes - partition.num_bytes
+        partition.num_bytes = num_bytes
+
+    def _reduce_memory(self):
+        for partition in self._partitions:
+            self._compact(partition)
+
+        while self.num_bytes > self.memory_budget / 2:
+            largest = max(self._partitions, key=lambda p: p.num_bytes)
+            if largest.num_bytes == 0:
+                break
+            self._spill(largest)
+
+    def _spill(self, partition: _Partition):
+        """Write a partition's buffered partial aggregates to disk."""
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+        for number, stream in enumerate(self._streams):
+            if not partition.buffers[number]:
+                continue
+            if partition.spills[number] is None:
+                path = self.spill_dir / f"{partition.number}-{number}.arrows"
+                partition.spill_paths[number] = path
+                partition.spills[number] = ArrowStreamWriter(path, stream.schema)
+            for states in partition.buffers[number]:
+                partition.spills[number].write(states)
+            partition.buffers[number] = []
+
+        self.num_bytes -= partition.num_bytes
+        self.spilled_bytes += partition.num_bytes
+        self.num_spills += 1
+        partition.num_bytes = 0
+
+    def _read_spill(self, partition: _Partition, number: int):
+        writer = partition.spills[number]
+        if writer is None:
+            return []
+
+        writer.close()
+        partition.spills[number] = None
+        reader = ArrowStreamReader(partition.spill_paths[number])
+        batches = list(reader)
+        reader.close()
+        return batches
+
+    def _concat(self, batches: List[pyarrow.RecordBatch], stream: _Stream = None):
+        schema = self.schema if stream is None else stream.schema
+        batches = [batch for batch in batches if batch.num_rows > 0]
+        if not batches:
+            return _empty_batch(schema)
+        return concat_batches(batches)
+
+    def _finalize(self, main: pyarrow.RecordBatch, *distinct: pyarrow.RecordBatch):
+        """Turn a partition's combined partial aggregates into results."""
+        num_keys = len(self.keys)
+        columns = main.columns[:num_keys]
+        num_rows = main.column(num_keys)
+        states = iter(main.columns[num_keys + 1 :])
+        distinct = iter(distinct)
+
+        fields = list(self.schema)[num_keys:]
+        for aggregation, field in zip(self.aggregations, fields):
+            if aggregation.function == "distinct":
+                columns.append(self._count_distinct(main, next(distinct)))
+                continue
+            if aggregation.column is None:
+                columns.append(num_rows)
+                continue
+
+            valid = next(states)
+            if aggregation.function == "count":
+                columns.append(valid)
+                continue
+
+            values = next(states).to_numpy(zero_copy_only=False)
+            valid = valid.to_numpy(zero_copy_only=False)
+            if aggregation.function == "mean":
+                with numpy.errstate(invalid="ignore", divide="ignore"):
+                    values = values / valid
+            column = pyarrow.array(values, mask=valid == 0)
+            columns.append(pyarrow.compute.cast(column, field.type))
+
+        return pyarrow.RecordBatch.from_arrays(columns, schema=self.schema)
+
+    def _count_distinct(self, main: pyarrow.RecordBatch, values: pyarrow.RecordBatch):
+        """Count the distinct values of each group in the main partial aggregates,
+        aligning the groups without a join by grouping both sets of keys at once."""
+        num_keys = len(self.keys)
+        values = values.filter(values.column(num_keys).is_valid())
+
+        if num_keys == 0:
+            return pyarrow.array([values.num_rows] * main.num_rows, pyarrow.int64())
+
+        keys = [
+            pyarrow.concat_arrays([main.column(i), values.column(i)])
+            for i in range(num_keys)
+        ]
+        _, groups = group_rows(keys, main.num_rows + values.num_rows)
+        counts = numpy.bincount(
+            groups[main.num_rows :], minlength=main.num_rows + values.num_rows
+        )
+        return pyarrow.array(counts[groups[: main.num_rows]], pyarrow.int64())
+
+
+def _fill_value(function: str, data_type: pyarrow.DataType):
+    """Get the value that stands in for nulls, which must not affect the result of
+    the aggregation."""
+    floating = pyarrow.types.is_floating(data_type)
+    if function == "min":
+        value = numpy.inf if floating else numpy.iinfo(numpy.int64).max
+    elif function == "max":
+        value = -numpy.inf if floating else numpy.iinfo(numpy.int64).min
+    else:
+        value = 0
+    return pyarrow.scalar(value, data_type)
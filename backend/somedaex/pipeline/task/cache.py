@@ -0,0 +1,110 @@
+"""The cache module defines TableCache, which limits the number of result tables
+that tasks keep open at the same time."""
+
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+DEFAULT_MAX_HANDLES = 256
+
+
+class CacheEntry(NamedTuple):
+    """A CacheEntry records the resources held by a task's open result table."""
+
+    num_bytes: int
+    num_handles: int
+
+
+class TableCache:
+    """A TableCache keeps track of the result tables that tasks hold open and the
+    bytes and file handles those tables occupy.
+
+    When either total exceeds its limit, the tables that were least recently
+    used are released. A task whose table has been released reopens it the next
+    time it is requested, which is counted as a miss.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_handles=DEFAULT_MAX_HANDLES):
+        self.max_bytes: Optional[int] = max_bytes
+        self.max_handles: Optional[int] = max_handles
+        self._entries: "OrderedDict[object, CacheEntry]" = OrderedDict()
+        self.num_bytes = 0
+        self.num_handles = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, task):
+        return task in self._entries
+
+    def configure(self, max_bytes: Optional[int] = None, max_handles=None):
+        """Change the cache's limits. A limit of None means unlimited."""
+        self.max_bytes = max_bytes
+        self.max_handles = max_handles
+        self._evict()
+
+    def hit(self, task) -> bool:
+        """Record a request for a task's table, returning True if the table is
+        still open."""
+        if task in self._entries:
+            self._entries.move_to_end(task)
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def add(self, task, num_bytes: int, num_handles: int = 1):
+        """Start tracking a table that a task has just opened, releasing other
+        tables if the cache is now over its limits."""
+        self.discard(task)
+        self._entries[task] = CacheEntry(num_bytes, num_handles)
+        self.num_bytes += num_bytes
+        self.num_handles += num_handles
+        self._evict(keep=task)
+
+    def discard(self, task):
+        """Stop tracking a task's table without asking the task to release it."""
+        entry = self._entries.pop(task, None)
+        if entry is not None:
+            self.num_bytes -= entry.num_bytes
+            self.num_handles -= entry.num_handles
+
+    def _over_limit(self) -> bool:
+        return (self.max_bytes is not None and self.num_bytes > self.max_bytes) or (
+            self.max_handles is not None and self.num_handles > self.max_handles
+        )
+
+    def _evict(self, keep=None):
+        while self._over_limit():
+            task = next(iter(self._entries))
+            if task is keep:
+                if len(self._entries) == 1:
+                    return
+                self._entries.move_to_end(task)
+                continue
+
+            self.discard(task)
+            task.release_table()
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Summarize the cache's contents, limits and counters."""
+        return {
+            "tables": len(self._entries),
+            "bytes": self.num_bytes,
+            "handles": self.num_handles,
+            "max_bytes": self.max_bytes,
+            "max_handles": self.max_handles,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+table_cache = TableCache()
+"""The cache shared by every task in the process."""
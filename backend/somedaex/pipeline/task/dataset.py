@@ -0,0 +1,151 @@
+"""The dataset module defines DatasetTask, the base class for all tasks that must
+see every row of their source before they can produce any results."""
+
+from abc import abstractmethod
+import asyncio
+import time
+from typing import Iterable, List, Optional, Protocol
+
+import pyarrow
+
+from ...arrow_util import ArrowFileWriter, concat_batches, iter_rows, select_columns
+from ...observableproxy import ObservableProperty, unwrap
+from .monadic import MonadicTask
+from .status import Status
+
+
+PARTIAL_INTERVAL = 1.0
+"""The minimum number of seconds between previews of a running task's results."""
+
+PARTIAL_ROWS = 100
+"""The maximum number of rows in a preview of a running task's results."""
+
+
+class Accumulator(Protocol):
+    """An Accumulator collects the rows of a dataset task's source during a single
+    run, and produces the task's results once every row has been added."""
+
+    def add(self, batch: pyarrow.RecordBatch):
+        """Add a batch of the source's rows."""
+
+    def preview(self, max_rows: int) -> Optional[pyarrow.RecordBatch]:
+        """Get approximate results from the rows added so far."""
+
+    def results(self) -> Iterable[pyarrow.RecordBatch]:
+        """Produce the results once every row has been added."""
+
+    def stats(self) -> dict:
+        """Summarize the accumulator's use of resources."""
+
+    def close(self):
+        """Release the accumulator's resources, such as temporary files."""
+
+
+class DatasetTask(MonadicTask):
+    """A dataset task processes all rows from its source task at the same time.
+
+    Each run streams the source's record batches into a new accumulator, and then
+    writes the accumulator's results to the task's result file. While the task
+    runs, it periodically publishes a preview of the results computed so far. A
+    run that is overtaken by a reset stops at the next batch, and its accumulator
+    is closed.
+    """
+
+    # Examples: Topic modeling, table joins
+
+    partial = ObservableProperty("A preview of the results computed so far.")
+
+    def __init__(self, **args):
+        super().__init__(**args)
+        self.partial = None
+
+    def on_reset(self, reason):
+        super().on_reset(reason)
+        self.partial = None
+
+    def source_columns(self) -> Optional[List[str]]:
+        """Get the names of the source columns that the task reads, or None if it
+        reads all of them."""
+        return self.input_columns()
+
+    @abstractmethod
+    def accumulator(self) -> Accumulator:
+        """Create an accumulator for a new run of the task."""
+
+    def _get_full_table(self):
+        return self._table_reader.read_table()
+
+    def _preview(self, inputs: List[pyarrow.RecordBatch]) -> pyarrow.RecordBatch:
+        accumulator = self.accumulator()
+        try:
+            accumulator.add(select_columns(inputs[0], self.source_columns()))
+            return concat_batches(list(accumulator.results()), unwrap(self.schema))
+        finally:
+            accumulator.close()
+
+    async def run(self):
+        if self.status in (Status.FINISHED, Status.COMPLETE):
+            return
+
+        generation = self.generation
+        self.status = Status.WORKING
+        accumulator = self.accumulator()
+
+        try:
+            num_rows = 0
+            published = time.monotonic()
+
+            source = unwrap(self.source)
+            async for batch in source.batches(self.source_columns()):
+                if generation != self.generation:
+                    return
+
+                accumulator.add(batch)
+                num_rows += batch.num_rows
+                self.update_stats(rows_read=num_rows, **accumulator.stats())
+
+                if time.monotonic() - published >= PARTIAL_INTERVAL:
+                    self._publish_partial(accumulator)
+                    published = time.monotonic()
+
+                # Let other tasks and requests proceed between batches
+                await asyncio.sleep(0)
+
+            if generation != self.generation:
+                return
+
+            writer = ArrowFileWriter(
+                self.file_path(),
+                unwrap(self.schema),
+                self.output_options().ipc_options(),
+            )
+            for batch in accumulator.results():
+                writer.write(batch)
+                # Let other tasks and requests proceed between batches
+                await asyncio.sleep(0)
+                if generation != self.generation:
+                    writer.close()
+                    return
+            writer.close()
+            self.record_output_stats()
+            self.update_stats(rows_read=num_rows, **accumulator.stats())
+
+        except Exception:
+            if generation == self.generation:
+                self.status = Status.FAILED
+            raise
+
+        finally:
+            accumulator.close()
+
+        self.partial = None
+        self.status = Status.FINISHED
+        self.status = Status.COMPLETE
+
+    def _publish_partial(self, accumulator: Accumulator):
+        preview = accumulator.preview(PARTIAL_ROWS)
+        if preview is None:
+            return
+
+        names = preview.schema.names
+        self.partial = [dict(zip(names, row)) for row in iter_rows(preview)]
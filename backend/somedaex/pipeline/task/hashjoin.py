@@ -0,0 +1,390 @@
+"""The hashjoin module defines HashJoin, which combines the rows of two tables
+that have matching keys."""
+
+from pathlib import Path
+import shutil
+from typing import Iterator, List, Optional
+
+import numpy
+import pandas
+import pyarrow
+import pyarrow.compute
+
+from ...arrow_util import (
+    ArrowStreamReader,
+    ArrowStreamWriter,
+    concat_batches,
+    group_rows,
+)
+from .task import MAX_BATCH_ROWS
+
+
+JOIN_TYPES = ("inner", "left", "semi", "anti")
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 ** 2
+"""The number of bytes the build side of a HashJoin may occupy before both sides
+are partitioned on disk."""
+
+NUM_PARTITIONS = 16
+RIGHT_SUFFIX = "_right"
+
+
+def join_schema(
+    left: pyarrow.Schema,
+    right: pyarrow.Schema,
+    right_on: List[str],
+    how: str,
+) -> pyarrow.Schema:
+    """Get the schema of the results of joining two tables.
+
+    Inner and left joins produce every column of the left table followed by the
+    columns of the right table other than its keys. Names that are already used
+    by the left table are given a suffix. Semi and anti joins only produce the
+    columns of the left table.
+    """
+    if how in ("semi", "anti"):
+        return left
+
+    fields = list(left)
+    for field in right:
+        if field.name in right_on:
+            continue
+        if field.name in left.names:
+            field = field.with_name(field.name + RIGHT_SUFFIX)
+        fields.append(field)
+    return pyarrow.schema(fields)
+
+
+def keys_can_be_cast(
+    left: pyarrow.Schema,
+    right: pyarrow.Schema,
+    left_on: List[str],
+    right_on: List[str],
+) -> bool:
+    """Check whether the key columns of the right table can be cast to the types
+    of the key columns of the left table, as they are before they are compared."""
+    for left_name, right_name in zip(left_on, right_on):
+        left_type = left.field(left_name).type
+        right_type = right.field(right_name).type
+        try:
+            pyarrow.array([], type=right_type).cast(left_type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError):
+            return False
+    return True
+
+
+def _valid_rows(keys: List[pyarrow.Array]) -> numpy.ndarray:
+    """Find the rows whose keys are all non-null, as null keys never match."""
+    valid = numpy.ones(len(keys[0]), dtype=bool)
+    for key in keys:
+        if key.null_count > 0:
+            valid &= key.is_valid().to_numpy(zero_copy_only=False)
+    return valid
+
+
+def _pandas_keys(keys: List[pyarrow.Array]) -> pandas.Index:
+    if len(keys) == 1:
+        return pandas.Index(keys[0].to_pandas())
+    return pandas.MultiIndex.from_arrays([key.to_pandas() for key in keys])
+
+
+class _HashTable:
+    """A _HashTable finds the rows of the build side of a join that match each
+    row of the probe side.
+
+    The distinct keys of the build side are held in a pandas index, which hashes
+    them once and can then be probed with whole arrays of keys. The rows with
+    each key are stored contiguously so that the matches for any number of probe
+    rows can be gathered without looping.
+    """
+
+    def __init__(self, keys: List[pyarrow.Array]):
+        rows = numpy.flatnonzero(_valid_rows(keys))
+        keys = [key.take(pyarrow.array(rows)) for key in keys]
+        first_rows, groups = group_rows(keys, len(rows))
+
+        first_rows = pyarrow.array(first_rows)
+        self._index = _pandas_keys([key.take(first_rows) for key in keys])
+
+        counts = numpy.bincount(groups, minlength=len(first_rows))
+        self._rows = rows[numpy.argsort(groups, kind="stable")]
+        self._counts = counts
+        self._starts = numpy.cumsum(counts) - counts
+
+    def lookup(self, keys: List[pyarrow.Array]) -> numpy.ndarray:
+        """Find the number of the build key that matches each probe row, or -1 if
+        there is none."""
+        codes = numpy.full(len(keys[0]), -1, dtype=numpy.int64)
+        rows = numpy.flatnonzero(_valid_rows(keys))
+        if len(rows) > 0 and len(self._index) > 0:
+            keys = [key.take(pyarrow.array(rows)) for key in keys]
+            codes[rows] = self._index.get_indexer(_pandas_keys(keys))
+        return codes
+
+    def matches(self, codes: numpy.ndarray):
+        """Pair each probe row with every build row that has the same key. Returns
+        the probe rows and build rows of the pairs."""
+        probe_rows = numpy.flatnonzero(codes >= 0)
+        codes = codes[probe_rows]
+        repeats = self._counts[codes]
+
+        ends = numpy.cumsum(repeats)
+        offsets = numpy.arange(ends[-1] if len(ends) else 0) - numpy.repeat(
+            ends - repeats, repeats
+        )
+        build_rows = self._rows[numpy.repeat(self._starts[codes], repeats) + offsets]
+        return numpy.repeat(probe_rows, repeats), build_rows
+
+
+class HashJoin:
+    """A HashJoin combines the rows of a left and a right table whose key columns
+    are equal.
+
+    The smaller table is the build side, which is loaded into a hash table. The
+    larger table is the probe side, which is streamed through the hash table a
+    batch at a time. If the build side is larger than the memory budget, both
+    tables are first divided into partitions on disk by the hash of their keys,
+    and each pair of partitions is then joined separately (a grace hash join).
+
+    Left, semi and anti joins remember which rows of the left table were matched
+    when it is the build side, and produce the rows they need once the probe side
+    has been read.
+
+    Besides joining two tables with join(), the probe side can be streamed:
+    start() loads the build side, probe() joins each batch of the probe side as
+    it arrives, and finish() produces the rest of the results.
+    """
+
+    def __init__(
+        self,
+        how: str,
+        left_schema: pyarrow.Schema,
+        right_schema: pyarrow.Schema,
+        left_on: List[str],
+        right_on: List[str],
+        spill_dir: Path,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        num_partitions: int = NUM_PARTITIONS,
+    ):
+        self.how = how
+        self.left_schema = left_schema
+        self.right_schema = right_schema
+        self.left_on = list(left_on)
+        self.right_on = list(right_on)
+        self.schema = join_schema(left_schema, right_schema, right_on, how)
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.num_partitions = num_partitions
+
+        self._key_types = [left_schema.field(name).type for name in left_on]
+        self._right_columns = [
+            name for name in right_schema.names if name not in right_on
+        ]
+        self.build_side: Optional[str] = None
+        self.spilled_bytes = 0
+
+        self._build_left = True
+        self._build: pyarrow.RecordBatch = None
+        self._table: _HashTable = None
+        self._matched: Optional[numpy.ndarray] = None
+        self._build_paths: List[Path] = []
+        self._probe_paths: List[Path] = []
+        self._probe_writers: Optional[List[ArrowStreamWriter]] = None
+
+    def stats(self) -> dict:
+        """Summarize how the join was carried out."""
+        return {
+            "build_side": self.build_side,
+            "spilled_bytes": self.spilled_bytes,
+        }
+
+    def join(self, left, right) -> Iterator[pyarrow.RecordBatch]:
+        """Join two tables, producing the results a batch at a time."""
+        build_left = left.num_rows <= right.num_rows
+        build, probe = (left, right) if build_left else (right, left)
+
+        self.start(build, build_left)
+        for batch in probe.to_batches(max_chunksize=MAX_BATCH_ROWS):
+            yield from self.probe(batch)
+        yield from self.finish()
+
+    def start(self, build: pyarrow.Table, build_left: bool):
+        """Begin a join whose probe side is streamed, by loading the build side,
+        or dividing it into partitions on disk if it exceeds the memory budget."""
+        self.build_side = "left" if build_left else "right"
+        self._build_left = build_left
+        batches = build.to_batches(max_chunksize=MAX_BATCH_ROWS)
+
+        if build.nbytes <= self.memory_budget:
+            self._load(batches)
+            self._probe_writers = None
+        else:
+            self._build_paths = self._partition(batches, build_left)
+            self._probe_paths, self._probe_writers = self._open_partitions(
+                not build_left
+            )
+
+    def probe(self, batch: pyarrow.RecordBatch) -> Iterator[pyarrow.RecordBatch]:
+        """Join a batch of the probe side with the build side. If the build side
+        was partitioned, the batch is partitioned too and joined by finish()."""
+        if self._probe_writers is None:
+            yield from self._probe(batch)
+        else:
+            self._write_partitions(self._probe_writers, batch, not self._build_left)
+
+    def finish(self) -> Iterator[pyarrow.RecordBatch]:
+        """Produce the rest of the results once the probe side has been read."""
+        if self._probe_writers is None:
+            yield from self._finish_build()
+            return
+
+        for writer in self._probe_writers:
+            writer.close()
+        self._probe_writers = None
+        for build_path, probe_path in zip(self._build_paths, self._probe_paths):
+            self._load(list(self._read(build_path)))
+            for batch in self._read(probe_path):
+                yield from self._probe(batch)
+            yield from self._finish_build()
+
+    def close(self):
+        """Delete any partitions that were written to disk."""
+        if self._probe_writers is not None:
+            for writer in self._probe_writers:
+                writer.close()
+            self._probe_writers = None
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _keys(self, batch: pyarrow.RecordBatch, is_left: bool):
+        names = self.left_on if is_left else self.right_on
+        return [
+            pyarrow.compute.cast(batch.column(name), data_type)
+            for name, data_type in zip(names, self._key_types)
+        ]
+
+    def _load(self, build_batches: List[pyarrow.RecordBatch]):
+        """Build the hash table from the rows of the build side."""
+        build_schema = self.left_schema if self._build_left else self.right_schema
+        self._build = _concat(build_batches, build_schema)
+        self._table = _HashTable(self._keys(self._build, self._build_left))
+
+        # Rows of the left table that are the build side and have been matched
+        self._matched = (
+            numpy.zeros(self._build.num_rows, dtype=bool) if self._build_left else None
+        )
+
+    def _probe(self, probe: pyarrow.RecordBatch) -> Iterator[pyarrow.RecordBatch]:
+        build, build_left = self._build, self._build_left
+        codes = self._table.lookup(self._keys(probe, not build_left))
+
+        if not build_left and self.how in ("semi", "anti"):
+            keep = codes >= 0 if self.how == "semi" else codes < 0
+            yield self._left_only(probe, numpy.flatnonzero(keep))
+            return
+
+        probe_rows, build_rows = self._table.matches(codes)
+        if build_left:
+            self._matched[build_rows] = True
+            if self.how in ("inner", "left"):
+                yield self._pairs(build, build_rows, probe, probe_rows)
+        else:
+            yield self._pairs(probe, probe_rows, build, build_rows)
+            if self.how == "left":
+                yield self._unmatched(probe, numpy.flatnonzero(codes < 0))
+
+    def _finish_build(self) -> Iterator[pyarrow.RecordBatch]:
+        build, matched = self._build, self._matched
+        if self._build_left and self.how != "inner":
+            if self.how == "semi":
+                yield self._left_only(build, numpy.flatnonzero(matched))
+            elif self.how == "anti":
+                yield self._left_only(build, numpy.flatnonzero(~matched))
+            else:
+                yield self._unmatched(build, numpy.flatnonzero(~matched))
+
+    def _pairs(self, left, left_rows, right, right_rows) -> pyarrow.RecordBatch:
+        left_rows = pyarrow.array(left_rows, type=pyarrow.int64())
+        right_rows = pyarrow.array(right_rows, type=pyarrow.int64())
+        columns = [column.take(left_rows) for column in left.columns]
+        columns.extend(
+            right.column(name).take(right_rows) for name in self._right_columns
+        )
+        return pyarrow.RecordBatch.from_arrays(columns, schema=self.schema)
+
+    def _unmatched(self, left, left_rows) -> pyarrow.RecordBatch:
+        left_rows = pyarrow.array(left_rows, type=pyarrow.int64())
+        columns = [column.take(left_rows) for column in left.columns]
+        columns.extend(
+            pyarrow.nulls(len(left_rows), type=self.right_schema.field(name).type)
+            for name in self._right_columns
+        )
+        return pyarrow.RecordBatch.from_arrays(columns, schema=self.schema)
+
+    def _left_only(self, left, left_rows) -> pyarrow.RecordBatch:
+        return left.take(pyarrow.array(left_rows, type=pyarrow.int64()))
+
+    def _partition(self, batches, is_left: bool) -> List[Path]:
+        """Divide a table's rows into partitions on disk by the hash of their
+        keys."""
+        paths, writers = self._open_partitions(is_left)
+        for batch in batches:
+            self._write_partitions(writers, batch, is_left)
+        for writer in writers:
+            writer.close()
+        return paths
+
+    def _open_partitions(self, is_left: bool):
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        side = "left" if is_left else "right"
+        schema = self.left_schema if is_left else self.right_schema
+        paths = [
+            self.spill_dir / f"{side}-{number}.arrows"
+            for number in range(self.num_partitions)
+        ]
+        return paths, [ArrowStreamWriter(path, schema) for path in paths]
+
+    def _write_partitions(self, writers, batch: pyarrow.RecordBatch, is_left: bool):
+        """Write each row of a batch to the partition for its keys. Rows with null
+        keys never match, so they all go to the first partition."""
+        keys = self._keys(batch, is_left)
+        valid = _valid_rows(keys)
+        numbers = numpy.zeros(batch.num_rows, dtype=numpy.int64)
+        rows = numpy.flatnonzero(valid)
+        if len(rows) > 0:
+            frame = pandas.DataFrame(
+                {
+                    i: key.take(pyarrow.array(rows)).to_pandas()
+                    for i, key in enumerate(keys)
+                }
+            )
+            hashes = pandas.util.hash_pandas_object(frame, index=False)
+            numbers[rows] = hashes.to_numpy() % numpy.uint64(self.num_partitions)
+
+        order = numpy.argsort(numbers, kind="stable")
+        bounds = numpy.searchsorted(
+            numbers[order], numpy.arange(self.num_partitions + 1)
+        )
+        batch = batch.take(pyarrow.array(order))
+        for number, writer in enumerate(writers):
+            start, end = bounds[number], bounds[number + 1]
+            if end > start:
+                part = batch.slice(start, end - start)
+                writer.write(part)
+                self.spilled_bytes += part.nbytes
+
+    @staticmethod
+    def _read(path: Path) -> Iterator[pyarrow.RecordBatch]:
+        reader = ArrowStreamReader(path)
+        try:
+            yield from reader
+        finally:
+            reader.close()
+
+
+def _concat(batches: List[pyarrow.RecordBatch], schema: pyarrow.Schema):
+    batches = [batch for batch in batches if batch.num_rows > 0]
+    if not batches:
+        return pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array([], type=field.type) for field in schema], schema=schema
+        )
+    return concat_batches(batches)
@@ -0,0 +1,65 @@
+"""The memo module defines Memo, a bounded cache for the results of executing a
+task on a set of input values."""
+
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+DEFAULT_MEMO_ENTRIES = 100_000
+
+
+class Memo:
+    """A Memo remembers the results of executing a task on distinct inputs, up to
+    a fixed number of entries. When it is full, the least recently used entry is
+    discarded to make room for a new one."""
+
+    def __init__(self, max_entries: int = DEFAULT_MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        """Get the result remembered for the given inputs, recording a hit or
+        miss."""
+        try:
+            result = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key: Hashable, result):
+        """Remember the result for the given inputs."""
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Forget every remembered result and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        """Summarize the memo's size and counters."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
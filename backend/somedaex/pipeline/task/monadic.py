@@ -2,12 +2,12 @@
 process data from exactly one source."""
 
 from abc import abstractmethod
-from typing import Union
+from typing import List, Union
 
 import pyarrow
 import rx.operators
 
-from ...observableproxy import observe, ObservableProperty
+from ...observableproxy import observe, unwrap, ObservableProperty
 from .status import Status
 from .task import Task
 
@@ -23,23 +23,49 @@ class MonadicTask(Task):
         self.source = source
         self.column = column
 
+        self._watched_source = source
         if source is not None:
-            self._source_reset_subscription = source.reset.subscribe(self.reset)
+            self._source_reset_subscription = source.reset.subscribe(
+                self.request_reset
+            )
         else:
             self._source_reset_subscription = None
 
-        self._source_reset_subscription = None
         observe(self.source).subscribe(self.on_source_change)
-        observe(self.column).subscribe(self.reset)
+        observe(self.column).subscribe(self.request_reset)
+        observe(self.source).subscribe(self.bump_version)
+        observe(self.column).subscribe(self.bump_version)
         observe(self.status).pipe(
             rx.operators.filter(lambda status: status == Status.READY),
         ).subscribe(self.on_ready)
 
     def __del__(self):
+        super().__del__()
         if self._source_reset_subscription is not None:
             self._source_reset_subscription.dispose()
             self._source_reset_subscription = None
 
+    def close(self):
+        """Stop listening for reset events from the source task in addition to
+        releasing the task's own resources."""
+        if self._source_reset_subscription is not None:
+            self._source_reset_subscription.dispose()
+            self._source_reset_subscription = None
+        super().close()
+
+    def sources(self) -> List[Task]:
+        source = unwrap(self.source)
+        if isinstance(source, Task):
+            return [source]
+        return []
+
+    def input_columns(self) -> List[str]:
+        """Get the names of the source columns that the task operates on."""
+        column = unwrap(self.column)
+        if isinstance(column, list):
+            return [unwrap(name) for name in column]
+        return [column]
+
     def args(self):
         return {
             **super().args(),
@@ -76,15 +102,28 @@ class MonadicTask(Task):
 
     def on_source_change(self, new_source: Union[Task, None]):
         """When the task's source changes, stop watching for reset events from
-        the old source and begin watching for them from the new source."""
+        the old source and begin watching for them from the new source.
+
+        The source's proxy also reports a change whenever one of the source's
+        methods is called through it, such as when this task reads from it, and
+        the same source is assigned again by an update that doesn't change it.
+        Neither is a change of source, so neither resets the task.
+        """
+        new_source = unwrap(new_source)
+        if new_source is self._watched_source:
+            return
+        self._watched_source = new_source
+
         if self._source_reset_subscription is not None:
             self._source_reset_subscription.dispose()
             self._source_reset_subscription = None
 
         if new_source is not None:
-            self._source_reset_subscription = new_source.reset.subscribe(self.reset)
+            self._source_reset_subscription = new_source.reset.subscribe(
+                self.request_reset
+            )
 
-        self.reset.on_next("Source changed")
+        self.request_reset("Source changed")
 
     def on_ready(self, _):
         """When the task becomes "ready", generate its schema."""
@@ -0,0 +1,105 @@
+"""The polyadic module defines PolyadicTask, the base class for all tasks that
+process data from more than one source."""
+
+from abc import abstractmethod
+from typing import List
+
+from datasets.table import Table
+import pyarrow
+import rx.operators
+
+from ...observableproxy import observe, unwrap, ObservableProperty
+from .status import Status
+from .task import Task
+
+
+class PolyadicTask(Task):
+    """A polyadic task processes the results of several source tasks, such as the
+    two tables combined by a join.
+
+    The task is reset whenever any of its inputs is reset, and whenever the list
+    of inputs changes.
+    """
+
+    num_inputs = None
+    """The number of inputs the task requires, or None if any number will do."""
+
+    inputs = ObservableProperty("The tasks that provide the task's input data.")
+
+    def __init__(self, inputs: List[Task] = None, **other):
+        super().__init__(**other)
+        self.inputs = list(inputs or [])
+        self._input_reset_subscriptions = []
+        self._subscribe_to_inputs()
+
+        observe(self.inputs).subscribe(self.on_inputs_change)
+        observe(self.inputs).subscribe(self.bump_version)
+        observe(self.status).pipe(
+            rx.operators.filter(lambda status: status == Status.READY),
+        ).subscribe(self.on_ready)
+
+    def __del__(self):
+        super().__del__()
+        self._unsubscribe_from_inputs()
+
+    def close(self):
+        """Stop listening for reset events from the input tasks in addition to
+        releasing the task's own resources."""
+        self._unsubscribe_from_inputs()
+        super().close()
+
+    def input_tasks(self) -> List[Task]:
+        """Get the tasks that provide the task's input data."""
+        return [unwrap(task) for task in unwrap(self.inputs)]
+
+    def sources(self) -> List[Task]:
+        return [task for task in self.input_tasks() if isinstance(task, Task)]
+
+    def args(self):
+        return {**super().args(), "inputs": self.input_tasks()}
+
+    def update(self, updates: dict):
+        if "inputs" in updates:
+            self.inputs = list(updates.pop("inputs") or [])
+        super().update(updates)
+
+    def validate(self) -> bool:
+        inputs = self.input_tasks()
+        if self.num_inputs is not None and len(inputs) != self.num_inputs:
+            return False
+        return all(
+            isinstance(task, Task) and isinstance(unwrap(task.schema), pyarrow.Schema)
+            for task in inputs
+        )
+
+    def _subscribe_to_inputs(self):
+        self._unsubscribe_from_inputs()
+        self._input_reset_subscriptions = [
+            task.reset.subscribe(self.request_reset) for task in self.sources()
+        ]
+
+    def _unsubscribe_from_inputs(self):
+        for subscription in getattr(self, "_input_reset_subscriptions", []):
+            subscription.dispose()
+        self._input_reset_subscriptions = []
+
+    def on_inputs_change(self, _):
+        """When the task's inputs change, stop watching for reset events from the
+        old inputs and begin watching for them from the new ones."""
+        self._subscribe_to_inputs()
+        self.request_reset("Inputs changed")
+
+    def on_ready(self, _):
+        """When the task becomes "ready", generate its schema."""
+        self.schema = self.get_schema()
+
+    async def input_table(self, task: Task) -> Table:
+        """Wait for an input task to produce all of its results, running it if
+        nothing else is, and get its result table."""
+        async for _ in task.batches([]):
+            pass
+        return await task.get_table()
+
+    @abstractmethod
+    def get_schema(self) -> pyarrow.Schema:
+        """Get the schema of the data produced by this task."""
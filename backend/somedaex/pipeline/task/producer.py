@@ -0,0 +1,123 @@
+"""The producer module defines Producer, which runs a task on behalf of every
+consumer of its results."""
+
+import asyncio
+from collections import deque
+from typing import Optional, Tuple
+
+import pyarrow
+
+from ...arrow_util import BatchIndex
+from .status import Status
+
+
+RING_CAPACITY = 16
+"""The number of the most recently produced record batches that a producer keeps
+in memory."""
+
+
+class Producer:
+    """A Producer drives a task's run() method so that the task's output is
+    computed exactly once, no matter how many iterators are reading it.
+
+    Consumers tell the producer how many rows they need, and the producer runs the
+    task until that many rows have been produced. The most recent batches are kept
+    in a ring buffer from which consumers can read at their own pace. Consumers
+    that fall behind the ring can still read older batches from the task's
+    streaming output file.
+    """
+
+    def __init__(self, task, capacity=RING_CAPACITY):
+        self._task = task
+        self._ring = deque(maxlen=capacity)
+        self.index = BatchIndex()
+        self._demand = 0
+        self._finished = False
+        self._error: Optional[BaseException] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._waiters = []
+
+    @property
+    def num_rows(self) -> int:
+        """The number of rows produced so far."""
+        return self.index.num_rows
+
+    @property
+    def num_batches(self) -> int:
+        """The number of batches produced so far."""
+        return len(self.index)
+
+    @property
+    def finished(self) -> bool:
+        """Whether the task has produced all of its rows."""
+        return self._finished
+
+    def publish(self, batch: pyarrow.RecordBatch, position: Optional[int] = None):
+        """Make a newly written batch available to consumers, optionally recording
+        the byte position at which it was written to the streaming output file."""
+        self._ring.append((self.index.num_rows, batch))
+        self.index.append(batch.num_rows, position)
+        self._wake()
+
+    def finish(self):
+        """Record that the task has produced all of its rows."""
+        self._finished = True
+        self._wake()
+
+    def reset(self):
+        """Discard everything produced so far and stop running the task."""
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        self._ring.clear()
+        self.index = BatchIndex()
+        self._demand = 0
+        self._finished = False
+        self._error = None
+        self._wake()
+
+    def batch_at(self, row: int) -> Optional[Tuple[int, pyarrow.RecordBatch]]:
+        """Get the batch that contains a row, along with the index of the batch's
+        first row, if that batch is still held in the ring buffer."""
+        if not self._ring or row < self._ring[0][0] or row >= self.num_rows:
+            return None
+
+        number, start = self.index.locate(row)
+        oldest = len(self.index) - len(self._ring)
+        return start, self._ring[number - oldest][1]
+
+    async def wait_for(self, num_rows: int):
+        """Wait until at least the given number of rows have been produced or the
+        task has run out of rows."""
+        self._demand = max(self._demand, num_rows)
+
+        while self.num_rows < num_rows and not self._finished:
+            if self._error is not None:
+                raise self._error
+            if self._runner is None:
+                self._runner = asyncio.create_task(self._run())
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self):
+        try:
+            while not self._finished and self.num_rows < self._demand:
+                await self._task.run()
+        except Exception as err:  # pylint: disable=broad-except
+            self._error = err
+            self._task.status = Status.FAILED
+        finally:
+            if self._runner is asyncio.current_task():
+                self._runner = None
+            self._wake()
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
@@ -1,7 +1,7 @@
 # Standard library imports
 from abc import abstractmethod
 from pathlib import Path
-from typing import Iterable, Iterator
+from typing import Iterable, Iterator, List, Union
 
 # Third-party library imports
 from datasets.table import ConcatenationTable
@@ -11,35 +11,44 @@ import pyarrow
 from ...arrow_util import (
     ArrowStreamReader,
     ArrowStreamWriter,
+    concat_batches,
     copy_stream_to_file,
+    group_rows,
     iter_rows,
+    merge_batches,
+    select_columns,
 )
-
+from ...observableproxy import observe, unwrap
+from .memo import DEFAULT_MEMO_ENTRIES, Memo
 from .monadic import MonadicTask
+from .producer import Producer
 from .results import ResultsBuffer
 from .status import Status
-from .task import RowIterator
+from .task import BatchIterator
 
 
-MAX_BUFFERED_RESULT_ROWS = 1000
-MIN_INITIAL_SAMPLES = 10
+_MISSING = object()
 
 
 class RowwiseTask(MonadicTask):
-    """A row-wise task processes the results of one exactly one source task one
-    row at a time."""
+    """A row-wise task processes the results of exactly one source task one row at
+    a time.
+
+    Rows are read from the source a record batch at a time, and each run() call
+    processes one batch. The task's producer decides when run() is called, so
+    the output is only computed once no matter how many iterators read it.
+    """
+
+    aligned = False
+    """Whether each output row corresponds to the input row at the same index,
+    which allows the output to be combined with the source's columns."""
 
     def __init__(self, **args):
         super().__init__(**args)
-        self._output_buffer: ResultsBuffer = None
+        self.producer = Producer(self)
         self._output_writer: ArrowStreamWriter = None
-
-        self._schema: pyarrow.Schema = None
         self._num_input_rows_processed = 0  # No. of input rows processed by run()
-        self._num_output_rows_buffered = 0  # No. of output rows appended to the buffer
-        self._num_output_rows_written = 0  # No. of output rows written to disk
-
-        self._input_rows = None
+        self._input_batches = None
 
     @property
     def output_path(self) -> Path:
@@ -50,251 +59,366 @@ class RowwiseTask(MonadicTask):
         """Get the path to the task's streaming output file."""
         return self._workdir / f"{self.id}.arrows"
 
-    def output_row(self, *values):
-        """Write a single row to the task's output buffer."""
-        if self._output_buffer is None:
-            self._output_buffer = ResultsBuffer(self.schema)
-
-        self._output_buffer.append(*values)
-        self._num_output_rows_buffered += 1
+    def owned_paths(self) -> List[Path]:
+        return super().owned_paths() + [self.output_path]
 
-        if len(self._output_buffer) >= MAX_BUFFERED_RESULT_ROWS:
-            self.flush_output_buffer()
+    def output_batch(self, batch: pyarrow.RecordBatch):
+        """Write a record batch to the streaming output file and make it available
+        to the task's consumers."""
+        schema = unwrap(self.schema)
+        if schema is None:
+            raise Exception("Unable to write because there is no schema")
 
-    def flush_output_buffer(self):
-        """Write the contents of the output buffer to the streaming output file."""
-        batch = self._output_buffer.flush()
-        self.output_batch(batch)
+        if self._output_writer is None:
+            self._output_writer = ArrowStreamWriter(
+                self.output_path, schema, self.output_options().ipc_options()
+            )
 
-    def output_batch(self, batch):
-        """Write a record batch to the streaming output file."""
-        if self._schema is None:
-            raise Exception("Unable to write because there is no schema")
+        position = self._output_writer.write(batch)
+        self.producer.publish(batch, position)
 
+    def finish(self):
+        """Close the streaming output file and copy it to a file that can be
+        memory-mapped."""
         if self._output_writer is None:
-            self._output_writer = ArrowStreamWriter(self.output_path, self._schema)
+            # Write an empty stream so that there is still a file to copy
+            self._output_writer = ArrowStreamWriter(
+                self.output_path,
+                unwrap(self.schema),
+                self.output_options().ipc_options(),
+            )
+
+        self._output_writer.close()
+        self._output_writer = None
+        self.status = Status.FINISHED
+        self.producer.finish()
 
-        self._output_writer.write(batch)
-        self._num_output_rows_written += batch.num_rows
+        encoded = copy_stream_to_file(
+            self.stream_path(), self.file_path(), options=self.output_options()
+        )
+        self.record_output_stats(encoded)
+        self.status = Status.COMPLETE
 
     def on_reset(self, reason):
         """Reset the task's state due to a change in its input or configuration."""
         super().on_reset(reason)
-        self._output_buffer = None
-        self._output_writer = None
+        self.producer.reset()
+        if self._output_writer is not None:
+            self._output_writer.close()
+            self._output_writer = None
         self._num_input_rows_processed = 0
-        self._num_output_rows_buffered = 0
-        self._num_output_rows_written = 0
-        # Delete the file so no one else can read it?
+        self._input_batches = None
+        # The pipeline deletes the stale output files once no one is reading them
 
-    def rows(self, column_names: Iterable[str] = None):
-        return RowwiseResultsIterator(self, column_names)
+    def batches(self, column_names: Iterable[str] = None):
+        return RowwiseBatchIterator(self, column_names)
 
     async def run(self):
-        if self._input_rows is None:
-            column_names = self.column
-            if not isinstance(column_names, list):
-                column_names = [column_names]
-            self._input_rows = self.source.rows(column_names)
+        if self.status in (Status.FINISHED, Status.COMPLETE):
+            return
+
+        if self._input_batches is None:
+            # The source is read through its proxy's wrapped task, as a method called
+            # on the proxy is reported as a change to the source, which resets
+            # this task
+            source = unwrap(self.source)
+            self._input_batches = source.batches(self.input_columns())
+
+        self.status = Status.WORKING
+        generation = self.generation
 
         try:
-            self.status = Status.WORKING
+            batch = await self._input_batches.__anext__()
+        except StopAsyncIteration:
+            if generation == self.generation:
+                self.finish()
+            return
 
-            row = await self._input_rows.__anext__()
-            raw_result = self.execute(*row)
-            self._num_input_rows_processed += 1
+        if generation != self.generation:
+            # The task was reset while waiting for input, so this run is stale
+            return
 
-            if isinstance(raw_result, Iterator):
-                for result in raw_result:
-                    self.output_row(*result)
-            elif raw_result is not None:
-                self.output_row(*raw_result)
+        self.output_batch(self.execute_batch(batch))
+        self._num_input_rows_processed += batch.num_rows
+        self.status = Status.PAUSED
 
-            self.status = Status.PAUSED
+    def execute_batch(self, batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+        """Execute the task on a batch of rows from the source columns.
 
-        except StopIteration:
-            self.flush_output_buffer()
-            self.status = Status.FINISHED
+        By default, execute() is called once for each row. Tasks that can process
+        a whole batch at once should override this method.
+        """
+        results = ResultsBuffer(unwrap(self.schema))
 
-            stream_path = self.stream_path()
-            file_path = self.file_path()
-            copy_stream_to_file(stream_path, file_path)
-            self.status = Status.COMPLETE
+        for row in iter_rows(batch):
+            raw_result = self.execute(*row)
+            if isinstance(raw_result, Iterator):
+                for result in raw_result:
+                    results.append(*result)
+            elif raw_result is not None:
+                results.append(*raw_result)
 
-    @abstractmethod
-    def execute(self, *inputs):
-        """Execute the task on a single row of data."""
+        return results.to_batch()
 
+    def _preview(self, inputs: List[pyarrow.RecordBatch]) -> pyarrow.RecordBatch:
+        source = inputs[0]
+        num_rows_processed = self._num_input_rows_processed
+        self._num_input_rows_processed = 0
+        try:
+            output = self.execute_batch(select_columns(source, self.input_columns()))
+        finally:
+            self._num_input_rows_processed = num_rows_processed
 
-class OneToOneRowwiseTask(RowwiseTask):
-    """A one-to-one row-wise task produces exactly one output row for each input row."""
+        if self.aligned:
+            return merge_batches(source, output)
+        return output
 
     def _get_full_table(self):
+        if not self.aligned:
+            return self._table_reader.read_table()
+
+        # Aligned results only hold the task's own columns, which sit beside the
+        # source's columns
         return ConcatenationTable.from_tables(
             [
-                self.source.table,
+                unwrap(self.source)._get_table(),
                 self._table_reader.read_table(),
             ],
             1,
         )
 
+    @abstractmethod
+    def execute(self, *inputs):
+        """Execute the task on a single row of data."""
+
+
+class OneToOneRowwiseTask(RowwiseTask):
+    """A one-to-one row-wise task produces exactly one output row for each input row.
+
+    If the task type is memoizable, setting the task's "memoize" option makes it
+    execute each distinct combination of input values only once per batch, and
+    remember the results for later batches. The option is either True or the
+    maximum number of results to remember.
+    """
+
+    aligned = True
+
+    memoizable = False
+    """Whether execute() always returns the same result for the same inputs."""
+
+    def __init__(self, **args):
+        super().__init__(**args)
+        self._memo: Memo = None
+
+    def on_reset(self, reason):
+        super().on_reset(reason)
+        # The results may depend on the task's configuration
+        self._memo = None
+
+    def _get_memo(self) -> Union[Memo, None]:
+        option = self.config.get("memoize") if self.memoizable else None
+        if not option:
+            return None
+
+        max_entries = DEFAULT_MEMO_ENTRIES if option is True else int(option)
+        if self._memo is None or self._memo.max_entries != max_entries:
+            self._memo = Memo(max_entries)
+        return self._memo
+
+    def execute_batch(self, batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+        memo = self._get_memo()
+        if memo is None or batch.num_rows == 0:
+            return super().execute_batch(batch)
+
+        output = self._execute_memoized(batch, memo)
+        self.update_stats(memo=memo.stats())
+        return output
+
+    def _execute_memoized(self, batch: pyarrow.RecordBatch, memo: Memo):
+        """Execute the task once for each distinct row in the batch, skipping rows
+        whose results are already in the memo, and scatter the results back to
+        every row that shares the same inputs."""
+        schema = unwrap(self.schema)
+
+        first_rows, groups = group_rows(batch.columns, batch.num_rows)
+
+        # Execute the task on each distinct row whose result is not in the memo
+        results = []
+        for row in first_rows.tolist():
+            values = [column[row] for column in batch.columns]
+            key = tuple(value.as_py() for value in values)
+            try:
+                result = memo.get(key, _MISSING)
+            except TypeError:
+                # Values such as lists can't be used as keys
+                key, result = None, _MISSING
+
+            if result is _MISSING:
+                result = self.execute(*values)
+                if key is not None:
+                    memo.put(key, result)
+            results.append(result)
+
+        indices = pyarrow.array(groups, type=pyarrow.int64())
+        columns = [
+            pyarrow.array(list(values), type=field.type).take(indices)
+            for values, field in zip(zip(*results), schema)
+        ]
+        return pyarrow.RecordBatch.from_arrays(columns, schema=schema)
+
 
 class OneToManyRowwiseTask(RowwiseTask):
     """A one-to-many task can produce one output row, several output rows, or no
     output rows for each input row."""
 
 
-async def emptyTupler():
-    """A generator that yields empty tuples forever."""
-    while True:
-        yield ()
+class RowwiseBatchIterator(BatchIterator):
+    """Iterates over the record batches produced by a row-wise task.
 
-
-class RowwiseResultsIterator(RowIterator):
-    """Iterates over the results from a row-wise task."""
+    While the task is running, batches are read from the task's producer, falling
+    back to the streaming output file for batches that are no longer held in the
+    producer's ring buffer. Once the task is complete, they are read from its
+    memory-mapped result table instead. If any of the requested columns belong
+    to the source task, the matching rows are read from the source and combined
+    with the task's own output.
+    """
 
     def __init__(self, task: RowwiseTask, column_names: Iterable[str] = None):
         super().__init__(task, column_names)
         self._task = task  # Only necessary for type hints
-        self._stream_reader = None
-        self._current_batch = None
-        self._source_rows = None
-        self._source_column_names = None
+        self._stream_reader: ArrowStreamReader = None
+        self._stream_batch_number = 0  # No. of the batch read next from the stream
         self._own_column_names = None
+        self._source_column_names = None
+        self._source_batches: BatchIterator = None
+        self._source_remainder: pyarrow.RecordBatch = None
 
     def on_reset(self, reason):
         super().on_reset(reason)
-        self._current_batch = None
-        self._source_rows = None
-        self._source_column_names = None
+        self._close_stream_reader()
         self._own_column_names = None
+        self._source_column_names = None
+        self._source_batches = None
+        self._source_remainder = None
 
+    def seek(self, row: int):
+        super().seek(row)
+        # The source rows will be realigned when the next batch is read
+        self._source_batches = None
+        self._source_remainder = None
+
+    def _close_stream_reader(self):
         if self._stream_reader is not None:
             self._stream_reader.close()
             self._stream_reader = None
 
-    def _split_column_names(self):
-        own_columns = set(self._task.schema.names)
-        requested_columns = set(self._column_names)
-        self._own_column_names = list(requested_columns & own_columns)
-        self._source_column_names = list(requested_columns - own_columns)
-
-    def __aiter__(self):
-        return self
-
-    async def __anext__(self):
-        """Get the next row of output.
-
-        First, exhaust the rows already written to the parent task's output stream
-        Then pull rows sitting in the parent task's output buffer
-        Then subscribe to parent_task.output and yield rows as they come in
+    async def __anext__(self) -> pyarrow.RecordBatch:
+        task = self._task
 
-        A significant amount of time may elapse between __next__() calls,
-        so we'll need to check the status of the parent task to see what stage
-        we're at.
-        """
+        if task.status == Status.INVALID:
+            await observe(task.status).equals(Status.READY)
 
-        # If the task is complete, we can read values directly from its result table.
-        if self._task.status == Status.COMPLETE:
-            return self._next_row_from_table()
+        # If the task is complete, we can read directly from its result table.
+        if task.status == Status.COMPLETE:
+            self._close_stream_reader()
+            return await self._next_batch_from_table()
 
-        # Ensure that the source rows iterator is set up
-        if self._source_rows is None:
-            await self._setup_source_row_iterator()
+        await task.producer.wait_for(self._index + 1)
+        if self._index >= task.producer.num_rows:
+            self._set_reading(False)
+            raise StopAsyncIteration
 
-        # Run the task until there is a row to return
-        while self._index >= self._task._num_output_rows_buffered:
-            await self._task.run()
+        if self._own_column_names is None:
+            self._split_column_names()
 
-        # If we already have a RecordBatch iterator, attempt to read a row from it
-        if self._current_batch:
-            row = self._from_current_batch()
-            if row is not None:
-                return await self._add_source_columns(row)
+        own_batch = self._own_batch(self._index)
+        self._index += own_batch.num_rows
+        own_batch = select_columns(own_batch, self._own_column_names)
 
-        # If we haven't yet read all the rows that have been written to disk
-        if self._index < self._task._num_output_rows_written:
+        if self._source_column_names == []:
+            return own_batch
 
-            # Create a reader if we don't already have one
-            if self._stream_reader is None:
-                self._stream_reader = ArrowStreamReader(self._task.output_path)
+        source_batch = await self._source_rows(own_batch.num_rows)
+        return merge_batches(source_batch, own_batch, self._column_names)
 
-            try:
-                batch = next(self._stream_reader)
-                self._current_batch = iter_rows(batch)
-            except StopIteration as stop:
-                # There are no more batches in the output stream
-                # We shouldn't ever get here
-                raise Exception("Unexpected end of output stream") from stop
-
-            row = self._from_current_batch()
-            return await self._add_source_columns(row)
-
-        row = self._from_buffer()
-        return await self._add_source_columns(row)
+    def _split_column_names(self):
+        own_names = unwrap(self._task.schema).names
 
-    async def _setup_source_row_iterator(self):
         if self._column_names is None:
-            self._source_column_names = None
-            self._own_column_names = None
-        else:
-            self._split_column_names()
-            if len(self._source_column_names) == 0:
-                self._source_rows = emptyTupler()
-                return
-
-        self._source_rows = self._task.source.rows(self._source_column_names)
-
-        # Get the _source_rows iterator "caught up"
-        delta = self._index - self._source_rows._index
-        if hasattr(self._source_rows, "skip"):
-            self._source_rows.skip(delta)
-        else:
-            for _ in range(delta):
-                await self._source_rows.__anext__()
-
-    def _from_current_batch(self):
-        try:
-            row = next(self._current_batch)
-        except StopAsyncIteration:
-            # The current batch has been exhausted
-            self._current_batch = None
+            self._own_column_names = own_names
+            self._source_column_names = None if self._task.aligned else []
             return
 
-        # try:
-        #     parent_row = next(self._source_rows)
-        # except StopAsyncIteration as stop:
-        #     raise Exception("Unexpected end of source row iterable") from stop
+        self._own_column_names = [n for n in self._column_names if n in own_names]
+        self._source_column_names = [
+            n for n in self._column_names if n not in own_names
+        ]
 
-        self._index += 1
-        return row  # self._unify_tuples(own_row, parent_row)
+        if self._source_column_names and not self._task.aligned:
+            raise KeyError(
+                f"Columns {self._source_column_names} are not produced by task "
+                f"{self._task.id}"
+            )
 
-    def _from_buffer(self):
-        buffer_index = self._index - self._task._num_output_rows_written
-        row = self._task._output_buffer[buffer_index]
-        self._index += 1
-        return row
+    def _own_batch(self, row: int) -> pyarrow.RecordBatch:
+        located = self._task.producer.batch_at(row)
+        if located is None:
+            located = self._read_from_stream(row)
 
-    async def _add_source_columns(self, own_row):
-        try:
-            parent_row = await self._source_rows.__anext__()
-        except StopAsyncIteration as stop:
-            raise Exception("Unexpected end of source row iterable") from stop
+        start, batch = located
+        return batch.slice(row - start)
 
-        return self._unify_tuples(own_row, parent_row)
+    def _read_from_stream(self, row: int):
+        index = self._task.producer.index
+        number, start = index.locate(row)
 
-    def _unify_tuples(self, own_row, parent_row):
-        if self._column_names is None:
-            return parent_row + own_row
+        if self._stream_reader is None:
+            self._stream_reader = ArrowStreamReader(self._task.output_path)
+            self._stream_batch_number = 0
+
+        # Jump straight to the batch if its position is known. Otherwise, read the
+        # stream sequentially until we reach it.
+        position = index.position(number)
+        if position is not None and self._stream_reader.can_read_at():
+            return start, self._stream_reader.read_batch_at(position)
 
-        unified = []
+        if self._stream_batch_number > number:
+            self._stream_reader.reset()
+            self._stream_batch_number = 0
 
-        for column_name in self._column_names:
+        while True:
             try:
-                index = self._own_column_names.index(column_name)
-                unified.append(own_row[index])
-            except ValueError:
-                index = self._parent_column_names.index(column_name)
-                unified.append(parent_row[index])
+                batch = next(self._stream_reader)
+            except StopIteration as stop:
+                raise Exception("Unexpected end of output stream") from stop
 
-        return tuple(unified)
+            self._stream_batch_number += 1
+            if self._stream_batch_number > number:
+                return start, batch
+
+    async def _source_rows(self, num_rows: int) -> pyarrow.RecordBatch:
+        """Read the given number of rows from the source, starting at the row that
+        matches the first row of the current batch."""
+        if self._source_batches is None:
+            source = unwrap(self._task.source)
+            self._source_batches = source.batches(self._source_column_names)
+            self._source_batches.seek(self._index - num_rows)
+
+        pieces = []
+        while num_rows > 0:
+            if self._source_remainder is None:
+                try:
+                    self._source_remainder = await self._source_batches.__anext__()
+                except StopAsyncIteration as stop:
+                    raise Exception("Unexpected end of source batches") from stop
+
+            piece = self._source_remainder.slice(0, num_rows)
+            pieces.append(piece)
+            num_rows -= piece.num_rows
+
+            if piece.num_rows < self._source_remainder.num_rows:
+                self._source_remainder = self._source_remainder.slice(piece.num_rows)
+            else:
+                self._source_remainder = None
+
+        return concat_batches(pieces)
@@ -0,0 +1,204 @@
+"""The sample module defines Reservoir and Bernoulli, which choose a random sample
+of rows, and sample_table, which samples a whole table at once."""
+
+from pathlib import Path
+import shutil
+from typing import Iterator, Optional
+
+import numpy
+import pyarrow
+
+from ...arrow_util import (
+    ArrowStreamReader,
+    ArrowStreamWriter,
+    concat_batches,
+    group_rows,
+)
+from .task import MAX_BATCH_ROWS
+
+
+SAMPLE_METHODS = ("reservoir", "bernoulli", "stratified")
+
+_KEY = "__key"
+_ROW = "__row"
+
+
+def sample_table(table: pyarrow.Table, num_rows: int, seed: int = 0):
+    """Choose a number of rows from a table uniformly at random, without
+    replacement. The rows keep the order they have in the table."""
+    random = numpy.random.default_rng(seed)
+    if table.num_rows <= num_rows:
+        rows = numpy.arange(table.num_rows)
+    else:
+        rows = numpy.sort(random.choice(table.num_rows, num_rows, replace=False))
+    sample = table.take(pyarrow.array(rows, type=pyarrow.int64()))
+    return concat_batches(sample.to_batches(), table.schema)
+
+
+class Reservoir:
+    """A Reservoir keeps a uniform random sample of a fixed number of rows, in a
+    single pass over rows of unknown number.
+
+    Each row is given a random key, and the rows with the smallest keys are kept.
+    Once the reservoir is full, rows whose keys are larger than all of the kept
+    keys are discarded before they are combined with the kept rows. If a column
+    to stratify by is given, a separate sample of the same size is kept for
+    each of its values.
+
+    The sampled rows keep the order they had in the input.
+    """
+
+    def __init__(
+        self,
+        schema: pyarrow.Schema,
+        size: int,
+        stratify: Optional[str] = None,
+        seed: int = 0,
+    ):
+        self.schema = schema
+        self.size = size
+        self.stratify = stratify
+        self._random = numpy.random.default_rng(seed)
+        self._kept: pyarrow.RecordBatch = None
+        self._num_rows = 0
+
+    def add(self, batch: pyarrow.RecordBatch):
+        """Consider a batch of rows for the sample."""
+        keys = self._random.random(batch.num_rows)
+        rows = numpy.arange(self._num_rows, self._num_rows + batch.num_rows)
+        self._num_rows += batch.num_rows
+
+        if (
+            self.stratify is None
+            and self._kept is not None
+            and self._kept.num_rows >= self.size
+        ):
+            # Only rows that would displace a kept row need to be considered
+            threshold = numpy.max(self._kept.column(_KEY).to_numpy())
+            candidates = numpy.flatnonzero(keys < threshold)
+            batch = batch.take(pyarrow.array(candidates, type=pyarrow.int64()))
+            keys, rows = keys[candidates], rows[candidates]
+
+        batch = pyarrow.RecordBatch.from_arrays(
+            batch.columns + [pyarrow.array(keys), pyarrow.array(rows)],
+            names=batch.schema.names + [_KEY, _ROW],
+        )
+        kept = batch if self._kept is None else concat_batches([self._kept, batch])
+        self._kept = kept.take(pyarrow.array(self._smallest_keys(kept)))
+
+    def _smallest_keys(self, batch: pyarrow.RecordBatch) -> numpy.ndarray:
+        keys = batch.column(_KEY).to_numpy()
+        if self.stratify is None:
+            if len(keys) <= self.size:
+                return numpy.arange(len(keys))
+            return numpy.argpartition(keys, self.size - 1)[: self.size]
+
+        # Rank the rows within each stratum by their keys
+        _, strata = group_rows([batch.column(self.stratify)], batch.num_rows)
+        order = numpy.lexsort((keys, strata))
+        sorted_strata = strata[order]
+        ranks = numpy.arange(len(order)) - numpy.searchsorted(
+            sorted_strata, sorted_strata, "left"
+        )
+        return order[ranks < self.size]
+
+    def _sample(self) -> pyarrow.RecordBatch:
+        if self._kept is None:
+            return concat_batches([], self.schema)
+        order = numpy.argsort(self._kept.column(_ROW).to_numpy(), kind="stable")
+        kept = self._kept.take(pyarrow.array(order))
+        return pyarrow.RecordBatch.from_arrays(
+            kept.columns[: len(self.schema)], schema=self.schema
+        )
+
+    def preview(self, max_rows: int) -> pyarrow.RecordBatch:
+        """Get some of the rows sampled so far."""
+        return self._sample().slice(0, max_rows)
+
+    def results(self) -> Iterator[pyarrow.RecordBatch]:
+        """Produce the sampled rows."""
+        sample = self._sample()
+        for start in range(0, sample.num_rows, MAX_BATCH_ROWS):
+            yield sample.slice(start, MAX_BATCH_ROWS)
+
+    def stats(self) -> dict:
+        """Summarize the size of the sample."""
+        kept = self._kept
+        return {
+            "sampled_rows": 0 if kept is None else kept.num_rows,
+            "memory_bytes": 0 if kept is None else kept.nbytes,
+        }
+
+    def close(self):
+        """Discard the sampled rows."""
+        self._kept = None
+
+
+class Bernoulli:
+    """A Bernoulli sample keeps each row independently with a fixed probability.
+
+    The size of the sample grows with the input, so the sampled rows are written
+    to disk as they are chosen instead of being held in memory.
+    """
+
+    def __init__(
+        self,
+        schema: pyarrow.Schema,
+        fraction: float,
+        spill_dir: Path,
+        seed: int = 0,
+    ):
+        self.schema = schema
+        self.fraction = fraction
+        self.spill_dir = spill_dir
+        self._random = numpy.random.default_rng(seed)
+        self._path = spill_dir / "sample.arrows"
+        self._writer: ArrowStreamWriter = None
+        self._head = concat_batches([], schema)
+        self.num_rows = 0
+        self.spilled_bytes = 0
+
+    def add(self, batch: pyarrow.RecordBatch):
+        """Choose rows from a batch for the sample."""
+        chosen = self._random.random(batch.num_rows) < self.fraction
+        batch = batch.filter(pyarrow.array(chosen))
+        if batch.num_rows == 0:
+            return
+
+        if self._writer is None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            self._writer = ArrowStreamWriter(self._path, self.schema)
+        self._writer.write(batch)
+        self.num_rows += batch.num_rows
+        self.spilled_bytes += batch.nbytes
+
+        if self._head.num_rows < MAX_BATCH_ROWS:
+            self._head = concat_batches([self._head, batch]).slice(0, MAX_BATCH_ROWS)
+
+    def preview(self, max_rows: int) -> pyarrow.RecordBatch:
+        """Get the first rows sampled so far."""
+        return self._head.slice(0, max_rows)
+
+    def results(self) -> Iterator[pyarrow.RecordBatch]:
+        """Produce the sampled rows."""
+        if self._writer is None:
+            return
+
+        self._writer.close()
+        self._writer = None
+        reader = ArrowStreamReader(self._path)
+        try:
+            yield from reader
+        finally:
+            reader.close()
+
+    def stats(self) -> dict:
+        """Summarize the size of the sample."""
+        return {"sampled_rows": self.num_rows, "spilled_bytes": self.spilled_bytes}
+
+    def close(self):
+        """Delete the sampled rows."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,213 @@
+"""The sort module defines ExternalSort and TopK, which order rows by the values
+in one or more columns."""
+
+from pathlib import Path
+import shutil
+from typing import Iterator, List, Optional, Tuple
+
+import numpy
+import pyarrow
+import pyarrow.compute
+
+from ...arrow_util import ArrowStreamReader, ArrowStreamWriter, concat_batches
+from .task import MAX_BATCH_ROWS
+
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 ** 2
+"""The number of bytes of unsorted rows an ExternalSort holds in memory before it
+sorts them and writes them to disk as a run."""
+
+SORT_ORDERS = ("ascending", "descending")
+
+SortKeys = List[Tuple[str, str]]
+
+_RUN = "__run"
+_LAST = "__last"
+
+
+def sort_batch(batch: pyarrow.RecordBatch, sort_keys: SortKeys):
+    """Sort the rows of a record batch. Rows that compare equal keep their order."""
+    indices = pyarrow.compute.sort_indices(batch, sort_keys=sort_keys)
+    return batch.take(indices)
+
+
+def _chunks(batch: pyarrow.RecordBatch) -> Iterator[pyarrow.RecordBatch]:
+    for start in range(0, batch.num_rows, MAX_BATCH_ROWS):
+        yield batch.slice(start, MAX_BATCH_ROWS)
+
+
+def _concat(batches: List[pyarrow.RecordBatch], schema: pyarrow.Schema):
+    batches = [batch for batch in batches if batch.num_rows > 0]
+    if not batches:
+        return pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array([], type=field.type) for field in schema], schema=schema
+        )
+    return concat_batches(batches)
+
+
+class ExternalSort:
+    """An ExternalSort orders rows that may not all fit in memory.
+
+    Rows are buffered until they exceed the memory budget, then sorted and
+    written to disk as a run. Once every row has been added, the runs are merged.
+
+    The merge holds one chunk of each run in memory. Each round sorts the held
+    rows together, and produces every row up to the last held row of whichever
+    run is furthest behind. None of the rows that have yet to be read can come
+    before that point, because each run is sorted. That run's next chunk is then
+    read, and the rest of the rows are held over for the next round. Rows that
+    compare equal are ordered by run, and so come out in the order they were
+    added.
+    """
+
+    def __init__(
+        self,
+        schema: pyarrow.Schema,
+        sort_keys: SortKeys,
+        spill_dir: Path,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    ):
+        self.schema = schema
+        self.sort_keys = list(sort_keys)
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self._buffer: List[pyarrow.RecordBatch] = []
+        self._num_bytes = 0
+        self._runs: List[Path] = []
+        self.spilled_bytes = 0
+
+    def add(self, batch: pyarrow.RecordBatch):
+        """Add a batch of rows to be sorted."""
+        self._buffer.append(batch)
+        self._num_bytes += batch.nbytes
+        if self._num_bytes > self.memory_budget:
+            self._spill()
+
+    def preview(self, max_rows: int) -> Optional[pyarrow.RecordBatch]:
+        """Rows can't be previewed before every one of them has been seen."""
+        return None
+
+    def results(self) -> Iterator[pyarrow.RecordBatch]:
+        """Produce the sorted rows."""
+        if not self._runs:
+            yield from _chunks(self._sort_buffer())
+            return
+
+        self._spill()
+        yield from self._merge()
+
+    def stats(self) -> dict:
+        """Summarize the sort's use of memory and disk."""
+        return {
+            "memory_bytes": self._num_bytes,
+            "runs": len(self._runs),
+            "spilled_bytes": self.spilled_bytes,
+        }
+
+    def close(self):
+        """Delete the sorted runs."""
+        self._buffer = []
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _sort_buffer(self) -> pyarrow.RecordBatch:
+        batch = sort_batch(_concat(self._buffer, self.schema), self.sort_keys)
+        self._buffer = []
+        self._num_bytes = 0
+        return batch
+
+    def _spill(self):
+        """Sort the buffered rows and write them to disk as a run."""
+        if not self._buffer:
+            return
+
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / f"run-{len(self._runs)}.arrows"
+        writer = ArrowStreamWriter(path, self.schema)
+        for chunk in _chunks(self._sort_buffer()):
+            writer.write(chunk)
+            self.spilled_bytes += chunk.nbytes
+        writer.close()
+        self._runs.append(path)
+
+    def _merge(self) -> Iterator[pyarrow.RecordBatch]:
+        readers = [ArrowStreamReader(path) for path in self._runs]
+        try:
+            held = [self._read_chunk(readers, run) for run in range(len(readers))]
+            sort_keys = self.sort_keys + [(_RUN, "ascending")]
+            while True:
+                batch = sort_batch(_concat(held, held[0].schema), sort_keys)
+                last = batch.column(_LAST).to_numpy(zero_copy_only=False)
+                if not last.any():
+                    # Every run has been read in full
+                    yield self._strip(batch)
+                    return
+
+                end = int(numpy.argmax(last)) + 1
+                run = batch.column(_RUN)[end - 1].as_py()
+                yield self._strip(batch.slice(0, end))
+                held = [batch.slice(end), self._read_chunk(readers, run)]
+        finally:
+            for reader in readers:
+                reader.close()
+
+    def _read_chunk(self, readers: List[ArrowStreamReader], run: int):
+        """Read the next chunk of a run and mark its last row, which is as far
+        as the merge can go until the run's next chunk is read. A run that has
+        been read in full gives an empty chunk, with no row marked."""
+        try:
+            chunk = next(readers[run])
+        except StopIteration:
+            chunk = _concat([], self.schema)
+
+        last = numpy.zeros(chunk.num_rows, dtype=bool)
+        if chunk.num_rows > 0:
+            last[-1] = True
+        return pyarrow.RecordBatch.from_arrays(
+            chunk.columns
+            + [
+                pyarrow.array(numpy.full(chunk.num_rows, run, dtype=numpy.int32)),
+                pyarrow.array(last),
+            ],
+            names=chunk.schema.names + [_RUN, _LAST],
+        )
+
+    def _strip(self, batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+        return pyarrow.RecordBatch.from_arrays(
+            batch.columns[: len(self.schema)], schema=self.schema
+        )
+
+
+class TopK:
+    """A TopK keeps only the first k rows in sort order, in a single pass.
+
+    The rows kept so far are sorted together with each new batch, and everything
+    after the first k rows is discarded, so no more than k rows plus one batch
+    are ever held in memory.
+    """
+
+    def __init__(self, schema: pyarrow.Schema, sort_keys: SortKeys, k: int):
+        self.schema = schema
+        self.sort_keys = list(sort_keys)
+        self.k = k
+        self._top = _concat([], schema)
+
+    def add(self, batch: pyarrow.RecordBatch):
+        """Consider a batch of rows for the top k."""
+        combined = _concat([self._top, batch], self.schema)
+        self._top = sort_batch(combined, self.sort_keys).slice(0, self.k)
+
+    def preview(self, max_rows: int) -> Optional[pyarrow.RecordBatch]:
+        """Get the top rows among those seen so far."""
+        return self._top.slice(0, max_rows)
+
+    def results(self) -> Iterator[pyarrow.RecordBatch]:
+        """Produce the top k rows."""
+        yield from _chunks(self._top)
+
+    def stats(self) -> dict:
+        """Summarize the memory the top k rows occupy."""
+        return {"memory_bytes": self._top.nbytes}
+
+    def close(self):
+        """Discard the top k rows."""
+        self._top = _concat([], self.schema)
@@ -2,26 +2,46 @@
 
 # Standard library imports
 from abc import ABC, abstractmethod
+import asyncio
+import itertools
 from pathlib import Path
-from typing import Any, List, Mapping, Union
+import time
+from typing import Any, List, Mapping, Optional, Tuple, Union
 
 # Third-party library imports
 from datasets.table import Table
+import pyarrow
 import rx.operators
 from rx.subject import Subject
 
 # Local imports
-from ...arrow_util import MemoryMappedTableReader, get_row
-from ...observableproxy import ObservableProperty, observe
+from ...arrow_util import (
+    BatchIndex,
+    MemoryMappedTableReader,
+    OutputOptions,
+    iter_rows,
+    select_columns,
+)
+from ...observableproxy import ObservableProperty, observe, unwrap
+from .cache import table_cache
 from .status import Status
 
 
+MAX_BATCH_ROWS = 10_000
+"""The maximum number of rows in a record batch yielded by a BatchIterator."""
+
+_versions = itertools.count(1)
+"""The source of task versions, which are unique among all the tasks in the
+process."""
+
+
 class Task(ABC):
     """An abstract base class for tasks."""
 
     config = ObservableProperty("The task's configuration")
     status = ObservableProperty[Status]("The data processing status of the task.")
     schema = ObservableProperty("The schema of the task's result data.")
+    stats = ObservableProperty("Statistics about how the task has been executed.")
 
     def __init__(self, id: Union[int, str], workdir: Path, **config):
         self.id = id
@@ -29,9 +49,25 @@ class Task(ABC):
         self.status = Status.INVALID
         self.config = config
         self.schema = None
+        self.stats = {}
 
         self.reset = Subject()
 
+        self.generation = 0
+        """The number of times the task has been reset. A run that started in an
+        earlier generation is stale and should stop at its next opportunity."""
+
+        self._shared_run: asyncio.Future = None
+        self._previewing = False
+
+        self.scheduler = None
+        """The object that carries out the task's reset requests. If the task does
+        not have a scheduler, it is reset as soon as a reset is requested."""
+
+        self.output_defaults: Mapping[str, Any] = {}
+        """Defaults for the "compression" and "dictionary_encode" options, which
+        are shared by every task in a pipeline."""
+
         self._table: Table = None
         """A table containing the full set of results output by the task."""
 
@@ -39,15 +75,133 @@ class Task(ABC):
         """An object that contains or manages the handle for the file the task's
         results are stored in."""
 
+        self.last_read: float = None
+        """The time.monotonic() time at which the task's results were last read."""
+
+        self.readers = 0
+        """The number of BatchIterators that are reading the task's results and
+        have not reached the end of them."""
+
         observe(self.config).pipe(
             rx.operators.distinct_until_changed(),
-        ).subscribe(self.reset)
+        ).subscribe(self.request_reset)
         self.reset.subscribe(self.on_reset)
 
+        self.version = next(_versions)
+        """A number that increases whenever the representation of the task
+        returned by args() changes, such as when its status, configuration or
+        schema changes."""
+        for value in (self.status, self.config, self.schema):
+            observe(value).subscribe(self.bump_version)
+
     def __del__(self):
         if hasattr(self, "_table_reader") and self._table_reader is not None:
             self._table_reader.close()
 
+    def bump_version(self, _=None):
+        """Give the task a new version."""
+        self.version = next(_versions)
+
+    def update_stats(self, **stats):
+        """Record statistics about the task's execution, replacing any earlier
+        values with the same names. Statistics about previews are not recorded."""
+        if self._previewing:
+            return
+        self.stats = {**unwrap(self.stats), **stats}
+
+    def preview(
+        self, inputs: List[pyarrow.RecordBatch]
+    ) -> Optional[pyarrow.RecordBatch]:
+        """Compute the task's results for a small sample of rows, with a batch of
+        the results of each source task. Returns None if the task can't be
+        previewed.
+
+        A preview does not change the state of the task's own run, so it can be
+        computed while the task is running.
+        """
+        self._previewing = True
+        try:
+            return self._preview(inputs)
+        finally:
+            self._previewing = False
+
+    def _preview(
+        self, inputs: List[pyarrow.RecordBatch]
+    ) -> Optional[pyarrow.RecordBatch]:
+        """Compute a preview of the task's results. Tasks that can be previewed
+        should override this method."""
+        return None
+
+    def sample(self, num_rows: int) -> Optional[Tuple[pyarrow.RecordBatch, float]]:
+        """Read about the given number of rows of the task's results without
+        running the task, along with an estimate of the fraction of all of its
+        rows that they make up. Tasks that read no other task's data can override
+        this method, so that they can be previewed before they run. Returns None
+        if the task can't be sampled, in which case its preview waits for its
+        results.
+
+        This is called in another thread.
+        """
+        return None
+
+    def output_options(self) -> OutputOptions:
+        """Get the options for writing the task's result files. The "compression"
+        option is "lz4", "zstd" or None, and the "dictionary_encode" option
+        enables dictionary encoding of low-cardinality string columns."""
+        config = {**self.output_defaults, **unwrap(self.config)}
+        return OutputOptions(
+            compression=config.get("compression"),
+            dictionary_encode=bool(config.get("dictionary_encode")),
+        )
+
+    def record_output_stats(self, dictionary_columns: List[str] = ()):
+        """Record the size of the task's result file and how it was encoded."""
+        self.update_stats(
+            output_bytes=self.file_path().stat().st_size,
+            compression=self.output_options().compression,
+            dictionary_columns=list(dictionary_columns),
+        )
+
+    def spill_dir(self) -> Path:
+        """Get the directory for temporary files written by the task's current
+        run, or by a preview."""
+        run = "preview" if self._previewing else str(self.generation)
+        return self._workdir / f"{self.id}.spill" / run
+
+    def request_reset(self, reason):
+        """Ask for the task to be reset."""
+        if self.scheduler is None:
+            self.reset.on_next(reason)
+        else:
+            self.scheduler.request(self, reason)
+
+    def request_readers_reset(self, reason):
+        """Ask for the tasks that read from this one to be reset, without
+        resetting this task, such as when its schema changes while it runs. A
+        task without a scheduler doesn't know which tasks read from it."""
+        if self.scheduler is not None:
+            self.scheduler.request_readers(self, reason)
+
+    def sources(self) -> List["Task"]:
+        """Get the tasks that this task reads data from."""
+        return []
+
+    def close(self):
+        """Release the resources held by the task, such as the handle for the file
+        its results are stored in. The results can still be read afterwards, at
+        the cost of reopening the file."""
+        table_cache.discard(self)
+        self.release_table()
+
+    def release_table(self):
+        """Drop the task's result table and close the file it was read from. The
+        table will be reopened the next time it is requested."""
+        self._table = None
+
+        if self._table_reader is not None:
+            self._table_reader.close()
+            self._table_reader = None
+
     @classmethod
     @property
     def type(cls) -> str:
@@ -75,22 +229,35 @@ class Task(ABC):
         return self._get_table()
 
     def _get_table(self) -> Table:
-        if self._table is None:
-            self._table_reader = MemoryMappedTableReader(self.file_path())
+        self.last_read = time.monotonic()
+        if not table_cache.hit(self) or self._table is None:
+            self.release_table()
+            path = self.file_path()
+            self._table_reader = MemoryMappedTableReader(path)
+            start = time.perf_counter()
             self._table = self._get_full_table()
+            seconds = time.perf_counter() - start
+            size = path.stat().st_size
+            # A table that was decoded occupies memory rather than a mapped file
+            decoded = self.output_options().decoded
+            table_cache.add(self, self._table.nbytes if decoded else size)
+            self.update_stats(
+                decode_seconds=seconds,
+                decode_mb_per_second=size / 1024 ** 2 / seconds if seconds else None,
+            )
 
         return self._table
 
     def on_reset(self, _):
         """Reset the task's state due to a change in its input or configuration."""
-        self._table = None
+        self.generation += 1
+        self._shared_run = None
+        table_cache.discard(self)
+        self.release_table()
         self.schema = None
 
-        if self._table_reader is not None:
-            self._table_reader.close()
-            self._table_reader = None
-
-        if self.validate():
+        # An unknown codec is a configuration error, not a failure to run
+        if self.validate() and self.output_options().is_valid():
             self.status = Status.READY
         else:
             self.status = Status.INVALID
@@ -99,6 +266,14 @@ class Task(ABC):
         """Get the path to the Arrow file containing the task's results."""
         return self._workdir / f"{self.id}.arrow"
 
+    def owned_paths(self) -> List[Path]:
+        """Get the paths of the files and directories in the working directory
+        that belong to the task, which can be deleted when it no longer needs
+        them. Files outside the working directory, such as the input file of a
+        task that loads data, are never included."""
+        paths = [self.file_path(), self._workdir / f"{self.id}.spill"]
+        return [path for path in paths if self._workdir in path.parents]
+
     @abstractmethod
     def _get_full_table(self) -> Table:
         """Get the full result table that combines this task's output with the
@@ -116,53 +291,137 @@ class Task(ABC):
     async def run(self):
         """Run the task."""
 
-    def rows(self, column_names: List[str] = None):
+    async def run_shared(self):
+        """Run the task, or wait for the run that is already in progress, so that
+        several consumers never run the same task at the same time."""
+        if self._shared_run is None or self._shared_run.done():
+            self._shared_run = asyncio.ensure_future(self.run())
+        await asyncio.shield(self._shared_run)
+
+    def batches(self, column_names: List[str] = None) -> "BatchIterator":
+        """Get an iterator over the record batches of the task's results,
+        optionally limited to a list of specified columns."""
+        return BatchIterator(self, column_names)
+
+    def rows(self, column_names: List[str] = None) -> "RowIterator":
         """Get an iterator over the task's result rows, optionally limited to a
         list of specified columns."""
         return RowIterator(self, column_names)
 
 
-class DatasetTask(Task):
-    """A dataset task processes all rows from its source task(s) at the same time."""
+class BatchIterator:
+    """Iterates over the record batches produced by a task.
 
-    # Examples: Topic modeling, table joins
-
-
-class RowIterator:
-    """Iterates over the rows produced by a task."""
+    An iterator counts as one of the task's readers until it reaches the end of
+    the results or is garbage collected, which protects the results from being
+    evicted while they are read.
+    """
 
     def __init__(self, task: Task, column_names=None):
         self._task = task
         self._column_names = column_names
         self._index = 0
+        self._table_batches = None
+        self._table_index: BatchIndex = None
         self._task_reset_subscription = self._task.reset.subscribe(self.on_reset)
+        self._reading = False
+        self._set_reading(True)
 
     def __del__(self):
         self._task_reset_subscription.dispose()
+        self._set_reading(False)
+
+    def _set_reading(self, reading: bool):
+        if reading != self._reading:
+            self._reading = reading
+            self._task.readers += 1 if reading else -1
 
     def on_reset(self, _):
+        """Start over from the first row when the task is reset."""
         self._index = 0
+        self._table_batches = None
+        self._table_index = None
+
+    @property
+    def index(self) -> int:
+        """The index of the first row of the next batch."""
+        return self._index
 
     def __aiter__(self):
         return self
 
-    async def __anext__(self):
+    async def __anext__(self) -> pyarrow.RecordBatch:
         if self._task.status == Status.INVALID:
             await observe(self._task.status).equals(Status.READY)
         if self._task.status in (Status.READY, Status.PAUSED):
-            await self._task.run()
+            await self._task.run_shared()
         await observe(self._task.status).equals(Status.COMPLETE)
-        return await self._next_row_from_table()
+        return await self._next_batch_from_table()
 
-    async def _next_row_from_table(self):
-        table = await self._task.get_table()
+    async def _next_batch_from_table(self) -> pyarrow.RecordBatch:
+        if self._table_batches is None:
+            table = await self._task.get_table()
+            self._table_batches = table.to_batches(max_chunksize=MAX_BATCH_ROWS)
+            self._table_index = BatchIndex.from_batches(self._table_batches)
 
-        if self._index >= len(table):
+        if self._index >= self._table_index.num_rows:
+            self._set_reading(False)
             raise StopAsyncIteration
 
-        row = get_row(table, self._index, self._column_names)
-        self._index += 1
-        return row
+        number, start = self._table_index.locate(self._index)
+        batch = self._table_batches[number].slice(self._index - start)
+        self._index += batch.num_rows
+        return select_columns(batch, self._column_names)
+
+    def seek(self, row: int):
+        """Move to the given row, so that the next batch begins with it."""
+        self._index = row
+        self._set_reading(True)
+
+    def skip(self, num: int):
+        """Skip over the given number of rows."""
+        self.seek(self._index + num)
+
+
+class RowIterator:
+    """Iterates over the rows produced by a task."""
+
+    def __init__(self, task: Task, column_names=None):
+        self._task = task
+        self._column_names = column_names
+        self._batches = task.batches(column_names)
+        self._rows = None
+        self._index = 0
+        self._task_reset_subscription = self._task.reset.subscribe(self.on_reset)
+
+    def __del__(self):
+        self._task_reset_subscription.dispose()
+
+    def on_reset(self, _):
+        """Start over from the first row when the task is reset."""
+        self._index = 0
+        self._rows = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            if self._rows is not None:
+                row = next(self._rows, None)
+                if row is not None:
+                    self._index += 1
+                    return row
+
+            batch = await self._batches.__anext__()
+            self._rows = iter_rows(batch)
+
+    def seek(self, row: int):
+        """Move to the given row, so that it is the next row returned."""
+        self._rows = None
+        self._batches.seek(row)
+        self._index = row
 
     def skip(self, num: int):
-        self._index += num
+        """Skip over the given number of rows."""
+        self.seek(self._index + num)
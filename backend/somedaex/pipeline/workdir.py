@@ -0,0 +1,176 @@
+"""The workdir module defines WorkdirManager, which keeps track of the files that
+the tasks of a pipeline write to its working directory."""
+
+from pathlib import Path
+import re
+import shutil
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .task import Status, Task
+
+
+TASK_FILE = re.compile(r"(\d+)\.(arrow|arrows|spill)")
+"""The pattern of the names of files and directories that belong to a task."""
+
+RUNNING = (Status.WORKING, Status.PAUSED, Status.FINISHED)
+
+
+def path_size(path: Path) -> int:
+    """Get the number of bytes occupied by a file, or by every file in a
+    directory."""
+    try:
+        if path.is_dir():
+            return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+class WorkdirManager:
+    """A WorkdirManager deletes the files of a pipeline's tasks once they are no
+    longer needed, and keeps the working directory within a disk quota.
+
+    A file that can't be deleted yet, because another process or a reader on an
+    operating system that locks open files is still using it, is retried each
+    time the manager deletes something else.
+
+    When the files of a pipeline's tasks exceed the quota, the results of the
+    least valuable complete tasks are evicted. A task's value is the time it
+    took to run, discounted by the time since its results were last read, so
+    results that are cheap to recompute and have not been read recently are
+    evicted first. An evicted task returns to the "ready" state and runs again
+    the next time its results are requested.
+    """
+
+    def __init__(self, workdir: Path, quota_bytes: Optional[int] = None):
+        self.workdir = workdir
+        self.quota_bytes = quota_bytes
+        self._pending: List[Path] = []
+        self._run_started: Dict[object, float] = {}
+        self.run_seconds: Dict[object, float] = {}
+        self.evictions = 0
+
+    def usage(self, task: Task) -> int:
+        """Get the number of bytes occupied by a task's files."""
+        return sum(path_size(path) for path in task.owned_paths())
+
+    def remove(self, paths: Iterable[Path]):
+        """Delete files and directories, and retry any earlier deletions that
+        failed."""
+        pending, self._pending = self._pending, []
+        for path in list(paths) + pending:
+            try:
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink(missing_ok=True)
+            except OSError:
+                self._pending.append(path)
+
+    def discard(self, task: Task):
+        """Delete every file of a task that has been removed from the pipeline."""
+        self._run_started.pop(task.id, None)
+        self.run_seconds.pop(task.id, None)
+        self.remove(task.owned_paths())
+
+    def discard_stale(self, task: Task):
+        """Delete the results of a task that has been reset, along with temporary
+        files left over from the runs of earlier generations."""
+        spill_root = self._spill_root(task)
+        stale = [path for path in task.owned_paths() if path != spill_root]
+        if spill_root.is_dir():
+            current = {str(task.generation), "preview"}
+            stale.extend(p for p in spill_root.iterdir() if p.name not in current)
+        self.remove(stale)
+
+    def collect_garbage(self, tasks: Iterable[Task]):
+        """Delete files that belong to tasks that are not in the pipeline, such as
+        those left behind by an earlier session."""
+        ids = {str(task.id) for task in tasks}
+        orphans = [
+            path
+            for path in self.workdir.iterdir()
+            if (match := TASK_FILE.fullmatch(path.name)) and match[1] not in ids
+        ]
+        self.remove(orphans)
+
+    def on_status(self, task: Task, status: Status):
+        """Record how long each run of a task takes."""
+        if status == Status.WORKING and task.id not in self._run_started:
+            self._run_started[task.id] = time.monotonic()
+        elif status == Status.COMPLETE and task.id in self._run_started:
+            started = self._run_started.pop(task.id)
+            self.run_seconds[task.id] = time.monotonic() - started
+        elif status in (Status.READY, Status.INVALID, Status.FAILED):
+            self._run_started.pop(task.id, None)
+
+    def evictable(self, tasks: List[Task]) -> List[Task]:
+        """Find the complete tasks whose results can be evicted, least valuable
+        first.
+
+        A task's results are needed while anything is reading them, such as an
+        export, a WebSocket subscription or a task that is still running, and by
+        any aligned row-wise task that reads from it, as the results of such a
+        task include the columns of its source.
+        """
+        protected = {task for task in tasks if task.readers > 0}
+        for task in tasks:
+            for source in task.sources():
+                if task.status in RUNNING or getattr(task, "aligned", False):
+                    protected.add(source)
+
+        now = time.monotonic()
+
+        def value(task: Task) -> float:
+            # Results that have never been read are treated as fresh
+            idle = now - (task.last_read or now)
+            return self.run_seconds.get(task.id, 0.0) / (1.0 + idle)
+
+        candidates = [
+            task
+            for task in tasks
+            if task.status == Status.COMPLETE
+            and task not in protected
+            and self.usage(task) > 0
+        ]
+        return sorted(candidates, key=value)
+
+    def enforce_quota(
+        self, tasks: List[Task], evict, keep: Optional[Task] = None
+    ) -> List[Task]:
+        """Evict the results of the least valuable tasks, other than the one to
+        keep, until the files of every task fit within the quota. The evict
+        function returns a task to the "ready" state, after which its files are
+        deleted. Returns the tasks that were evicted."""
+        if self.quota_bytes is None:
+            return []
+
+        usage = {task.id: self.usage(task) for task in tasks}
+        total = sum(usage.values())
+        evicted = []
+        for task in self.evictable(tasks):
+            if total <= self.quota_bytes:
+                break
+            if task is keep:
+                continue
+            evict(task)
+            self.remove(task.owned_paths())
+            total -= usage[task.id]
+            self.evictions += 1
+            evicted.append(task)
+        return evicted
+
+    def stats(self, tasks: Iterable[Task]) -> dict:
+        """Summarize the disk usage of the working directory."""
+        usage = {task.id: self.usage(task) for task in tasks}
+        return {
+            "quota_bytes": self.quota_bytes,
+            "total_bytes": sum(usage.values()),
+            "tasks": usage,
+            "pending_deletions": len(self._pending),
+            "evictions": self.evictions,
+        }
+
+    def _spill_root(self, task: Task) -> Path:
+        return self.workdir / f"{task.id}.spill"
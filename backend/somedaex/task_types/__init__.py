@@ -5,8 +5,24 @@ in the app.
 
 from ..pipeline import TypeIndex
 from .casefold import CaseFold
+from .dedupe import Dedupe
+from .emoji import RemoveEmoji
+from .entities import ExtractEntities
+from .groupby import GroupBy
+from .join import Join
 from .loadfile import LoadFile
+from .sample import Sample
+from .sort import Sort
+from .tokenize import Tokenize
 
 task_types = TypeIndex()
 task_types.add(CaseFold)
+task_types.add(Dedupe)
+task_types.add(RemoveEmoji)
+task_types.add(ExtractEntities)
+task_types.add(GroupBy)
+task_types.add(Join)
 task_types.add(LoadFile)
+task_types.add(Sample)
+task_types.add(Sort)
+task_types.add(Tokenize)
@@ -17,14 +17,13 @@ class CaseFold(OneToOneRowwiseTask):
     - https://www.w3.org/TR/charmod-norm/#definitionCaseFolding
     """
 
+    memoizable = True
+
     def execute(self, *text):
-        return tuple(t.as_py().casefold() for t in text)
+        values = (t.as_py() for t in text)
+        return tuple(None if v is None else v.casefold() for v in values)
 
     def get_schema(self):
-        column_names = self.column.value
-        if not isinstance(self.column.value, list):
-            column_names = [column_names]
-
         return pyarrow.schema(
-            {name + "_lower": pyarrow.string() for name in column_names}
+            {name + "_lower": pyarrow.string() for name in self.input_columns()}
         )
@@ -0,0 +1,189 @@
+"""The dedupe module provides a task implementation that finds near-duplicate
+text."""
+
+from typing import List
+
+import numpy
+import pyarrow
+import pyarrow.compute
+from ..arrow_util import iter_rows
+from ..minhash import NUM_BANDS, ROWS_PER_BAND, SHINGLE_SIZE, LshIndex, MinHasher
+from ..observableproxy import unwrap
+from ..pipeline.task import OneToOneRowwiseTask
+
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 ** 2
+"""The number of bytes of LSH buckets a Dedupe task holds in memory before it
+moves the largest of them to disk."""
+
+
+class Dedupe(OneToOneRowwiseTask):
+    """A Dedupe task groups rows whose text is nearly the same into clusters.
+
+    Each row's text is broken into overlapping shingles of "shingle_size" bytes
+    (5 by default), and summarized by a MinHash signature that is divided into
+    "bands" bands (20 by default) of "rows_per_band" values (5 by default). Rows
+    that share a band are likely to be similar, and become part of the same
+    cluster. With the default settings, rows whose shingles have a Jaccard
+    similarity of about 0.51 are clustered half of the time, and rows with a
+    similarity of 0.55 about 64% of the time.
+
+    The task produces the id of each row's cluster, which is the number of the
+    first row in the cluster, and whether the row is that first, canonical row.
+    Rows are clustered in a single pass, so a cluster that is found to be similar
+    to an earlier cluster only after some of its rows have been produced stays
+    separate. Text is lowercased and its whitespace collapsed unless the
+    "normalize" option is False. Null text has no cluster.
+
+    The buckets of the LSH bands are kept in sorted levels, and levels that don't
+    fit in the "memory_mb" budget are memory-mapped from disk.
+    """
+
+    def __init__(self, **args):
+        super().__init__(**args)
+        self._index: LshIndex = None
+        self._num_clusters = 0
+
+    def on_reset(self, reason):
+        super().on_reset(reason)
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._num_clusters = 0
+
+    @property
+    def normalize(self) -> bool:
+        """Whether text is lowercased and its whitespace collapsed before it is
+        compared."""
+        return unwrap(self.config).get("normalize", True) is not False
+
+    @property
+    def minhasher(self) -> MinHasher:
+        """The MinHasher configured by the task's options."""
+        config = unwrap(self.config)
+        return MinHasher(
+            num_bands=int(config.get("bands") or NUM_BANDS),
+            rows_per_band=int(config.get("rows_per_band") or ROWS_PER_BAND),
+            shingle_size=int(config.get("shingle_size") or SHINGLE_SIZE),
+        )
+
+    @property
+    def index(self) -> LshIndex:
+        """The index of the LSH buckets claimed by the rows processed so far."""
+        if self._index is None:
+            memory_mb = unwrap(self.config).get("memory_mb")
+            self._index = LshIndex(
+                self.spill_dir(),
+                memory_budget=(
+                    DEFAULT_MEMORY_BUDGET
+                    if memory_mb is None
+                    else memory_mb * 1024 ** 2
+                ),
+            )
+        return self._index
+
+    def validate(self) -> bool:
+        if not super().validate() or isinstance(unwrap(self.column), list):
+            return False
+        column_type = unwrap(self.source.schema).field(unwrap(self.column)).type
+        return pyarrow.types.is_string(column_type) or pyarrow.types.is_large_string(
+            column_type
+        )
+
+    def get_schema(self):
+        column = unwrap(self.column)
+        return pyarrow.schema(
+            {
+                column + "_cluster": pyarrow.int64(),
+                column + "_canonical": pyarrow.bool_(),
+            }
+        )
+
+    def _preview(self, inputs: List[pyarrow.RecordBatch]) -> pyarrow.RecordBatch:
+        # Cluster the preview's rows with an index of their own
+        index, num_clusters = self._index, self._num_clusters
+        self._index, self._num_clusters = None, 0
+        try:
+            return super()._preview(inputs)
+        finally:
+            if self._index is not None:
+                self._index.close()
+            self._index, self._num_clusters = index, num_clusters
+
+    def execute(self, *inputs):
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array([value.as_py()], type=value.type) for value in inputs],
+            names=self.input_columns(),
+        )
+        return next(iter_rows(self.execute_batch(batch)))
+
+    def execute_batch(self, batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+        text = batch.column(0)
+        if self.normalize:
+            text = pyarrow.compute.utf8_lower(text)
+            text = pyarrow.compute.replace_substring_regex(text, r"\s+", " ")
+            text = pyarrow.compute.utf8_trim_whitespace(text)
+
+        minhasher = self.minhasher
+        valid = numpy.flatnonzero(text.is_valid().to_numpy(zero_copy_only=False))
+        text = text.take(pyarrow.array(valid, type=pyarrow.int64()))
+        keys = minhasher.band_keys(minhasher.signatures(text))
+        clusters = self._assign_clusters(keys, self._num_input_rows_processed + valid)
+
+        cluster_ids = numpy.zeros(batch.num_rows, dtype=numpy.int64)
+        cluster_ids[valid] = clusters
+        canonical = numpy.zeros(batch.num_rows, dtype=bool)
+        canonical[valid] = clusters == self._num_input_rows_processed + valid
+        mask = numpy.ones(batch.num_rows, dtype=bool)
+        mask[valid] = False
+
+        self._num_clusters += int(canonical.sum())
+        self.update_stats(clusters=self._num_clusters, lsh=self.index.stats())
+
+        return pyarrow.RecordBatch.from_arrays(
+            [
+                pyarrow.array(cluster_ids, mask=mask),
+                pyarrow.array(canonical, mask=mask),
+            ],
+            schema=unwrap(self.schema),
+        )
+
+    def _assign_clusters(self, keys: numpy.ndarray, row_ids: numpy.ndarray):
+        """Find the cluster of each row from the band keys of its signature.
+
+        A row joins the cluster that claimed any of its keys in an earlier batch,
+        or the cluster of the first row in this batch that has one of its keys,
+        whichever cluster is older. Keys that nobody had claimed are then claimed
+        for the cluster of the first row that has them.
+        """
+        num_rows, num_bands = keys.shape
+        if num_rows == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        flat_keys = keys.ravel()
+        claimed = self.index.lookup(flat_keys).reshape(num_rows, num_bands)
+        no_cluster = numpy.iinfo(numpy.int64).max
+        clusters = numpy.where(claimed >= 0, claimed, no_cluster).min(axis=1)
+        clusters = numpy.minimum(clusters, row_ids)
+
+        # Link each row to the first row in the batch that shares an unclaimed key.
+        # The keys are in row order, so the first occurrence is the earliest row.
+        unclaimed = numpy.flatnonzero(claimed.ravel() < 0)
+        _, first, inverse = numpy.unique(
+            flat_keys[unclaimed], return_index=True, return_inverse=True
+        )
+        first_rows = unclaimed[first] // num_bands
+        parents = numpy.arange(num_rows)
+        numpy.minimum.at(parents, unclaimed // num_bands, first_rows[inverse])
+
+        # Every row's parent comes before it, so follow the links by doubling until
+        # every row points at the start of its chain, keeping the oldest cluster
+        while True:
+            clusters = numpy.minimum(clusters, clusters[parents])
+            grandparents = parents[parents]
+            if numpy.array_equal(grandparents, parents):
+                break
+            parents = grandparents
+
+        self.index.add(flat_keys[unclaimed], clusters[unclaimed // num_bands])
+        return clusters
@@ -1,37 +1,182 @@
-from emoji import demojize, replace_emoji
+"""The emoji module provides a task implementation that removes emoji from text or
+replaces them with their names."""
+
+from functools import lru_cache
+import re
+from typing import Iterable
+
+import emoji
 import pyarrow
+import pyarrow.compute
+from ..arrow_util import split_matches
+from ..observableproxy import unwrap
 from ..pipeline.task import OneToOneRowwiseTask
 
-# class RemoveEmoji(OneToOneRowwiseTask):
-#     def execute(self, *text):
-#         return tuple(t.as_py().casefold() for t in text)
 
+MODES = ("name", "string", "remove")
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Build a regular expression that matches any of the given words, sharing
+    the common prefixes of the words so that matching stays fast. Where one word
+    is a prefix of another, the longer word is preferred."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        leaves = [c for c, child in node.items() if c and child == {"": {}}]
+        branches = [
+            re.escape(c) + build(child)
+            for c, child in node.items()
+            if c and c not in leaves
+        ]
+        if len(leaves) == 1:
+            branches.append(re.escape(leaves[0]))
+        elif leaves:
+            branches.append("[" + "".join(re.escape(c) for c in leaves) + "]")
+
+        if not branches:
+            return ""
+        if len(branches) == 1:
+            body = branches[0]
+        else:
+            body = "(?:" + "|".join(branches) + ")"
+
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+@lru_cache(maxsize=None)
+def emoji_pattern() -> str:
+    """Get a regular expression that matches any single emoji, including
+    sequences such as flags and emoji with skin tone modifiers."""
+    return _trie_pattern(sorted(emoji.UNICODE_EMOJI_ENGLISH))
+
+
+@lru_cache(maxsize=None)
+def _compiled_emoji_pattern() -> re.Pattern:
+    return re.compile(emoji_pattern())
+
+
+class RemoveEmoji(OneToOneRowwiseTask):
+    """A RemoveEmoji task removes the emoji from text, or replaces them with
+    either a fixed string or their names.
+
+    The "mode" option is one of "name", "string" or "remove". In "string" mode,
+    each emoji is replaced with the "replacement" option. In "name" mode, each
+    emoji is replaced with its name, as given by `emoji.demojize`.
+
+    Whole batches are processed at once by Arrow's regular expression kernels
+    using a single pattern that matches every emoji. The emoji library is only
+    consulted for the names of the distinct emoji found in each batch.
+    """
+
+    def __init__(self, **args):
+        super().__init__(**args)
+        self._names = {}
+
+    @property
+    def mode(self) -> str:
+        """How the task replaces emoji."""
+        return unwrap(self.config).get("mode", "name")
+
+    @property
+    def replacement(self) -> str:
+        """The string that emoji are replaced with in "string" mode."""
+        if self.mode == "remove":
+            return ""
+        return unwrap(self.config).get("replacement") or ""
+
+    def validate(self) -> bool:
+        return self.mode in MODES and super().validate()
+
+    def get_schema(self):
+        return pyarrow.schema(
+            {name + "_demojized": pyarrow.string() for name in self.input_columns()}
+        )
+
+    def name_of(self, emoji_text: str) -> str:
+        """Get the name of an emoji, remembering it for later batches."""
+        try:
+            return self._names[emoji_text]
+        except KeyError:
+            name = self._names[emoji_text] = emoji.demojize(emoji_text)
+            return name
+
+    def execute(self, *text):
+        values = (t.as_py() for t in text)
+        pattern = _compiled_emoji_pattern()
+
+        if self.mode == "name":
+            return tuple(
+                None
+                if v is None
+                else pattern.sub(lambda match: self.name_of(match[0]), v)
+                for v in values
+            )
+
+        replacement = self.replacement
+        return tuple(
+            None if v is None else pattern.sub(lambda _: replacement, v)
+            for v in values
+        )
+
+    def execute_batch(self, batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+        if self.mode == "name":
+            replace = self._replace_with_names
+        else:
+            replace = self._replace_with_string
 
-#         mode = streamlit.selectbox("What do you want to replace the emoji with?", self._MODES)
-#         replace_with = None
+        columns = [replace(column) for column in batch.columns]
+        return pyarrow.RecordBatch.from_arrays(columns, schema=unwrap(self.schema))
 
-#         if mode == self._MODES[1]:
-#             replace_with = streamlit.text_input("What string do you want to replace the emoji with?")
-#         elif mode == self._MODES[2]:
-#             replace_with = ""
+    def _replace_with_string(self, column: pyarrow.Array) -> pyarrow.Array:
+        # Backslashes in the replacement would otherwise refer to capture groups
+        replacement = self.replacement.replace("\\", "\\\\")
+        return pyarrow.compute.replace_substring_regex(
+            column, pattern=emoji_pattern(), replacement=replacement
+        )
 
-#         return {"replace_with": replace_with}
+    def _replace_with_names(self, column: pyarrow.Array) -> pyarrow.Array:
+        """Replace each emoji with its name.
 
-#     def execute(self, *text):
-#         result = []
-#         for t in text:
-#             t = t.as_py()
+        The text is split into emoji and the text around them, the distinct emoji
+        are looked up once, and the pieces are joined back together with the
+        names in place of the emoji.
+        """
+        try:
+            pieces, is_emoji = split_matches(column, f"()({emoji_pattern()})")
+        except ValueError:
+            # The markers can't be told apart from the text, so fall back to
+            # processing the column one string at a time
+            return pyarrow.array(
+                [v[0] for v in map(self.execute, column)], type=pyarrow.string()
+            )
 
-#         replace_with = self.config.get("replace_with")
-#         if isinstance(replace_with, str):
-#             return replace_emoji(text, replace_with)
-#         return demojize(text)
+        flat = pyarrow.compute.list_flatten(pieces)
+        if len(flat) == 0:
+            return column
 
-#     def schema(self):
-#         column_names = self.column.value
-#         if not isinstance(self.column.value, list):
-#             column_names = [column_names]
+        is_emoji = pyarrow.array(is_emoji)
+        found = pyarrow.compute.unique(flat.filter(is_emoji))
+        names = pyarrow.array(
+            [self.name_of(e) for e in found.to_pylist()], type=pyarrow.string()
+        )
+        indices = pyarrow.compute.index_in(flat, value_set=found)
+        replaced = pyarrow.compute.if_else(is_emoji, names.take(indices), flat)
 
-#         return pyarrow.schema(
-#             {name + "_demojized": pyarrow.string() for name in column_names}
-#         )
+        offsets = pieces.offsets.to_numpy()
+        rebased = pyarrow.array(offsets - offsets[0], type=pieces.offsets.type)
+        joined = pyarrow.compute.binary_join(
+            type(pieces).from_arrays(rebased, replaced), ""
+        )
+        # Empty lists join to empty strings, so the nulls must be put back
+        null = pyarrow.scalar(None, type=pyarrow.string())
+        return pyarrow.compute.if_else(pyarrow.compute.is_null(column), null, joined)
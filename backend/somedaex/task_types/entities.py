@@ -0,0 +1,118 @@
+"""The entities module provides a task implementation that extracts hashtags,
+mentions and URLs from text."""
+
+import numpy
+import pyarrow
+import pyarrow.compute
+from ..arrow_util import extract_all, iter_rows
+from ..observableproxy import unwrap
+from ..pipeline.task import RowwiseTask
+
+
+HASHTAG_PATTERN = r"#[\p{L}\p{N}_]+"
+MENTION_PATTERN = r"@[\p{L}\p{N}_]+"
+URL_PATTERN = r"(?:https?://|www\.)[^\s<>\"]*[^\s<>\".,;:!?)\]}']"
+
+ENTITY_PATTERNS = {
+    "hashtags": r"(^|[^\p{L}\p{N}_&#])(" + HASHTAG_PATTERN + ")",
+    "mentions": r"(^|[^\p{L}\p{N}_@.])(" + MENTION_PATTERN + ")",
+    "urls": "()(" + URL_PATTERN + ")",
+}
+"""Regular expressions that match each kind of entity. The first group of each
+pattern matches the text before the entity, and the second matches the entity."""
+
+
+class ExtractEntities(RowwiseTask):
+    """An ExtractEntities task finds the hashtags, @mentions and URLs in text.
+
+    The "entities" option lists the kinds of entity to extract, which defaults to
+    all of them. Normally, the task produces a list column for each kind of
+    entity and each input column, with one row for each input row. If the
+    "explode" option is set, the task instead produces one row for each entity,
+    which records the index of the input row it was found in, the name of the
+    list column it would otherwise have been in, and the entity itself.
+
+    Entities are found in whole batches at once by Arrow's regular expression
+    kernels, and exploding the lists never loops over rows in Python.
+    """
+
+    @property
+    def entity_kinds(self):
+        """The kinds of entity that the task extracts."""
+        kinds = unwrap(self.config).get("entities") or list(ENTITY_PATTERNS)
+        return [kind for kind in ENTITY_PATTERNS if kind in kinds]
+
+    @property
+    def explode(self) -> bool:
+        """Whether the task produces one row per entity."""
+        return bool(unwrap(self.config).get("explode"))
+
+    @property
+    def aligned(self) -> bool:
+        return not self.explode
+
+    def validate(self) -> bool:
+        kinds = unwrap(self.config).get("entities")
+        if kinds is not None and not all(k in ENTITY_PATTERNS for k in kinds):
+            return False
+        return super().validate()
+
+    def _list_column_names(self):
+        return [
+            f"{name}_{kind}"
+            for name in self.input_columns()
+            for kind in self.entity_kinds
+        ]
+
+    def get_schema(self):
+        if self.explode:
+            return pyarrow.schema(
+                {
+                    "source_row": pyarrow.int64(),
+                    "kind": pyarrow.string(),
+                    "entity": pyarrow.string(),
+                }
+            )
+
+        list_type = pyarrow.list_(pyarrow.string())
+        return pyarrow.schema({name: list_type for name in self._list_column_names()})
+
+    def execute(self, *inputs):
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array([value.as_py()], type=value.type) for value in inputs],
+            names=self.input_columns(),
+        )
+        return iter_rows(self.execute_batch(batch))
+
+    def execute_batch(self, batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+        lists = [
+            extract_all(column, ENTITY_PATTERNS[kind])
+            for column in batch.columns
+            for kind in self.entity_kinds
+        ]
+        schema = unwrap(self.schema)
+
+        if not self.explode:
+            return pyarrow.RecordBatch.from_arrays(lists, schema=schema)
+
+        # Number the rows from the start of the source, not the start of the batch
+        first_row = self._num_input_rows_processed
+        rows = []
+        kinds = []
+        entities = []
+        for name, entity_lists in zip(self._list_column_names(), lists):
+            parents = pyarrow.compute.list_parent_indices(entity_lists).to_numpy()
+            rows.append(parents.astype(numpy.int64) + first_row)
+            kinds.append(numpy.full(len(parents), name, dtype=object))
+            entities.append(pyarrow.compute.list_flatten(entity_lists))
+
+        rows = numpy.concatenate(rows)
+        order = pyarrow.array(numpy.argsort(rows, kind="stable"))
+        columns = [
+            pyarrow.array(rows, type=pyarrow.int64()),
+            pyarrow.array(numpy.concatenate(kinds), type=pyarrow.string()),
+            pyarrow.concat_arrays(entities),
+        ]
+        return pyarrow.RecordBatch.from_arrays(
+            [column.take(order) for column in columns], schema=schema
+        )
@@ -0,0 +1,89 @@
+"""The groupby module provides a task implementation that summarizes groups of
+rows."""
+
+from typing import List
+
+import pyarrow
+from ..observableproxy import unwrap
+from ..pipeline.task import Aggregation, DatasetTask, HashAggregator
+from ..pipeline.task.aggregate import (
+    AGGREGATE_FUNCTIONS,
+    DEFAULT_MEMORY_BUDGET,
+    NUMERIC_FUNCTIONS,
+    is_numeric,
+    output_schema,
+)
+
+
+class GroupBy(DatasetTask):
+    """A GroupBy task groups rows by the values of one or more columns and
+    summarizes each group.
+
+    The task's column is the column, or list of columns, to group by. The
+    "aggregations" option is a list of objects with a "function", which is one of
+    "count", "sum", "mean", "min", "max" or "distinct", and a "column" to apply it
+    to. A count without a column counts the rows in each group, which is also
+    the default if there are no aggregations. The "memory_mb" option limits the
+    memory used for partial aggregates before they are spilled to disk.
+    """
+
+    @property
+    def keys(self) -> List[str]:
+        """The names of the columns to group by."""
+        return super().input_columns()
+
+    @property
+    def aggregations(self) -> List[Aggregation]:
+        """The summaries computed for each group."""
+        specs = unwrap(self.config).get("aggregations") or [{"function": "count"}]
+        return [Aggregation(spec["function"], spec.get("column")) for spec in specs]
+
+    def input_columns(self) -> List[str]:
+        columns = self.keys
+        for aggregation in self.aggregations:
+            if aggregation.column is not None and aggregation.column not in columns:
+                columns.append(aggregation.column)
+        return columns
+
+    def validate(self) -> bool:
+        if not super().validate():
+            return False
+
+        try:
+            aggregations = self.aggregations
+        except (KeyError, TypeError):
+            return False
+
+        source_schema = unwrap(self.source.schema)
+        for aggregation in aggregations:
+            if aggregation.function not in AGGREGATE_FUNCTIONS:
+                return False
+            if aggregation.column is None:
+                if aggregation.function != "count":
+                    return False
+                continue
+            if not self.validate_column_name(aggregation.column):
+                return False
+            column_type = source_schema.field(aggregation.column).type
+            if aggregation.function in NUMERIC_FUNCTIONS and not is_numeric(
+                column_type
+            ):
+                return False
+
+        return True
+
+    def get_schema(self) -> pyarrow.Schema:
+        source_schema = unwrap(self.source.schema)
+        return output_schema(source_schema, self.keys, self.aggregations)
+
+    def accumulator(self) -> HashAggregator:
+        memory_mb = unwrap(self.config).get("memory_mb")
+        return HashAggregator(
+            unwrap(self.source.schema),
+            self.keys,
+            self.aggregations,
+            self.spill_dir(),
+            memory_budget=(
+                DEFAULT_MEMORY_BUDGET if memory_mb is None else memory_mb * 1024 ** 2
+            ),
+        )
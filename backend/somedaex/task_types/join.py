@@ -0,0 +1,176 @@
+"""The join module provides a task implementation that combines the rows of two
+tables with matching keys."""
+
+import asyncio
+from typing import List
+
+import pyarrow
+from ..arrow_util import ArrowFileWriter, concat_batches
+from ..observableproxy import unwrap
+from ..pipeline.task import HashJoin, PolyadicTask, Status
+from ..pipeline.task.hashjoin import (
+    DEFAULT_MEMORY_BUDGET,
+    JOIN_TYPES,
+    join_schema,
+    keys_can_be_cast,
+)
+
+
+def _names(value) -> List[str]:
+    value = unwrap(value)
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [unwrap(name) for name in value]
+
+
+class Join(PolyadicTask):
+    """A Join task combines each row of its left input with the rows of its right
+    input that have the same keys.
+
+    The task's inputs are the left and right tasks. The "on" option names the key
+    column, or list of key columns, shared by both inputs. Alternatively,
+    "left_on" and "right_on" name the keys of each input separately. The "how"
+    option is one of "inner" (the default), "left", "semi" or "anti". The
+    "memory_mb" option limits the memory used for the hash table before both
+    inputs are partitioned on disk. The keys of the right input are cast to the
+    types of the left input's keys, so the task is invalid if they can't be.
+
+    The hash table is built from one input once it is complete, and the batches
+    of the other are joined as they are produced. An input that is already
+    complete is built on, preferring the smaller if both are; otherwise the
+    right input is.
+    """
+
+    num_inputs = 2
+
+    @property
+    def how(self) -> str:
+        """The type of join."""
+        return unwrap(self.config).get("how", "inner")
+
+    @property
+    def left_on(self) -> List[str]:
+        """The names of the key columns of the left input."""
+        config = unwrap(self.config)
+        return _names(config.get("left_on", config.get("on")))
+
+    @property
+    def right_on(self) -> List[str]:
+        """The names of the key columns of the right input."""
+        config = unwrap(self.config)
+        return _names(config.get("right_on", config.get("on")))
+
+    def validate(self) -> bool:
+        if not super().validate() or self.how not in JOIN_TYPES:
+            return False
+
+        left, right = self.input_tasks()
+        left_schema, right_schema = unwrap(left.schema), unwrap(right.schema)
+        left_on, right_on = self.left_on, self.right_on
+        return (
+            len(left_on) > 0
+            and len(left_on) == len(right_on)
+            and all(name in left_schema.names for name in left_on)
+            and all(name in right_schema.names for name in right_on)
+            and keys_can_be_cast(left_schema, right_schema, left_on, right_on)
+        )
+
+    def get_schema(self) -> pyarrow.Schema:
+        left, right = self.input_tasks()
+        return join_schema(
+            unwrap(left.schema), unwrap(right.schema), self.right_on, self.how
+        )
+
+    def _get_full_table(self):
+        return self._table_reader.read_table()
+
+    def _join(self) -> HashJoin:
+        left, right = self.input_tasks()
+        memory_mb = unwrap(self.config).get("memory_mb")
+        return HashJoin(
+            self.how,
+            unwrap(left.schema),
+            unwrap(right.schema),
+            self.left_on,
+            self.right_on,
+            self.spill_dir(),
+            memory_budget=(
+                DEFAULT_MEMORY_BUDGET if memory_mb is None else memory_mb * 1024 ** 2
+            ),
+        )
+
+    def _preview(self, inputs: List[pyarrow.RecordBatch]) -> pyarrow.RecordBatch:
+        left, right = [pyarrow.Table.from_batches([batch]) for batch in inputs]
+        join = self._join()
+        try:
+            batches = list(join.join(left, right))
+        finally:
+            join.close()
+        return concat_batches(batches, join.schema)
+
+    async def _build_on_left(self, left, right) -> bool:
+        """Decide whether to build the hash table from the left input."""
+        if left.status == Status.COMPLETE and right.status == Status.COMPLETE:
+            left_table = await left.get_table()
+            right_table = await right.get_table()
+            return left_table.num_rows <= right_table.num_rows
+        return left.status == Status.COMPLETE
+
+    async def _write(self, writer: ArrowFileWriter, batches, generation) -> bool:
+        """Write the batches produced by the join, returning False if the task is
+        reset meanwhile."""
+        for batch in batches:
+            if generation != self.generation:
+                return False
+            writer.write(batch)
+            # Let other tasks and requests proceed between batches
+            await asyncio.sleep(0)
+
+        return generation == self.generation
+
+    async def run(self):
+        if self.status in (Status.FINISHED, Status.COMPLETE):
+            return
+
+        generation = self.generation
+        self.status = Status.WORKING
+
+        left, right = self.input_tasks()
+        join = self._join()
+
+        try:
+            build_left = await self._build_on_left(left, right)
+            build, probe = (left, right) if build_left else (right, left)
+            build_table = await self.input_table(build)
+            if generation != self.generation:
+                return
+
+            join.start(build_table, build_left)
+            writer = ArrowFileWriter(
+                self.file_path(),
+                unwrap(self.schema),
+                self.output_options().ipc_options(),
+            )
+            try:
+                async for batch in probe.batches():
+                    if not await self._write(writer, join.probe(batch), generation):
+                        return
+                if not await self._write(writer, join.finish(), generation):
+                    return
+            finally:
+                writer.close()
+            self.record_output_stats()
+            self.update_stats(**join.stats())
+
+        except Exception:
+            if generation == self.generation:
+                self.status = Status.FAILED
+            raise
+
+        finally:
+            join.close()
+
+        self.status = Status.FINISHED
+        self.status = Status.COMPLETE
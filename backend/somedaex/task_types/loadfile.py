@@ -2,20 +2,84 @@
 file into a pipeline.
 """
 
+import asyncio
+from collections import OrderedDict
 from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
 from pathlib import Path
+import shutil
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
+import numpy
+import pyarrow
 import pyarrow.csv
+import pyarrow.dataset
+import pyarrow.ipc
 import pyarrow.json
 import pyarrow.parquet
+import pyarrow.types
+import rx.operators
 
-from ..arrow_util import ArrowFileWriter
-from ..observableproxy import observe
-from ..pipeline.task import NiladicTask, Status
+from ..arrow_util import (
+    ArrowFileWriter,
+    ArrowStreamReader,
+    ArrowStreamWriter,
+    DictionaryEncoder,
+)
+from ..observableproxy import observe, unwrap
+from ..pipeline.task import NiladicTask, Status, sample_table
 
 
 VALID_FORMATS = ("arrow", "csv", "json", "parquet")
 
+DATASET_FORMATS = {"arrow": "ipc", "csv": "csv", "parquet": "parquet"}
+"""The formats that pyarrow.dataset can scan, with the names it knows them by."""
+
+STREAMABLE_FORMATS = ("csv", "json")
+"""The formats that can be read from a compressed file, which can only be read
+from start to end."""
+
+COMPRESSION_EXTENSIONS = {
+    ".bz2": "bz2",
+    ".gz": "gzip",
+    ".lz4": "lz4",
+    ".zst": "zstd",
+    ".zstd": "zstd",
+}
+
+MAX_PARALLEL_FILES = max(2, min(8, os.cpu_count() or 1))
+"""The maximum number of files that are read or decompressed at the same time,
+when they are not scanned by pyarrow.dataset."""
+
+GLOB_CHARACTERS = "*?["
+
+JSON_CHUNK_BYTES = 16 << 20
+"""The number of bytes of a JSON file that are parsed at once."""
+
+PROBE_BYTES = 1 << 20
+"""The number of bytes read from the start of a JSON file to find its schema."""
+
+SAMPLE_BLOCK_BYTES = 64 << 10
+"""The size of the blocks of a CSV or JSON file that rows are sampled from."""
+
+MIN_SAMPLE_PARTS = 8
+"""The minimum number of parts of the files that a sample is drawn from, when
+there are that many, so that it isn't a single run of neighbouring rows."""
+
+MAX_PROBED_SCHEMAS = 256
+"""The maximum number of schemas remembered by LoadFile tasks."""
+
+_probed_schemas: "OrderedDict[tuple, Tuple[tuple, pyarrow.Schema]]" = OrderedDict()
+"""The schemas of the sets of files read by LoadFile tasks, with the size and
+modification time of each file when its schema was found."""
+
+Batches = Callable[[], Iterator[Tuple[pyarrow.RecordBatch, str]]]
+"""A function that starts a pass over the record batches of a set of files,
+along with the path of the file that each batch came from."""
+
 
 def _has_required_keys(config, keys):
     if isinstance(config, Mapping):
@@ -23,8 +87,86 @@ def _has_required_keys(config, keys):
     return False
 
 
+def _is_hidden(path: Path, base: Path) -> bool:
+    """Check whether a file should be skipped when a directory is read, like the
+    "_SUCCESS" markers and dot files written next to data files."""
+    return any(part.startswith((".", "_")) for part in path.relative_to(base).parts)
+
+
+def compression_of(path: Path) -> Optional[str]:
+    """Get the codec that a file is compressed with, going by its extension."""
+    return COMPRESSION_EXTENSIONS.get(path.suffix.lower())
+
+
+def open_input(path: Path) -> pyarrow.NativeFile:
+    """Open a file for reading, decompressing it as it is read if it is
+    compressed."""
+    compression = compression_of(path)
+    if compression is None:
+        return pyarrow.OSFile(str(path))
+    return pyarrow.CompressedInputStream(pyarrow.OSFile(str(path)), compression)
+
+
+def file_signature(files: List[Path]) -> tuple:
+    """Get the modification times and sizes of a set of files, which change
+    whenever the files do."""
+    stats = [file.stat() for file in files]
+    return tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+
+def _remember_schema(key: tuple, signature: tuple, schema: pyarrow.Schema):
+    _probed_schemas[key] = (signature, schema)
+    _probed_schemas.move_to_end(key)
+    while len(_probed_schemas) > MAX_PROBED_SCHEMAS:
+        _probed_schemas.popitem(last=False)
+
+
+def hive_partitions(path: Path, base: Path) -> Dict[str, str]:
+    """Get the partition keys encoded in the directories between a base
+    directory and a file, such as {"year": "2021"} for "year=2021/part-0.json"."""
+    keys = {}
+    for part in path.relative_to(base).parent.parts:
+        name, sep, value = part.partition("=")
+        if sep:
+            keys[name] = value
+    return keys
+
+
 class LoadFile(NiladicTask):
-    """A LoadFile task reads data from a file."""
+    """A LoadFile task reads data from a file.
+
+    The path is either a single file, a directory, or a glob pattern such as
+    "exports/**/*.parquet". Every file in a directory is read, apart from hidden
+    files and those whose names begin with an underscore. Directory names of the
+    form "key=value" are hive partitions, which become columns of the results.
+    The "filter" option maps partition columns to a value, or list of values, to
+    keep, and files in any other partition are not read at all.
+
+    The schemas of the files are unified, so columns that are missing from some
+    files are null in their rows. Files are read in parallel, and the number of
+    files read so far is reported in the task's statistics.
+
+    CSV and JSON files compressed with gzip, bzip2, LZ4 or Zstandard, such as
+    "events.jsonl.gz", are decompressed as they are read. JSON files must hold
+    one object per line, and are parsed a chunk of lines at a time.
+
+    Until the files have been read, the task is previewed with a random sample
+    of rows read from across its files.
+
+    The task's schema is published as soon as it is ready, so that the tasks
+    that read from it can be configured before its files are read. The schema
+    is probed in another thread, from the footer of each Parquet file, the
+    schema message of each Arrow file, or the first block of each CSV or JSON
+    file. If reading the files reveals a different schema, such as a JSON field
+    that only appears further down a file, the real schema is published and
+    the tasks that read from this one are reset, while this task carries on.
+    """
+
+    def __init__(self, **other):
+        super().__init__(**other)
+        observe(self.status).pipe(
+            rx.operators.filter(lambda status: status == Status.READY),
+        ).subscribe(self.on_ready)
 
     @property
     def path(self):
@@ -36,12 +178,197 @@ class LoadFile(NiladicTask):
         """The format of the file."""
         return self.config["format"]
 
+    @property
+    def filter(self) -> Dict[str, list]:
+        """The values of the partition columns to keep."""
+        spec = unwrap(self.config).get("filter") or {}
+        return {
+            key: list(value) if isinstance(value, (list, tuple)) else [value]
+            for key, value in spec.items()
+        }
+
+    @property
+    def base_dir(self) -> Path:
+        """The directory that the paths of hive partitions are relative to."""
+        path = str(self.path)
+        wildcards = [path.find(char) for char in GLOB_CHARACTERS if char in path]
+        if wildcards:
+            # The directory that holds the first wildcard
+            return Path(path[: min(wildcards) + 1]).parent
+        return self.path if self.path.is_dir() else self.path.parent
+
+    def files(self) -> List[Path]:
+        """List the files to read, in a stable order, leaving out files in
+        partitions that don't match the filter."""
+        path = str(self.path)
+        if any(char in path for char in GLOB_CHARACTERS):
+            paths = [Path(p) for p in glob.glob(path, recursive=True)]
+        elif self.path.is_dir():
+            paths = list(self.path.rglob("*"))
+        else:
+            paths = [self.path]
+
+        base = self.base_dir
+        files = sorted(p for p in paths if p.is_file() and not _is_hidden(p, base))
+        return [f for f in files if self._matches_filter(hive_partitions(f, base))]
+
+    def _matches_filter(self, partitions: Dict[str, str]) -> bool:
+        return all(
+            key not in partitions or partitions[key] in [str(v) for v in values]
+            for key, values in self.filter.items()
+        )
+
     def validate(self) -> bool:
-        return (
+        if not (
             _has_required_keys(self.config, ("path", "format"))
-            and self.path.is_file()
             and self.format in VALID_FORMATS
+        ):
+            return False
+
+        files = self.files()
+        return len(files) > 0 and (
+            self.format in STREAMABLE_FORMATS
+            or not any(compression_of(f) for f in files)
+        )
+
+    def on_ready(self, _):
+        """When the task becomes "ready", publish its schema. A schema that is
+        remembered is published straight away. Otherwise it is probed in another
+        thread, and the tasks that read from this one are reset once it has been
+        published, so that they are checked against it."""
+        try:
+            schema = self.remembered_schema(self.files())
+        except OSError:
+            schema = None
+        if schema is not None:
+            self.schema = schema
+            return
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Without an event loop there is nothing to wait on
+            self.schema = self._try_probe()
+            return
+        asyncio.ensure_future(self._publish_probed_schema(self.generation))
+
+    async def _publish_probed_schema(self, generation: int):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        schema = await loop.run_in_executor(None, self._try_probe)
+        # The files may have been read in full while the probe was running
+        if generation != self.generation or unwrap(self.schema) is not None:
+            return
+
+        self.update_stats(probe_seconds=time.perf_counter() - start)
+        if schema is not None:
+            self.schema = schema
+            self.request_readers_reset("Schema found")
+
+    def _try_probe(self) -> Optional[pyarrow.Schema]:
+        try:
+            return self.probe_schema()
+        except (pyarrow.ArrowException, OSError):
+            # The problem will be reported when the files are read
+            return None
+
+    def remembered_schema(self, files: List[Path]) -> Optional[pyarrow.Schema]:
+        """Get the schema that was probed for a set of files, if none of them
+        has changed since."""
+        key = self._probe_key(files)
+        probed = _probed_schemas.get(key)
+        if probed is not None and probed[0] == file_signature(files):
+            _probed_schemas.move_to_end(key)
+            return probed[1]
+        return None
+
+    def probe_schema(self) -> pyarrow.Schema:
+        """Find the schema of the task's files without reading all of them. The
+        schema is remembered until one of the files changes."""
+        files = self.files()
+        schema = self.remembered_schema(files)
+        if schema is not None:
+            return schema
+
+        signature = file_signature(files)
+        if self.format in DATASET_FORMATS and not any(map(compression_of, files)):
+            schema = self._discover_dataset(files)[1]
+        else:
+            probe = _csv_schema if self.format == "csv" else _json_schema
+            base = self.base_dir
+            with ThreadPoolExecutor(MAX_PARALLEL_FILES) as executor:
+                schemas = executor.map(lambda file: probe(file, base), files)
+                schema = unify_schemas(list(schemas))
+
+        _remember_schema(self._probe_key(files), signature, schema)
+        return schema
+
+    def _probe_key(self, files: List[Path]) -> tuple:
+        return (self.format, str(self.base_dir), tuple(str(f) for f in files))
+
+    def sample(self, num_rows: int) -> Optional[Tuple[pyarrow.RecordBatch, float]]:
+        """Read a random sample of rows from across all of the task's files.
+
+        The files are divided into parts that can be read on their own: the row
+        groups of Parquet files, the record batches of Arrow files and blocks of
+        lines of CSV and JSON files. Parts are read in a random order until
+        there are enough rows, and the sample is drawn from the rows of the parts
+        that were read, so that it isn't biased towards the start of the files.
+        The fraction of all rows it makes up is estimated from the share of the
+        parts that was read. Compressed files can't be read from the middle, so
+        they aren't sampled, and their preview waits for the task's results.
+        """
+        files = self.files()
+        if any(compression_of(file) is not None for file in files):
+            return None
+
+        # The schema may still be being probed
+        schema = unwrap(self.schema) or self.probe_schema()
+        base = self.base_dir
+        parts = [
+            (number, position, weight)
+            for number, file in enumerate(files)
+            for position, weight in _sample_parts(file, self.format)
+        ]
+        random = numpy.random.default_rng(0)
+
+        tables = []
+        rows_read = 0
+        weight_read = 0
+        for index in random.permutation(len(parts)):
+            if rows_read >= num_rows and len(tables) >= MIN_SAMPLE_PARTS:
+                break
+            number, position, weight = parts[index]
+            partitions = hive_partitions(files[number], base)
+            file_schema = pyarrow.schema(
+                [field for field in schema if field.name not in partitions]
+            )
+            table = _read_part(files[number], self.format, position, file_schema)
+            weight_read += weight
+            if table is None:
+                continue
+            table = _conform(_with_partitions(table, partitions), schema)
+            tables.append((number, position, table))
+            rows_read += table.num_rows
+
+        # The rows keep the order they have in the files
+        tables.sort(key=lambda part: part[:2])
+        table = (
+            pyarrow.concat_tables([t for _, _, t in tables])
+            if tables
+            else schema.empty_table()
         )
+        batch = sample_table(table, num_rows)
+        total_weight = sum(weight for _, _, weight in parts)
+        fraction = weight_read / total_weight if total_weight else 1.0
+        if table.num_rows:
+            fraction *= batch.num_rows / table.num_rows
+        return batch, fraction
+
+    def is_single_arrow_file(self) -> bool:
+        """Check whether the path is a single Arrow file, which can be memory-mapped
+        in place instead of being copied."""
+        return self.format == "arrow" and self.path.is_file()
 
     async def get_table(self):
         return self._get_table()
@@ -50,39 +377,433 @@ class LoadFile(NiladicTask):
         return self._table_reader.read_table()
 
     def file_path(self) -> Path:
-        if self.format == "arrow":
+        if self.is_single_arrow_file():
             return self.path
         return super().file_path()
 
     async def run(self):
         await observe(self.status).equals(Status.READY)
 
-        if self.format == "arrow":
-            print("format is arrow")
+        if self.is_single_arrow_file():
             table = await self.get_table()
-            print("table", table, table.schema)
             self.schema = table.schema
-            print("schema", self.schema)
 
         else:
-            try:
-                method_name = "_read_" + self.format
-                read_table = getattr(self, method_name)
-            except NameError as err:
-                raise Exception(f"Unsupported format {self.format}") from err
+            if self.format not in VALID_FORMATS:
+                raise Exception(f"Unsupported format {self.format}")
 
             self.status = Status.WORKING
-            temp_table = read_table()
-            self.schema = temp_table.schema
-            ArrowFileWriter.write_table(temp_table, self.file_path())
+            generation = self.generation
+            try:
+                completed = await self._load(generation)
+            except Exception:
+                if generation == self.generation:
+                    self.status = Status.FAILED
+                raise
+            if not completed:
+                return
 
         self.status = Status.COMPLETE
 
-    def _read_csv(self):
-        return pyarrow.csv.read_csv(self.path)
+    async def _load(self, generation: int) -> bool:
+        """Read every file into the task's result file. Returns False if the task
+        was reset before the files were read."""
+        loop = asyncio.get_running_loop()
+        files = self.files()
+        signature = file_signature(files)
+        if self.format == "csv" and any(compression_of(f) for f in files):
+            schema, batches = await loop.run_in_executor(
+                None, self._stream_csv_files, files
+            )
+        elif self.format in DATASET_FORMATS:
+            schema, batches = await loop.run_in_executor(
+                None, self._scan_dataset, files
+            )
+        else:
+            schema, batches = await self._read_json_files(files)
+        if generation != self.generation:
+            return False
+
+        if schema != unwrap(self.schema):
+            # The probe missed something, such as a field further down a JSON
+            # file. The files are still written, but the tasks that read from
+            # this one need to be checked against the real schema.
+            _remember_schema(self._probe_key(files), signature, schema)
+            self.schema = schema
+            self.request_readers_reset("Schema changed")
+
+        # Finding the dictionaries takes an extra pass over the files
+        options = self.output_options()
+        encoder = await loop.run_in_executor(
+            None,
+            DictionaryEncoder.scan,
+            schema,
+            (batch for batch, _ in batches()) if options.dictionary_encode else [],
+            options,
+        )
+        writer = ArrowFileWriter(
+            self.file_path(), encoder.schema, options.ipc_options()
+        )
+
+        files_read = set()
+        num_rows = 0
+        iterator = batches()
+        try:
+            while True:
+                # Read in another thread so that events and requests are handled
+                item = await loop.run_in_executor(None, next, iterator, None)
+                if item is None:
+                    break
+                if generation != self.generation:
+                    return False
+
+                batch, file = item
+                writer.write(encoder.encode(batch))
+                files_read.add(file)
+                num_rows += batch.num_rows
+                self.update_stats(
+                    files_read=len(files_read),
+                    files_total=len(files),
+                    rows_read=num_rows,
+                )
+        finally:
+            writer.close()
+
+        shutil.rmtree(self.spill_dir(), ignore_errors=True)
+        self.update_stats(files_read=len(files), files_total=len(files))
+        self.record_output_stats(encoder.encoded_columns)
+        return True
+
+    def _discover_dataset(self, files: List[Path]):
+        """Create a pyarrow.dataset for a set of files and find their unified
+        schema, which only reads the start of each file."""
+        file_format = DATASET_FORMATS[self.format]
+        paths = [str(f) for f in files]
+        partitioning = pyarrow.dataset.partitioning(flavor="hive")
+        base_dir = str(self.base_dir)
+
+        dataset = pyarrow.dataset.dataset(
+            paths,
+            format=file_format,
+            partitioning=partitioning,
+            partition_base_dir=base_dir,
+        )
+        schema = pyarrow.unify_schemas(
+            [dataset.schema]
+            + [fragment.physical_schema for fragment in dataset.get_fragments()]
+        )
+        dataset = pyarrow.dataset.dataset(
+            paths,
+            schema=schema,
+            format=file_format,
+            partitioning=partitioning,
+            partition_base_dir=base_dir,
+        )
+        return dataset, schema
+
+    def _scan_dataset(self, files: List[Path]) -> Tuple[pyarrow.Schema, Batches]:
+        """Scan files with pyarrow.dataset, which reads them in parallel and
+        leaves out the files of partitions that don't match the filter."""
+        dataset, schema = self._discover_dataset(files)
+
+        expression = None
+        for key, values in self.filter.items():
+            if key in schema.names:
+                values = pyarrow.array(values).cast(schema.field(key).type)
+                condition = pyarrow.dataset.field(key).isin(values)
+                expression = condition if expression is None else expression & condition
+
+        def batches():
+            scanner = dataset.scanner(filter=expression, use_threads=True)
+            for tagged in scanner.scan_batches():
+                yield tagged.record_batch, tagged.fragment.path
+
+        return schema, batches
+
+    def _stream_csv_files(self, files: List[Path]) -> Tuple[pyarrow.Schema, Batches]:
+        """Read CSV files a block at a time. This is used instead of
+        pyarrow.dataset when some of the files are compressed."""
+        base = self.base_dir
+        with ThreadPoolExecutor(MAX_PARALLEL_FILES) as executor:
+            schemas = executor.map(lambda file: _csv_schema(file, base), files)
+            schema = unify_schemas(list(schemas))
+
+        def batches():
+            for file in files:
+                partitions = hive_partitions(file, base)
+                with open_input(file) as stream:
+                    for batch in pyarrow.csv.open_csv(stream):
+                        batch = _with_partitions(batch, partitions)
+                        yield _conform(batch, schema), str(file)
+
+        return schema, batches
+
+    async def _read_json_files(
+        self, files: List[Path]
+    ) -> Tuple[pyarrow.Schema, Batches]:
+        """Read JSON files in parallel threads. pyarrow.dataset can't scan JSON,
+        so each file is parsed in chunks of whole lines, which are written to
+        temporary files in the spill directory as soon as they are parsed. Only
+        a chunk of each file that is being read is held in memory, and the
+        schemas of the chunks are unified once every file has been read."""
+        base = self.base_dir
+        spill_dir = self.spill_dir()
+        spill_dir.mkdir(parents=True, exist_ok=True)
+
+        def read(file: Path, number: int) -> List[Tuple[Path, pyarrow.Schema]]:
+            # A chunk whose schema differs from the one before starts a new piece
+            partitions = hive_partitions(file, base)
+            pieces = []
+            json_schema = writer = None
+            with open_input(file) as stream:
+                for chunk in _json_chunks(stream):
+                    table = _read_json_chunk(chunk, json_schema)
+                    json_schema = table.schema
+                    table = _with_partitions(table, partitions)
+                    if writer is None or table.schema != pieces[-1][1]:
+                        if writer is not None:
+                            writer.close()
+                        path = spill_dir / f"file-{number}-{len(pieces)}.arrows"
+                        writer = ArrowStreamWriter(path, table.schema)
+                        pieces.append((path, table.schema))
+                    writer.write(table)
+            if writer is not None:
+                writer.close()
+            return pieces
+
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(MAX_PARALLEL_FILES) as executor:
+            futures = [
+                loop.run_in_executor(executor, read, file, number)
+                for number, file in enumerate(files)
+            ]
+            pieces = []
+            for number, future in enumerate(futures):
+                pieces.append(await future)
+                self.update_stats(files_read=number + 1, files_total=len(files))
+
+        schema = unify_schemas([s for file_pieces in pieces for _, s in file_pieces])
+
+        def batches():
+            for file, file_pieces in zip(files, pieces):
+                for path, _ in file_pieces:
+                    reader = ArrowStreamReader(path)
+                    try:
+                        for batch in reader:
+                            yield _conform(batch, schema), str(file)
+                    finally:
+                        reader.close()
+
+        return schema, batches
+
+
+Data = Union[pyarrow.Table, pyarrow.RecordBatch]
+
+
+def unify_schemas(schemas: List[pyarrow.Schema]) -> pyarrow.Schema:
+    """Unify the schemas of several files, like pyarrow.unify_schemas, after
+    resolving the fields whose types conflict, which PyArrow 6 doesn't do.
+    Integers of different widths become int64, integers and floating point
+    numbers become float64, and any other conflict becomes a string."""
+    types: Dict[str, set] = {}
+    for schema in schemas:
+        for field in schema:
+            if not pyarrow.types.is_null(field.type):
+                types.setdefault(field.name, set()).add(field.type)
+    resolved = {
+        name: _common_type(field_types)
+        for name, field_types in types.items()
+        if len(field_types) > 1
+    }
+    return pyarrow.unify_schemas(
+        [
+            pyarrow.schema(
+                [
+                    field.with_type(resolved.get(field.name, field.type))
+                    for field in schema
+                ],
+                metadata=schema.metadata,
+            )
+            for schema in schemas
+        ]
+    )
+
+
+def _common_type(types: set) -> pyarrow.DataType:
+    if all(pyarrow.types.is_integer(t) for t in types):
+        return pyarrow.int64()
+    if all(pyarrow.types.is_integer(t) or pyarrow.types.is_floating(t) for t in types):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def _csv_schema(file: Path, base: Path) -> pyarrow.Schema:
+    """Find the schema of a CSV file from its first block."""
+    with open_input(file) as stream:
+        reader = pyarrow.csv.open_csv(stream)
+        return _partitioned_schema(reader.schema, hive_partitions(file, base))
+
+
+def _sample_parts(file: Path, file_format: str) -> List[Tuple[int, int]]:
+    """Divide a file into parts that can be read on their own by _read_part(),
+    each given by its position in the file and a weight in proportion to its
+    share of the file's rows. The parts are the row groups of a Parquet file,
+    the record batches of an Arrow file and blocks of bytes of a CSV or JSON
+    file."""
+    if file_format == "parquet":
+        metadata = pyarrow.parquet.ParquetFile(str(file)).metadata
+        return [
+            (number, metadata.row_group(number).num_rows)
+            for number in range(metadata.num_row_groups)
+        ]
+
+    if file_format == "arrow":
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(str(file)))
+        return [
+            (number, reader.get_batch(number).num_rows)
+            for number in range(reader.num_record_batches)
+        ]
+
+    with open(file, "rb") as stream:
+        if file_format == "csv":
+            stream.readline()
+        start = stream.tell()
+    size = file.stat().st_size
+    return [
+        (offset, min(SAMPLE_BLOCK_BYTES, size - offset))
+        for offset in range(start, size, SAMPLE_BLOCK_BYTES)
+    ]
+
+
+def _read_part(
+    file: Path, file_format: str, position: int, schema: pyarrow.Schema
+) -> Optional[pyarrow.Table]:
+    """Read one of the parts of a file found by _sample_parts(). The columns of a
+    CSV or JSON file are given the types in the schema. Returns None if a block
+    of a CSV or JSON file can't be parsed on its own."""
+    if file_format == "parquet":
+        return pyarrow.parquet.ParquetFile(str(file)).read_row_group(position)
+
+    if file_format == "arrow":
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(str(file)))
+        return pyarrow.Table.from_batches([reader.get_batch(position)])
+
+    with open(file, "rb") as stream:
+        header = stream.readline() if file_format == "csv" else b""
+        lines = _read_lines(stream, position, SAMPLE_BLOCK_BYTES)
+
+    try:
+        if file_format == "csv":
+            options = pyarrow.csv.ConvertOptions(
+                column_types={field.name: field.type for field in schema}
+            )
+            return pyarrow.csv.read_csv(
+                pyarrow.BufferReader(header + lines), convert_options=options
+            )
+        if not lines.strip():
+            return None
+        return _read_json_chunk(lines, schema)
+    except pyarrow.ArrowInvalid:
+        # A value that spans several lines may have been split
+        return None
+
+
+def _read_lines(stream, offset: int, size: int) -> bytes:
+    """Read the lines of a file that start within a block of bytes, so that every
+    line belongs to exactly one block. The stream is positioned at the start of
+    the first line that blocks are counted from."""
+    if offset > stream.tell():
+        # Skip the rest of a line that starts before the block
+        stream.seek(offset - 1)
+        stream.readline()
+
+    position = stream.tell()
+    end = offset + size
+    if position >= end:
+        return b""
+    lines = stream.read(end - position)
+    if not lines.endswith(b"\n"):
+        lines += stream.readline()
+    return lines
+
+
+def _json_chunks(
+    stream: pyarrow.NativeFile, size: int = JSON_CHUNK_BYTES
+) -> Iterator[bytes]:
+    """Read newline-delimited JSON in chunks of whole lines. A chunk is longer
+    than the given size only if a single line is."""
+    remainder = b""
+    while True:
+        block = stream.read(size)
+        if not block:
+            if remainder.strip():
+                yield remainder
+            return
+
+        chunk = remainder + block
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            remainder = chunk
+        else:
+            yield chunk[:end]
+            remainder = chunk[end:]
+
+
+def _read_json_chunk(chunk: bytes, schema: Optional[pyarrow.Schema]):
+    """Parse a chunk of JSON, keeping the types of the chunk before it if they
+    fit, so that a column whose values are all null in one chunk keeps its
+    type."""
+    if schema is not None:
+        options = pyarrow.json.ParseOptions(
+            explicit_schema=schema, unexpected_field_behavior="infer"
+        )
+        try:
+            return pyarrow.json.read_json(
+                pyarrow.BufferReader(chunk), parse_options=options
+            )
+        except pyarrow.ArrowInvalid:
+            pass
+    return pyarrow.json.read_json(pyarrow.BufferReader(chunk))
+
+
+def _json_schema(file: Path, base: Path) -> pyarrow.Schema:
+    """Find the schema of a JSON file from the lines in its first block."""
+    with open_input(file) as stream:
+        block = next(_json_chunks(stream, PROBE_BYTES), b"")
+    schema = pyarrow.json.read_json(pyarrow.BufferReader(block)).schema
+    return _partitioned_schema(schema, hive_partitions(file, base))
+
+
+def _partitioned_schema(
+    schema: pyarrow.Schema, partitions: Dict[str, str]
+) -> pyarrow.Schema:
+    """Add the partition columns of a file to its schema."""
+    for key in partitions:
+        if key not in schema.names:
+            schema = schema.append(pyarrow.field(key, pyarrow.string()))
+    return schema
+
+
+def _with_partitions(data: Data, partitions: Dict[str, str]) -> Data:
+    """Add the partition columns of a file to a table or record batch read from
+    it."""
+    names = data.schema.names
+    columns = list(data.columns)
+    for key, value in partitions.items():
+        if key not in names:
+            names = names + [key]
+            columns.append(pyarrow.array([value] * data.num_rows, pyarrow.string()))
+    return type(data).from_arrays(columns, names=names)
 
-    def _read_json(self):
-        return pyarrow.json.read_json(self.path)
 
-    def _read_parquet(self):
-        return pyarrow.parquet.read_table(self.path)
+def _conform(data: Data, schema: pyarrow.Schema) -> Data:
+    """Give a table or record batch the columns of a unified schema, in the same
+    order, filling columns it doesn't have with nulls."""
+    names = data.schema.names
+    columns = [
+        data.column(names.index(field.name)).cast(field.type)
+        if field.name in names
+        else pyarrow.nulls(data.num_rows, field.type)
+        for field in schema
+    ]
+    return type(data).from_arrays(columns, schema=schema)
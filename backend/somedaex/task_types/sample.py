@@ -0,0 +1,70 @@
+"""The sample module provides a task implementation that chooses a random sample
+of rows."""
+
+from typing import List, Optional
+
+import pyarrow
+from ..observableproxy import unwrap
+from ..pipeline.task import Bernoulli, DatasetTask, Reservoir
+from ..pipeline.task.sample import SAMPLE_METHODS
+
+
+DEFAULT_SIZE = 1000
+DEFAULT_FRACTION = 0.01
+
+
+class Sample(DatasetTask):
+    """A Sample task chooses rows of its source at random.
+
+    The "method" option is one of:
+
+    - "reservoir" (the default), which keeps "size" rows (1000 by default), each
+      as likely to be chosen as any other.
+    - "bernoulli", which keeps each row with probability "fraction" (0.01 by
+      default), so the size of the sample is proportional to the input.
+    - "stratified", which keeps "size" rows for each value of the task's column.
+
+    The "seed" option makes the sample repeatable. The sampled rows keep the
+    order they had in the source.
+    """
+
+    @property
+    def method(self) -> str:
+        """The way rows are chosen."""
+        return unwrap(self.config).get("method", "reservoir")
+
+    @property
+    def size(self) -> int:
+        """The number of rows in the sample, or in each stratum."""
+        return unwrap(self.config).get("size", DEFAULT_SIZE)
+
+    @property
+    def fraction(self) -> float:
+        """The probability of each row being chosen by a Bernoulli sample."""
+        return unwrap(self.config).get("fraction", DEFAULT_FRACTION)
+
+    @property
+    def seed(self) -> int:
+        """The seed of the random number generator."""
+        return unwrap(self.config).get("seed", 0)
+
+    def source_columns(self) -> Optional[List[str]]:
+        return None
+
+    def validate(self) -> bool:
+        if not super().validate() or self.method not in SAMPLE_METHODS:
+            return False
+        if self.method == "bernoulli":
+            return isinstance(self.fraction, (int, float)) and 0 <= self.fraction <= 1
+        return isinstance(self.size, int) and self.size > 0
+
+    def get_schema(self) -> pyarrow.Schema:
+        return unwrap(self.source.schema)
+
+    def accumulator(self):
+        schema = unwrap(self.source.schema)
+        if self.method == "bernoulli":
+            return Bernoulli(schema, self.fraction, self.spill_dir(), seed=self.seed)
+
+        stratify = unwrap(self.column) if self.method == "stratified" else None
+        return Reservoir(schema, self.size, stratify=stratify, seed=self.seed)
@@ -0,0 +1,80 @@
+"""The sort module provides a task implementation that orders rows by the values
+in one or more columns."""
+
+from typing import List, Optional
+
+import pyarrow
+from ..observableproxy import unwrap
+from ..pipeline.task import DatasetTask
+from ..pipeline.task.sort import (
+    DEFAULT_MEMORY_BUDGET,
+    SORT_ORDERS,
+    ExternalSort,
+    SortKeys,
+    TopK,
+)
+
+
+class Sort(DatasetTask):
+    """A Sort task orders the rows of its source by the values in its column, or
+    list of columns.
+
+    The "order" option is either "ascending" (the default) or "descending", or a
+    list with an order for each column. If the "limit" option is set, only that
+    many rows are kept, which finds the top k rows in a single pass without
+    writing anything to disk. Otherwise, the "memory_mb" option limits the
+    memory used for unsorted rows before sorted runs are written to disk and
+    merged.
+    """
+
+    @property
+    def sort_keys(self) -> SortKeys:
+        """The names of the columns to sort by, each with its sort order."""
+        columns = self.input_columns()
+        order = unwrap(self.config).get("order", "ascending")
+        if isinstance(order, str):
+            order = [order] * len(columns)
+        return list(zip(columns, order))
+
+    @property
+    def limit(self) -> Optional[int]:
+        """The maximum number of rows to keep, if any."""
+        return unwrap(self.config).get("limit")
+
+    def source_columns(self) -> Optional[List[str]]:
+        return None
+
+    def validate(self) -> bool:
+        if not super().validate():
+            return False
+
+        order = unwrap(self.config).get("order", "ascending")
+        if isinstance(order, str):
+            orders = [order]
+        elif isinstance(order, list) and len(order) == len(self.input_columns()):
+            orders = order
+        else:
+            return False
+
+        limit = self.limit
+        return all(o in SORT_ORDERS for o in orders) and (
+            limit is None or (isinstance(limit, int) and limit > 0)
+        )
+
+    def get_schema(self) -> pyarrow.Schema:
+        return unwrap(self.source.schema)
+
+    def accumulator(self):
+        schema = unwrap(self.source.schema)
+        if self.limit is not None:
+            return TopK(schema, self.sort_keys, self.limit)
+
+        memory_mb = unwrap(self.config).get("memory_mb")
+        return ExternalSort(
+            schema,
+            self.sort_keys,
+            self.spill_dir(),
+            memory_budget=(
+                DEFAULT_MEMORY_BUDGET if memory_mb is None else memory_mb * 1024 ** 2
+            ),
+        )
@@ -0,0 +1,103 @@
+"""The tokenize module provides a task implementation that splits text into
+tokens."""
+
+from functools import lru_cache
+
+import pyarrow
+import pyarrow.compute
+from ..arrow_util import extract_all, iter_rows, replace_list_values
+from ..observableproxy import unwrap
+from ..pipeline.task import OneToOneRowwiseTask
+from ..vocabulary import Vocabulary
+from .emoji import emoji_pattern
+from .entities import HASHTAG_PATTERN, MENTION_PATTERN, URL_PATTERN
+
+
+WORD_PATTERN = r"[\p{L}\p{N}_]+(?:['’][\p{L}\p{N}_]+)*"
+
+
+@lru_cache(maxsize=None)
+def token_pattern() -> str:
+    """Get a regular expression that matches a single token.
+
+    URLs, hashtags, @mentions and emoji are kept whole, words keep their
+    apostrophes, and any other character that is not whitespace is a token on its
+    own. The pattern has an empty first group so that it can be passed to
+    `extract_all`.
+    """
+    alternatives = [
+        URL_PATTERN,
+        HASHTAG_PATTERN,
+        MENTION_PATTERN,
+        emoji_pattern(),
+        WORD_PATTERN,
+        r"\S",
+    ]
+    return "()(" + "|".join(alternatives) + ")"
+
+
+class Tokenize(OneToOneRowwiseTask):
+    """A Tokenize task splits text into a list of tokens.
+
+    If the "lowercase" option is set, the text is lowercased first. If the
+    "token_ids" option is set, the task also produces a list of the ids of the
+    tokens, as assigned by the vocabulary in the pipeline's working directory.
+    The vocabulary grows as new tokens are found and is shared by every task in
+    the pipeline, so the ids are the same for the same token everywhere.
+
+    Whole batches are tokenized at once by Arrow's regular expression kernels.
+    """
+
+    def __init__(self, **args):
+        super().__init__(**args)
+        self._vocabulary: Vocabulary = None
+
+    @property
+    def lowercase(self) -> bool:
+        """Whether the text is lowercased before it is tokenized."""
+        return bool(unwrap(self.config).get("lowercase"))
+
+    @property
+    def token_ids(self) -> bool:
+        """Whether the task produces token ids in addition to tokens."""
+        return bool(unwrap(self.config).get("token_ids"))
+
+    @property
+    def vocabulary(self) -> Vocabulary:
+        """The vocabulary that assigns ids to tokens."""
+        if self._vocabulary is None:
+            self._vocabulary = Vocabulary.open(self._workdir)
+        return self._vocabulary
+
+    def get_schema(self):
+        fields = {}
+        for name in self.input_columns():
+            fields[name + "_tokens"] = pyarrow.list_(pyarrow.string())
+            if self.token_ids:
+                fields[name + "_token_ids"] = pyarrow.list_(pyarrow.int32())
+        return pyarrow.schema(fields)
+
+    def execute(self, *inputs):
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array([value.as_py()], type=value.type) for value in inputs],
+            names=self.input_columns(),
+        )
+        return next(iter_rows(self.execute_batch(batch)))
+
+    def execute_batch(self, batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+        columns = []
+        for column in batch.columns:
+            if self.lowercase:
+                column = pyarrow.compute.utf8_lower(column)
+
+            tokens = extract_all(column, token_pattern())
+            columns.append(tokens)
+
+            if self.token_ids:
+                ids = self.vocabulary.ids(tokens.flatten())
+                columns.append(replace_list_values(tokens, ids))
+
+        if self.token_ids:
+            self.update_stats(vocabulary_size=len(self.vocabulary))
+
+        return pyarrow.RecordBatch.from_arrays(columns, schema=unwrap(self.schema))
@@ -0,0 +1,78 @@
+"""The vocabulary module defines Vocabulary, which assigns integer ids to tokens
+and stores them in a pipeline's working directory."""
+
+from pathlib import Path
+from typing import Dict, List
+from weakref import WeakValueDictionary
+
+import pyarrow
+import pyarrow.compute
+
+
+VOCABULARY_NAME = "vocabulary.txt"
+
+_open_vocabularies: "WeakValueDictionary[Path, Vocabulary]" = WeakValueDictionary()
+
+
+class Vocabulary:
+    """A Vocabulary maps tokens to integer ids that never change once assigned.
+
+    New tokens are given the next unused id and appended to the vocabulary file,
+    one token per line, so the line number of a token is its id. Every task that
+    opens the vocabulary in the same working directory shares a single instance.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._tokens: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+        if path.exists():
+            text = path.read_text(encoding="utf-8")
+            self._tokens = text.split("\n")[:-1]
+            self._ids = {token: i for i, token in enumerate(self._tokens)}
+
+    @classmethod
+    def open(cls, workdir: Path) -> "Vocabulary":
+        """Get the vocabulary for a working directory, loading it if necessary."""
+        path = (workdir / VOCABULARY_NAME).resolve()
+        vocabulary = _open_vocabularies.get(path)
+        if vocabulary is None:
+            vocabulary = _open_vocabularies[path] = cls(path)
+        return vocabulary
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __contains__(self, token):
+        return token in self._ids
+
+    def token(self, token_id: int) -> str:
+        """Get the token with the given id."""
+        return self._tokens[token_id]
+
+    def ids(self, tokens: pyarrow.Array) -> pyarrow.Array:
+        """Get the id of each token in an array of strings, adding any tokens that
+        are not yet in the vocabulary.
+
+        Only the distinct tokens are looked up, so the cost of a lookup depends on
+        the number of distinct tokens rather than the length of the array.
+        """
+        distinct = pyarrow.compute.unique(tokens)
+        distinct_ids = []
+        new_tokens = []
+
+        for token in distinct.to_pylist():
+            token_id = self._ids.get(token)
+            if token_id is None:
+                token_id = self._ids[token] = len(self._tokens)
+                self._tokens.append(token)
+                new_tokens.append(token)
+            distinct_ids.append(token_id)
+
+        if new_tokens:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write("".join(token + "\n" for token in new_tokens))
+
+        indices = pyarrow.compute.index_in(tokens, value_set=distinct)
+        return pyarrow.array(distinct_ids, type=pyarrow.int32()).take(indices)
@@ -0,0 +1,201 @@
+"""Tests for grouping and summarizing rows with HashAggregator and the GroupBy
+task, in memory and with partial aggregates spilled to disk."""
+
+import asyncio
+import math
+
+import numpy
+import pyarrow
+import pytest
+
+from somedaex.observableproxy import unwrap
+from somedaex.pipeline import Pipeline
+from somedaex.pipeline.resets import MAX_RESET_DELAY
+from somedaex.pipeline.task import Aggregation, HashAggregator, Status
+from somedaex.task_types import task_types
+
+AGGREGATIONS = [
+    Aggregation("count"),
+    Aggregation("count", "n"),
+    Aggregation("sum", "n"),
+    Aggregation("mean", "x"),
+    Aggregation("min", "n"),
+    Aggregation("max", "x"),
+    Aggregation("distinct", "n"),
+]
+
+
+def make_batches(seed: int = 0, num_batches: int = 20):
+    random = numpy.random.default_rng(seed)
+    batches = []
+    for _ in range(num_batches):
+        size = 50
+        keys = [f"key {k}" for k in random.integers(0, 30, size)]
+        numbers = random.integers(-5, 10, size).tolist()
+        # Null keys form a group of their own, and null values are skipped
+        for row in random.choice(size, 5, replace=False):
+            keys[row] = None
+        for row in random.choice(size, 10, replace=False):
+            numbers[row] = None
+        batches.append(
+            pyarrow.RecordBatch.from_pydict(
+                {
+                    "k": pyarrow.array(keys, pyarrow.string()),
+                    "n": pyarrow.array(numbers, pyarrow.int64()),
+                    "x": pyarrow.array(random.normal(size=size)),
+                }
+            )
+        )
+    return batches
+
+
+def reference(batches, keys) -> dict:
+    groups = {}
+    for batch in batches:
+        for row in batch.to_pylist():
+            groups.setdefault(tuple(row[key] for key in keys), []).append(row)
+
+    results = {}
+    for key, rows in groups.items():
+        numbers = [row["n"] for row in rows if row["n"] is not None]
+        xs = [row["x"] for row in rows]
+        results[key] = (
+            len(rows),
+            len(numbers),
+            sum(numbers) if numbers else None,
+            sum(xs) / len(xs),
+            min(numbers) if numbers else None,
+            max(xs),
+            len(set(numbers)),
+        )
+    return results
+
+
+def check(aggregator: HashAggregator, batches, keys):
+    table = pyarrow.Table.from_batches(list(aggregator.results()), aggregator.schema)
+    assert table.schema.names == keys + [a.name for a in AGGREGATIONS]
+
+    expected = reference(batches, keys)
+    rows = table.to_pylist()
+    assert len(rows) == len(expected)
+    for row in rows:
+        key = tuple(row[name] for name in keys)
+        values = tuple(row[a.name] for a in AGGREGATIONS)
+        for value, expected_value in zip(values, expected[key]):
+            if isinstance(expected_value, float):
+                assert math.isclose(value, expected_value, abs_tol=1e-9)
+            else:
+                assert value == expected_value
+
+
+@pytest.mark.parametrize("keys", [["k"], ["k", "n"], []], ids=["one", "two", "none"])
+@pytest.mark.parametrize("memory_budget", [1 << 30, 1], ids=["memory", "spill"])
+def test_hash_aggregator(tmp_path, keys, memory_budget):
+    batches = make_batches()
+    aggregator = HashAggregator(
+        batches[0].schema, keys, AGGREGATIONS, tmp_path, memory_budget
+    )
+    try:
+        for batch in batches:
+            aggregator.add(batch)
+        if memory_budget == 1:
+            assert aggregator.stats()["spills"] > 0
+        check(aggregator, batches, keys)
+    finally:
+        aggregator.close()
+    assert not tmp_path.exists()
+
+
+def test_hash_aggregator_preview(tmp_path):
+    batches = make_batches(num_batches=2)
+    aggregator = HashAggregator(batches[0].schema, ["k"], AGGREGATIONS, tmp_path)
+    for batch in batches:
+        aggregator.add(batch)
+    preview = aggregator.preview(5)
+    assert preview.num_rows == 5
+    assert preview.schema == aggregator.schema
+    check(aggregator, batches, ["k"])
+    aggregator.close()
+
+
+def test_hash_aggregator_without_rows(tmp_path):
+    schema = make_batches(num_batches=1)[0].schema
+    aggregator = HashAggregator(schema, ["k"], AGGREGATIONS, tmp_path)
+    assert list(aggregator.results()) == []
+    aggregator.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("memory_mb", [None, 0], ids=["memory", "spill"])
+async def test_group_by_task(tmp_path, memory_mb):
+    batches = make_batches(num_batches=4)
+    path = tmp_path / "input.csv"
+    lines = [
+        ",".join("" if v is None else str(v) for v in row.values()) + "\n"
+        for batch in batches
+        for row in batch.to_pylist()
+    ]
+    path.write_text("k,n,x\n" + "".join(lines))
+
+    aggregations = [{"function": a.function, "column": a.column} for a in AGGREGATIONS]
+    pipeline = Pipeline(task_types, tmp_path / "work")
+    pipeline.apply_batch(
+        [
+            {"op": "create", "type": "LoadFile", "id": 0, "format": "csv"},
+            {"op": "create", "type": "GroupBy", "id": 1, "source": 0, "column": None},
+            {"op": "update", "id": 0, "path": str(path)},
+            {
+                "op": "update",
+                "id": 1,
+                "column": "k",
+                "aggregations": aggregations,
+                "memory_mb": memory_mb,
+            },
+        ]
+    )
+    task = pipeline[1]
+    await asyncio.sleep(MAX_RESET_DELAY + 0.25)
+    assert task.status in (Status.READY, Status.WORKING, Status.COMPLETE)
+
+    results = []
+    async for batch in task.batches():
+        results.append(batch)
+    table = pyarrow.Table.from_batches(results, unwrap(task.schema))
+    # The null keys were written as empty strings, which CSV reads as such
+    expected = {
+        key or "": values for (key,), values in reference(batches, ["k"]).items()
+    }
+    assert len(table) == len(expected)
+    for row in table.to_pylist():
+        assert row["count"] == expected[row["k"]][0]
+        assert row["n_sum"] == expected[row["k"]][2]
+        assert row["n_distinct"] == expected[row["k"]][6]
+    if memory_mb == 0:
+        assert task.stats["spills"] > 0
+    pipeline.close()
+
+
+@pytest.mark.asyncio
+async def test_group_by_rejects_numeric_functions_of_text(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_text("k,n\na,1\nb,2\n")
+    pipeline = Pipeline(task_types, tmp_path / "work")
+    pipeline.apply_batch(
+        [
+            {"op": "create", "type": "LoadFile", "id": 0, "format": "csv"},
+            {"op": "update", "id": 0, "path": str(path)},
+        ]
+    )
+    source = pipeline[0]
+    source.schema = pyarrow.schema({"k": pyarrow.string(), "n": pyarrow.int64()})
+
+    task = pipeline.create_task("GroupBy", source=0, column="k")
+    task.config.update({"aggregations": [{"function": "sum", "column": "n"}]})
+    assert task.validate()
+    task.config.update({"aggregations": [{"function": "sum", "column": "k"}]})
+    assert not task.validate()
+    task.config.update({"aggregations": [{"function": "median", "column": "n"}]})
+    assert not task.validate()
+    task.config.update({"aggregations": [{"function": "distinct"}]})
+    assert not task.validate()
+    pipeline.close()
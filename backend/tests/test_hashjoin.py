@@ -0,0 +1,108 @@
+"""Tests for joining tables with HashJoin, in memory and with both sides
+partitioned on disk, against a reference nested-loop join."""
+
+import numpy
+import pyarrow
+import pytest
+
+from somedaex.pipeline.task import HashJoin
+from somedaex.pipeline.task.hashjoin import keys_can_be_cast
+
+
+def make_tables(seed: int = 0):
+    random = numpy.random.default_rng(seed)
+    left_keys = random.integers(0, 40, 300).tolist()
+    right_keys = random.integers(20, 60, 200).tolist()
+    # Null keys never match
+    left_keys[::17] = [None] * len(left_keys[::17])
+    right_keys[::13] = [None] * len(right_keys[::13])
+
+    left = pyarrow.table(
+        {
+            "k": pyarrow.array(left_keys, pyarrow.int64()),
+            "a": [f"left {i}" for i in range(len(left_keys))],
+        }
+    )
+    right = pyarrow.table(
+        {
+            "k": pyarrow.array(right_keys, pyarrow.int32()),
+            "a": [f"right {i}" for i in range(len(right_keys))],
+            "b": pyarrow.array(range(len(right_keys)), pyarrow.float64()),
+        }
+    )
+    return left, right
+
+
+def reference_join(left: pyarrow.Table, right: pyarrow.Table, how: str) -> list:
+    right_rows = right.to_pylist()
+    results = []
+    for row in left.to_pylist():
+        matches = [
+            other
+            for other in right_rows
+            if row["k"] is not None and other["k"] == row["k"]
+        ]
+        if how == "semi":
+            results.extend([(row["k"], row["a"])] if matches else [])
+        elif how == "anti":
+            results.extend([] if matches else [(row["k"], row["a"])])
+        else:
+            if not matches and how == "left":
+                matches = [{"a": None, "b": None}]
+            results.extend(
+                (row["k"], row["a"], other["a"], other["b"]) for other in matches
+            )
+    return sorted(results, key=repr)
+
+
+def results(join: HashJoin, batches) -> list:
+    table = pyarrow.Table.from_batches(list(batches), join.schema)
+    return sorted([tuple(row.values()) for row in table.to_pylist()], key=repr)
+
+
+@pytest.mark.parametrize("how", ["inner", "left", "semi", "anti"])
+@pytest.mark.parametrize("memory_budget", [1 << 30, 1], ids=["memory", "spill"])
+@pytest.mark.parametrize("build_left", [True, False], ids=["build_left", "build_right"])
+def test_hash_join(tmp_path, how, memory_budget, build_left):
+    left, right = make_tables()
+    join = HashJoin(
+        how, left.schema, right.schema, ["k"], ["k"], tmp_path, memory_budget
+    )
+    build, probe = (left, right) if build_left else (right, left)
+
+    def batches():
+        join.start(build, build_left)
+        for batch in probe.to_batches(max_chunksize=32):
+            yield from join.probe(batch)
+        yield from join.finish()
+
+    try:
+        assert results(join, batches()) == reference_join(left, right, how)
+        assert (join.spilled_bytes > 0) == (memory_budget == 1)
+    finally:
+        join.close()
+
+    if how in ("inner", "left"):
+        assert join.schema.names == ["k", "a", "a_right", "b"]
+    else:
+        assert join.schema == left.schema
+
+
+def test_join_of_whole_tables(tmp_path):
+    left, right = make_tables(seed=1)
+    join = HashJoin("left", left.schema, right.schema, ["k"], ["k"], tmp_path)
+    try:
+        assert results(join, join.join(left, right)) == reference_join(
+            left, right, "left"
+        )
+        assert join.build_side == "right"
+    finally:
+        join.close()
+
+
+def test_keys_can_be_cast():
+    left = pyarrow.schema({"k": pyarrow.int64(), "s": pyarrow.string()})
+    right = pyarrow.schema({"k": pyarrow.int32(), "l": pyarrow.list_(pyarrow.int64())})
+    assert keys_can_be_cast(left, right, ["k"], ["k"])
+    assert keys_can_be_cast(left, right, ["s"], ["k"])
+    assert not keys_can_be_cast(left, right, ["k"], ["l"])
@@ -0,0 +1,94 @@
+"""Tests for sampling the files read by a LoadFile task, which previews them
+before they are loaded."""
+
+import gzip
+import json
+
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
+import pytest
+
+from somedaex.task_types.loadfile import LoadFile
+
+
+NUM_ROWS = 20000
+
+
+def sorted_table() -> pyarrow.Table:
+    values = list(range(NUM_ROWS))
+    return pyarrow.table({"n": values, "text": [f"row {v}" for v in values]})
+
+
+def write(path, file_format: str, table: pyarrow.Table):
+    if file_format == "csv":
+        lines = [f"{n},{text}\n" for n, text in zip(*table.to_pydict().values())]
+        path.write_text("n,text\n" + "".join(lines))
+    elif file_format == "json":
+        lines = [json.dumps(row) + "\n" for row in table.to_pylist()]
+        path.write_text("".join(lines))
+    elif file_format == "parquet":
+        pyarrow.parquet.write_table(table, str(path), row_group_size=500)
+    else:
+        with pyarrow.ipc.new_file(str(path), table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=500):
+                writer.write_batch(batch)
+
+
+def load_file(tmp_path, path, file_format: str) -> LoadFile:
+    return LoadFile(id=0, workdir=tmp_path, path=str(path), format=file_format)
+
+
+@pytest.mark.parametrize("file_format", ["csv", "json", "parquet", "arrow"])
+def test_sample_of_sorted_file_is_not_its_prefix(tmp_path, file_format):
+    path = tmp_path / f"input.{file_format}"
+    write(path, file_format, sorted_table())
+    task = load_file(tmp_path, path, file_format)
+
+    batch, fraction = task.sample(100)
+    values = batch.column(batch.schema.get_field_index("n")).to_pylist()
+    assert len(values) == 100
+    assert values == sorted(values)
+    assert len(set(values)) == 100
+    # A prefix would end at row 99
+    assert values[-1] > NUM_ROWS // 2
+    assert values[0] < NUM_ROWS // 2
+    assert fraction == pytest.approx(100 / NUM_ROWS, rel=0.5)
+    assert batch.column(batch.schema.get_field_index("text")).to_pylist() == [
+        f"row {v}" for v in values
+    ]
+
+
+def test_sample_across_files(tmp_path):
+    table = sorted_table()
+    directory = tmp_path / "input"
+    for number in range(4):
+        part = directory / f"part={number}"
+        part.mkdir(parents=True)
+        rows = table.slice(number * NUM_ROWS // 4, NUM_ROWS // 4)
+        write(part / "data.parquet", "parquet", rows)
+    task = load_file(tmp_path, directory, "parquet")
+
+    batch, _ = task.sample(200)
+    parts = set(batch.column(batch.schema.get_field_index("part")).to_pylist())
+    assert len(parts) > 1
+    assert batch.num_rows == 200
+
+
+def test_small_file_is_sampled_whole(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_text("n,text\n1,a\n2,b\n3,c")
+    task = load_file(tmp_path, path, "csv")
+
+    batch, fraction = task.sample(100)
+    assert batch.column(0).to_pylist() == [1, 2, 3]
+    assert fraction == 1.0
+
+
+def test_compressed_files_are_not_sampled(tmp_path):
+    path = tmp_path / "input.csv.gz"
+    with gzip.open(path, "wt") as stream:
+        stream.write("n,text\n1,a\n2,b\n")
+    task = load_file(tmp_path, path, "csv")
+
+    assert task.sample(100) is None
@@ -0,0 +1,164 @@
+"""Tests for shingle hashing, MinHash signatures and the clustering of rows by
+their LSH band keys."""
+
+import numpy
+import pyarrow
+
+from somedaex import minhash
+from somedaex.minhash import LshIndex, MinHasher, shingle_hashes
+from somedaex.task_types.dedupe import Dedupe
+
+
+def test_shingle_bounds():
+    strings = pyarrow.array(["abcdefg", "", None, "abc", "abcde"])
+    hashes, bounds = shingle_hashes(strings, size=5)
+    # 3 shingles, none for empty and null strings, the whole of a short string,
+    # and exactly one for a string as long as a shingle
+    assert bounds.tolist() == [0, 3, 3, 3, 4, 5]
+    assert len(hashes) == 5
+
+
+def test_shingle_hashes_depend_only_on_the_shingle():
+    hashes, bounds = shingle_hashes(pyarrow.array(["xxabcde", "abcdeyy"]), size=5)
+    first = hashes[bounds[0] : bounds[1]]
+    second = hashes[bounds[1] : bounds[2]]
+    # "abcde" is the last shingle of the first string and the first of the second
+    assert first[-1] == second[0]
+    assert len(set(first.tolist())) == len(first)
+
+
+def test_shingle_hashes_of_a_slice():
+    strings = pyarrow.array(["hello world", "goodbye", "another string"])
+    hashes, bounds = shingle_hashes(strings.slice(1), size=3)
+    expected, expected_bounds = shingle_hashes(
+        pyarrow.array(["goodbye", "another string"]), size=3
+    )
+    assert bounds.tolist() == expected_bounds.tolist()
+    assert hashes.tolist() == expected.tolist()
+
+
+def test_short_strings_differ_from_their_prefixes():
+    hashes, _ = shingle_hashes(pyarrow.array(["ab", "abc"]), size=5)
+    assert hashes[0] != hashes[1]
+
+
+def naive_signature(minhasher: MinHasher, text: str) -> numpy.ndarray:
+    hashes, _ = shingle_hashes(pyarrow.array([text]), minhasher.shingle_size)
+    with numpy.errstate(over="ignore"):
+        permuted = hashes[:, None] * minhasher._a[None, :] + minhasher._b[None, :]
+    return permuted.min(axis=0)
+
+
+def test_signatures_across_chunks(monkeypatch):
+    strings = [
+        "a long string whose shingles span several chunks of hashes",
+        "",
+        "tiny",
+        None,
+        "another string that is longer than a chunk",
+        "x",
+    ]
+    minhasher = MinHasher()
+    unchunked = minhasher.signatures(pyarrow.array(strings))
+
+    for max_shingles in (1, 2, 7, 40):
+        monkeypatch.setattr(minhash, "MAX_SHINGLES", max_shingles)
+        chunked = minhasher.signatures(pyarrow.array(strings))
+        assert numpy.array_equal(chunked, unchunked)
+
+    for row, text in enumerate(strings):
+        if text:
+            assert numpy.array_equal(unchunked[row], naive_signature(minhasher, text))
+        else:
+            assert (unchunked[row] == minhash._EMPTY).all()
+
+
+def test_similar_strings_share_bands():
+    minhasher = MinHasher()
+    text = "the quick brown fox jumps over the lazy dog " * 4
+    keys = minhasher.band_keys(
+        minhasher.signatures(pyarrow.array([text, text + "!", "something else"]))
+    )
+    assert (keys[0] == keys[1]).any()
+    assert not (keys[0] == keys[2]).any()
+
+
+def make_dedupe(tmp_path) -> Dedupe:
+    dedupe = Dedupe.__new__(Dedupe)
+    dedupe._source_reset_subscription = None
+    dedupe._index = LshIndex(tmp_path / "index", memory_budget=1024 ** 2)
+    return dedupe
+
+
+def test_assign_clusters_follows_chains(tmp_path):
+    dedupe = make_dedupe(tmp_path)
+    # Each row shares one band with the next, except the last, which shares
+    # nothing, so the first four rows form a chain
+    keys = numpy.array(
+        [
+            [1, 10, 20],
+            [1, 11, 21],
+            [2, 11, 22],
+            [3, 12, 22],
+            [4, 13, 23],
+        ],
+        dtype=numpy.uint64,
+    )
+    row_ids = numpy.arange(100, 105)
+    clusters = dedupe._assign_clusters(keys, row_ids)
+    assert clusters.tolist() == [100, 100, 100, 100, 104]
+
+
+def test_assign_clusters_long_chain(tmp_path):
+    dedupe = make_dedupe(tmp_path)
+    num_rows = 1000
+    # Row i holds key i, which row i - 1 holds too, so the rows form one chain
+    first = numpy.arange(num_rows, dtype=numpy.uint64)
+    second = first + numpy.uint64(1)
+    keys = numpy.stack([first, second], axis=1)
+    clusters = dedupe._assign_clusters(keys, numpy.arange(num_rows))
+    assert (clusters == 0).all()
+
+
+def test_assign_clusters_across_batches(tmp_path):
+    dedupe = make_dedupe(tmp_path)
+    dedupe._assign_clusters(
+        numpy.array([[1, 10], [2, 20]], dtype=numpy.uint64), numpy.array([0, 1])
+    )
+    # The first row claimed key 10 and the second key 2, so a row with both
+    # joins the older cluster, and rows that share a new key join the cluster of
+    # the first of them
+    clusters = dedupe._assign_clusters(
+        numpy.array([[2, 10], [3, 30], [4, 30]], dtype=numpy.uint64),
+        numpy.array([2, 3, 4]),
+    )
+    assert clusters.tolist() == [0, 3, 3]
+
+
+def test_index_merges_levels_on_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(minhash, "MERGE_CHUNK", 7)
+    index = LshIndex(tmp_path / "index", memory_budget=256)
+    random = numpy.random.default_rng(0)
+    keys = random.permutation(1000).astype(numpy.uint64)
+    clusters = numpy.arange(1000, dtype=numpy.int64)
+    bounds = numpy.sort(random.choice(numpy.arange(1, 1000), 40, replace=False))
+    for start, end in zip([0, *bounds], [*bounds, 1000]):
+        index.add(keys[start:end], clusters[start:end])
+
+    stats = index.stats()
+    assert stats["keys"] == 1000
+    assert stats["disk_levels"] > 0
+    assert stats["memory_bytes"] <= 256
+    for level in index._levels:
+        assert (numpy.diff(level.keys.astype(numpy.int64)) > 0).all()
+
+    expected = numpy.full(1200, -1, dtype=numpy.int64)
+    expected[keys.astype(numpy.int64)] = clusters
+    assert numpy.array_equal(
+        index.lookup(numpy.arange(1200, dtype=numpy.uint64)), expected
+    )
+
+    # Merged levels replace the files they were merged from
+    files = list((tmp_path / "index").iterdir())
+    assert len(files) == 2 * stats["disk_levels"]
+    index.close()
@@ -0,0 +1,96 @@
+"""Tests for how a pipeline resets and runs its tasks as they are edited."""
+
+import asyncio
+
+import pytest
+
+from somedaex.pipeline import Pipeline
+from somedaex.pipeline.resets import MAX_RESET_DELAY
+from somedaex.pipeline.task import Status
+from somedaex.task_types import task_types
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_pipeline(tmp_path) -> Pipeline:
+    path = tmp_path / "input.csv"
+    path.write_text("text\n" + "".join(f"Row {i}\n" for i in range(100)))
+
+    pipeline = Pipeline(task_types, tmp_path / "work")
+    pipeline.apply_batch(
+        [
+            {"op": "create", "type": "LoadFile", "id": 0, "format": "csv"},
+            {"op": "create", "type": "CaseFold", "id": 1, "source": 0, "column": None},
+            {"op": "update", "id": 0, "path": str(path)},
+            {"op": "update", "id": 1, "column": "text"},
+        ]
+    )
+    return pipeline
+
+
+async def read_all(task) -> int:
+    num_rows = 0
+    async for batch in task.batches():
+        num_rows += batch.num_rows
+    return num_rows
+
+
+async def settle():
+    """Wait long enough for any reset requests to be carried out."""
+    await asyncio.sleep(MAX_RESET_DELAY + 0.25)
+
+
+async def test_one_run_per_edit(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    task = pipeline[1]
+    await settle()
+
+    runs = []
+    task.reset.subscribe(runs.append)
+    pipeline.update_task(1, {"column": "text"})
+    pipeline.update_task(1, {"column": ["text"]})
+    await settle()
+    assert len(runs) == 1
+
+    assert await read_all(task) == 100
+    generation = task.generation
+    await settle()
+    # Reading the source through the task's proxy of it must not count as a
+    # change to the source
+    assert task.generation == generation
+    assert len(runs) == 1
+    pipeline.close()
+
+
+async def test_completed_task_stays_complete(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    task = pipeline[1]
+    await settle()
+
+    assert await read_all(task) == 100
+    assert task.status == Status.COMPLETE
+    for _ in range(2):
+        await settle()
+        assert task.status == Status.COMPLETE
+        assert await read_all(task) == 100
+    pipeline.close()
+
+
+async def test_reading_through_the_source_proxy_requests_no_reset(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    task = pipeline[1]
+    await settle()
+
+    runs = []
+    task.reset.subscribe(runs.append)
+    # A method called through the proxy is published as a change of source
+    task.source.sources()
+    pipeline.update_task(1, {"source": 0})
+    await settle()
+    assert not runs
+
+    pipeline.update_task(1, {"source": None})
+    await settle()
+    assert runs == ["Source changed"]
+    pipeline.close()
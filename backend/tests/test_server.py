@@ -0,0 +1,256 @@
+"""Tests for the HTTP and WebSocket routes of the server, run against a pipeline
+that loads a small CSV file and lowercases one of its columns."""
+
+import asyncio
+import io
+
+import pyarrow
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet
+import pytest
+import pytest_asyncio
+
+from somedaex.http import Server
+from somedaex.http.websocket import FRAME_HEADER
+from somedaex.pipeline import PipelineRegistry
+from somedaex.task_types import task_types
+
+pytestmark = pytest.mark.asyncio
+
+TEXT = ["Hello", "WORLD", "Foo"]
+
+
+@pytest_asyncio.fixture
+async def client(aiohttp_client, tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_text("text,n\n" + "".join(f"{t},{i}\n" for i, t in enumerate(TEXT)))
+
+    server = Server(PipelineRegistry(task_types, tmp_path / "work"))
+    client = await aiohttp_client(server.app)
+
+    # Tasks only become ready when their configuration changes, as it does when
+    # they are edited in the UI
+    operations = [
+        {"op": "create", "type": "LoadFile", "id": 0, "format": "csv"},
+        {"op": "create", "type": "CaseFold", "id": 1, "source": 0, "column": None},
+        {"op": "update", "id": 0, "path": str(path)},
+        {"op": "update", "id": 1, "column": "text"},
+    ]
+    response = await client.post("/batch", json={"operations": operations})
+    assert response.status == 200
+    return client
+
+
+async def wait_until_complete(client, task_id: int) -> dict:
+    for _ in range(100):
+        response = await client.get(f"/{task_id}")
+        task = await response.json()
+        if task["status"] == "complete":
+            return task
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"Task {task_id} did not complete")
+
+
+async def test_get_pipeline(client):
+    await wait_until_complete(client, 1)
+    response = await client.get("/")
+    assert response.status == 200
+    tasks = (await response.json())["tasks"]
+    assert [task["type"] for task in tasks] == ["loadFile", "caseFold"]
+
+    etag = response.headers["ETag"]
+    response = await client.get("/", headers={"If-None-Match": etag})
+    assert response.status == 304
+
+
+async def test_get_task(client):
+    task = await wait_until_complete(client, 1)
+    assert task["column"] == "text"
+
+    response = await client.get("/1")
+    response = await client.get(
+        "/1", headers={"If-None-Match": response.headers["ETag"]}
+    )
+    assert response.status == 304
+
+    response = await client.get("/7")
+    assert response.status == 404
+
+
+async def test_named_pipeline(client):
+    response = await client.get("/pipelines/other/")
+    assert response.status == 200
+    assert (await response.json())["tasks"] == []
+
+    response = await client.get("/pipelines")
+    assert "other" in (await response.json())["pipelines"]
+
+
+@pytest.mark.parametrize("export_format", ["csv", "arrow", "parquet"])
+async def test_export(client, export_format):
+    await wait_until_complete(client, 1)
+    response = await client.get(
+        "/1/export", params={"format": export_format, "columns": "text_lower"}
+    )
+    assert response.status == 200
+    data = io.BytesIO(await response.read())
+
+    if export_format == "csv":
+        table = pyarrow.csv.read_csv(data)
+    elif export_format == "arrow":
+        table = pyarrow.ipc.open_stream(data).read_all()
+    else:
+        table = pyarrow.parquet.read_table(data)
+    assert table.column("text_lower").to_pylist() == [t.lower() for t in TEXT]
+
+
+async def test_export_unknown_columns(client):
+    await wait_until_complete(client, 1)
+    response = await client.get("/1/export", params={"columns": "text_lower,nope"})
+    assert response.status == 400
+    assert "nope" in await response.text()
+
+
+async def test_export_without_schema(client):
+    response = await client.post(
+        "/batch",
+        json={
+            "operations": [
+                {"op": "create", "type": "CaseFold", "source": 1, "column": None}
+            ]
+        },
+    )
+    task_id = (await response.json())["tasks"][0]["id"]
+    response = await client.get(f"/{task_id}/export", params={"columns": "x"})
+    assert response.status == 400
+
+
+async def test_export_of_empty_results(client, tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text("text,n\n")
+    operations = [
+        {"op": "create", "type": "LoadFile", "id": 5, "format": "csv"},
+        {"op": "update", "id": 5, "path": str(path)},
+    ]
+    await client.post("/batch", json={"operations": operations})
+    await wait_until_complete(client, 5)
+
+    response = await client.get("/5/export", params={"columns": "nope"})
+    assert response.status == 400
+    response = await client.get(
+        "/5/export", params={"format": "arrow", "columns": "text"}
+    )
+    assert response.status == 200
+    table = pyarrow.ipc.open_stream(io.BytesIO(await response.read())).read_all()
+    assert table.schema.names == ["text"]
+    assert table.num_rows == 0
+
+
+async def test_export_unknown_format(client):
+    response = await client.get("/1/export", params={"format": "xlsx"})
+    assert response.status == 400
+
+
+async def test_disk_usage(client):
+    await wait_until_complete(client, 1)
+    response = await client.get("/disk")
+    assert response.status == 200
+    assert isinstance(await response.json(), dict)
+
+
+async def test_delete_task(client):
+    response = await client.delete("/1")
+    assert response.status == 204
+    response = await client.get("/1")
+    assert response.status == 404
+
+
+async def test_socket_subscribe(client):
+    await wait_until_complete(client, 1)
+    async with client.ws_connect("/ws") as socket:
+        await socket.send_json({"op": "subscribe", "id": "s", "task": 1})
+
+        stream = io.BytesIO()
+        end = None
+        while end is None:
+            message = await socket.receive(timeout=5)
+            if isinstance(message.data, bytes):
+                (number,) = FRAME_HEADER.unpack_from(message.data)
+                assert number == 1
+                stream.write(message.data[FRAME_HEADER.size :])
+                continue
+
+            reply = message.json()
+            if reply.get("id") == "s":
+                assert reply["subscription"] == 1
+            elif reply.get("subscription") == 1:
+                end = reply
+
+    assert end["event"] == "end"
+    assert end["rows"] == len(TEXT)
+    stream.seek(0)
+    table = pyarrow.ipc.open_stream(stream).read_all()
+    assert table.column("text_lower").to_pylist() == [t.lower() for t in TEXT]
+
+
+async def command(socket, message: dict) -> dict:
+    """Send a command and wait for its reply, skipping the pipeline's events."""
+    await socket.send_json(message)
+    while True:
+        reply = (await socket.receive(timeout=5)).json()
+        if reply.get("id") == message["id"]:
+            return reply
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        {"op": "update", "task": 0, "updates": "x"},
+        {"op": "update", "task": 0, "updates": ["source", 1]},
+        {"op": "update", "task": 9, "updates": {}},
+        {"op": "batch", "operations": "x"},
+        {"op": "batch", "operations": [{"op": "delete"}]},
+        {"op": "create", "type": "NoSuchTask"},
+        {"op": "subscribe", "task": 1, "window": 0},
+        {"op": "credit", "subscription": [1], "frames": 1},
+        {"op": "explode"},
+    ],
+)
+async def test_socket_answers_malformed_commands(client, message):
+    async with client.ws_connect("/ws") as socket:
+        reply = await command(socket, {"id": "bad", **message})
+        assert reply["error"]
+
+        # The connection is still open
+        reply = await command(socket, {"id": "good", "op": "batch", "operations": []})
+        assert reply == {"id": "good", "tasks": []}
+
+
+async def test_socket_answers_invalid_json(client):
+    async with client.ws_connect("/ws") as socket:
+        await socket.send_str("{")
+        while "eventId" in (reply := (await socket.receive(timeout=5)).json()):
+            pass
+        assert reply["error"]
+        reply = await command(socket, {"id": "good", "op": "batch", "operations": []})
+        assert reply == {"id": "good", "tasks": []}
+
+
+async def test_socket_credit_for_finished_subscription(client):
+    await wait_until_complete(client, 1)
+    async with client.ws_connect("/ws") as socket:
+        reply = await command(socket, {"op": "subscribe", "id": "s", "task": 1})
+        number = reply["subscription"]
+        while True:
+            message = await socket.receive(timeout=5)
+            if isinstance(message.data, str):
+                end = message.json()
+                if end.get("subscription") == number and "event" in end:
+                    break
+
+        for op in ("credit", "unsubscribe"):
+            reply = await command(
+                socket, {"op": op, "id": op, "subscription": number, "frames": 1}
+            )
+            assert reply["error"] == f"Subscription {number} is not active"
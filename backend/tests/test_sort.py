@@ -0,0 +1,146 @@
+"""Tests for ExternalSort and TopK, which are checked against sorting every row
+at once with sort_indices."""
+
+import numpy
+import pyarrow
+import pyarrow.compute
+import pytest
+
+from somedaex.pipeline.task import sort
+from somedaex.pipeline.task.sort import ExternalSort, TopK
+
+
+SCHEMA = pyarrow.schema(
+    [("key", pyarrow.int64()), ("name", pyarrow.string()), ("row", pyarrow.int64())]
+)
+
+
+def make_batches(num_batches=20, rows_per_batch=50, seed=0):
+    """Make batches with many tied keys and some null keys."""
+    rng = numpy.random.default_rng(seed)
+    batches = []
+    for number in range(num_batches):
+        keys = rng.integers(0, 10, rows_per_batch)
+        nulls = rng.random(rows_per_batch) < 0.1
+        rows = numpy.arange(rows_per_batch) + number * rows_per_batch
+        batches.append(
+            pyarrow.RecordBatch.from_arrays(
+                [
+                    pyarrow.array(keys, mask=nulls),
+                    pyarrow.array([f"n{key % 3}" for key in keys]),
+                    pyarrow.array(rows),
+                ],
+                schema=SCHEMA,
+            )
+        )
+    return batches
+
+
+def expected(batches, sort_keys):
+    table = pyarrow.Table.from_batches(batches, schema=SCHEMA)
+    return table.take(pyarrow.compute.sort_indices(table, sort_keys=sort_keys))
+
+
+def check(result: pyarrow.Table, batches, sort_keys):
+    """Check that the result holds every row in the same order as sort_indices,
+    which is stable, so rows with tied keys keep the order they were added in."""
+    reference = expected(batches, sort_keys)
+    assert result.num_rows == reference.num_rows
+    for name, _ in sort_keys:
+        assert result.column(name).to_pylist() == reference.column(name).to_pylist()
+    assert result.column("row").to_pylist() == reference.column("row").to_pylist()
+
+
+def external_sort(batches, sort_keys, tmp_path, memory_budget):
+    sort = ExternalSort(SCHEMA, sort_keys, tmp_path / "spill", memory_budget)
+    try:
+        for batch in batches:
+            sort.add(batch)
+        result = pyarrow.Table.from_batches(list(sort.results()), schema=SCHEMA)
+        return result, sort.stats()
+    finally:
+        sort.close()
+
+
+SORT_KEYS = [
+    [("key", "ascending")],
+    [("key", "descending")],
+    [("key", "descending"), ("name", "ascending")],
+    [("name", "ascending"), ("key", "descending")],
+]
+
+
+@pytest.mark.parametrize("sort_keys", SORT_KEYS)
+def test_external_sort_in_memory(sort_keys, tmp_path):
+    batches = make_batches()
+    result, stats = external_sort(batches, sort_keys, tmp_path, 1024 ** 3)
+    assert stats["runs"] == 0
+    check(result, batches, sort_keys)
+
+
+@pytest.mark.parametrize("sort_keys", SORT_KEYS)
+def test_external_sort_merges_runs(sort_keys, tmp_path):
+    batches = make_batches()
+    # A tiny budget writes a run for every batch
+    result, stats = external_sort(batches, sort_keys, tmp_path, 1)
+    assert stats["runs"] == len(batches)
+    check(result, batches, sort_keys)
+
+
+def test_external_sort_runs_of_different_lengths(tmp_path):
+    batches = make_batches(num_batches=5, rows_per_batch=1, seed=1)
+    batches += make_batches(num_batches=3, rows_per_batch=200, seed=2)
+    sort_keys = [("key", "ascending")]
+    result, stats = external_sort(batches, sort_keys, tmp_path, 1)
+    assert stats["runs"] == len(batches)
+    check(result, batches, sort_keys)
+
+
+def test_external_sort_all_ties(tmp_path):
+    batches = [
+        pyarrow.RecordBatch.from_arrays(
+            [
+                pyarrow.array([7] * 10),
+                pyarrow.array(["a"] * 10),
+                pyarrow.array(range(number * 10, number * 10 + 10)),
+            ],
+            schema=SCHEMA,
+        )
+        for number in range(4)
+    ]
+    sort_keys = [("key", "descending")]
+    result, _ = external_sort(batches, sort_keys, tmp_path, 1)
+    check(result, batches, sort_keys)
+
+
+def test_external_sort_merges_runs_in_chunks(monkeypatch, tmp_path):
+    # Reading each run in several chunks holds rows over between rounds of the
+    # merge, which must still come out after any tied rows added before them
+    monkeypatch.setattr(sort, "MAX_BATCH_ROWS", 7)
+    batches = make_batches()
+    sort_keys = [("key", "ascending")]
+    result, stats = external_sort(batches, sort_keys, tmp_path, 1)
+    assert stats["runs"] == len(batches)
+    check(result, batches, sort_keys)
+
+
+def test_external_sort_no_rows(tmp_path):
+    result, _ = external_sort([], [("key", "ascending")], tmp_path, 1)
+    assert result.num_rows == 0
+
+
+@pytest.mark.parametrize("sort_keys", SORT_KEYS)
+@pytest.mark.parametrize("k", [1, 7, 50, 2000])
+def test_top_k(sort_keys, k):
+    batches = make_batches()
+    top = TopK(SCHEMA, sort_keys, k)
+    for batch in batches:
+        top.add(batch)
+        assert top.preview(k).num_rows <= k
+    result = pyarrow.Table.from_batches(list(top.results()), schema=SCHEMA)
+
+    reference = expected(batches, sort_keys).slice(0, k)
+    assert result.num_rows == reference.num_rows
+    for name, _ in sort_keys:
+        assert result.column(name).to_pylist() == reference.column(name).to_pylist()
+    assert result.column("row").to_pylist() == reference.column("row").to_pylist()